@@ -1,14 +1,50 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import gc
 import os
 
 # 導入模組化路由
-from routers import notes, tags, files, share
-from common import Config, init_db, logger
+from routers import notes, tags, files, share, uploads, jobs, admin
+import common
+from common import Config, logger, db, blob_storage, file_cache, share_cache, tag_dictionary, cache_sync, initialize
+from middleware import MaxBodySizeMiddleware, MetricsMiddleware, ProfilingMiddleware
+from jobs import job_queue
+import thumbnails
+import sendfile_protocol
+import metrics
+from profiling import profiler
+from slow_query import slow_query_log
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    應用程式生命週期：啟動時完成初始化（日誌、資料庫遷移）、建立資料庫連線池、在背景建立標籤對照表並啟動背景工作者
+    與快取失效通知，關閉時停止背景工作者與縮圖行程池並釋放連線（資料庫與物件儲存）
+    """
+    # 匯入時不做 I/O；serve.py 已在主程序完成時直接返回
+    initialize()
+    await db.open()
+    # 標籤對照表與自動完成索引（含拼音字典）在背景建立，不延後第一個請求；建立完成前自動完成直接查詢資料庫
+    loading = tag_dictionary.start_loading(db)
+    # 接收其他工作程序的快取失效通知
+    await cache_sync.start()
+    # 啟動時建立的物件（模組、拼音字典、標籤索引）會一直存在，
+    # 移出垃圾回收的追蹤範圍，避免每次完整回收都重新掃描而造成數毫秒的停頓；標籤索引建立完成後再執行一次
+    gc.freeze()
+    loading.add_done_callback(lambda _: gc.freeze())
+    # 重新啟動前未完成的工作也會被取出執行
+    await job_queue.start()
+    yield
+    await tag_dictionary.stop()
+    await cache_sync.stop()
+    await job_queue.stop()
+    thumbnails.shutdown()
+    blob_storage.close()
+    await db.close()
 
 # 建立主應用程式
 app = FastAPI(
@@ -16,13 +52,18 @@ app = FastAPI(
     description="一個支援多媒體檔案上傳和 Markdown 格式的日記本系統",
     version=Config.API_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
-# 初始化資料庫
-init_db()
+# 限制請求內容大小，上傳過大的檔案在接收途中就會被拒絕；批次匯入以串流處理，另有自己的上限
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_body_size=Config.MAX_CONTENT_LENGTH + Config.MAX_REQUEST_OVERHEAD,
+    path_limits={"/notes/bulk/": Config.BULK_MAX_CONTENT_LENGTH},
+)
 
-# 添加CORS中間件
+# 添加CORS中間件（最後加入的中間件在最外層，錯誤回應也會帶有 CORS 標頭）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,12 +72,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 對一部分請求做 CPU 取樣（Config.PROFILER_SAMPLE_RATE，預設停用；見 /admin/profiler）
+app.add_middleware(ProfilingMiddleware)
+
+# 每個請求的延遲、狀態碼與傳輸量（見 /metrics），放在最外層以包含其他中間件的時間
+app.add_middleware(MetricsMiddleware)
+
 # 建立靜態文件目錄
 os.makedirs("static", exist_ok=True)
 
-# 設置模板引擎 - 將模板目錄更新為 static/templates
-templates = Jinja2Templates(directory="static/templates")
-
 # 掛載靜態文件
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -45,6 +89,16 @@ app.include_router(notes.router)
 app.include_router(tags.router)
 app.include_router(files.router)
 app.include_router(share.router)
+app.include_router(uploads.router)
+app.include_router(jobs.router)
+app.include_router(admin.router)
+
+# 模板引擎（jinja2）只有首頁使用，第一次請求時才載入，縮短啟動時間
+@lru_cache(maxsize=None)
+def get_templates():
+    from fastapi.templating import Jinja2Templates
+    # 模板目錄為 static/templates
+    return Jinja2Templates(directory="static/templates")
 
 # 根路由導向前端
 @app.get("/", response_class=HTMLResponse)
@@ -52,7 +106,7 @@ async def serve_html(request: Request):
     """
     返回前端HTML界面
     """
-    return templates.TemplateResponse("index.html", {"request": request})
+    return get_templates().TemplateResponse(request, "index.html")
 
 # 健康檢查
 @app.get("/health")
@@ -65,6 +119,91 @@ async def health_check():
         "version": Config.API_VERSION
     }
 
+# 中繼資料快取統計
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    檔案與分享連結快取的命中與未命中次數、縮圖快取的大小、儲存後端（S3 時含本機讀取快取）的統計，
+    目前程序以 sendfile 傳送檔案的統計，日誌佇列中尚未寫入與因佇列已滿而丟棄的記錄數，
+    以及跨程序快取失效通知的收發次數（多個工作程序時，統計只屬於處理這個請求的程序，見 `pid`）
+    """
+    return {
+        "files": file_cache.stats(),
+        "shares": share_cache.stats(),
+        "sync": cache_sync.stats(),
+        "thumbnails": thumbnails.derivative_cache.stats(),
+        "storage": blob_storage.stats(),
+        "serving": {"mode": Config.FILE_SERVE_MODE, **sendfile_protocol.stats()},
+        "logging": common.log_handler.stats(),
+        "database": db.stats(),
+    }
+
+@metrics.REGISTRY.collector
+async def component_metrics() -> list:
+    """抓取時把快取、資料庫連線池、背景工作、儲存後端、sendfile、日誌與效能診斷的統計轉成指標"""
+    pool = db.stats()
+    caches = {"files": file_cache.stats(), "shares": share_cache.stats()}
+    derivatives = thumbnails.derivative_cache.stats()
+    job_stats = await job_queue.stats()
+    storage = blob_storage.stats()
+    backend = {"backend": storage["backend"]}
+    serving = sendfile_protocol.stats()
+    logging_stats = common.log_handler.stats()
+    sync = cache_sync.stats()
+    return [
+        ("db_pool_size", "gauge", "唯讀連線池的連線數", [({}, pool["pool_size"])]),
+        ("db_pool_readers_in_use", "gauge", "借出中的唯讀連線數", [({}, pool["readers_in_use"])]),
+        ("db_pool_reader_waiters", "gauge", "等待唯讀連線的請求數（連線池滿載）", [({}, pool["reader_waiters"])]),
+        ("db_writer_busy", "gauge", "寫入連線是否正在交易中", [({}, pool["writer_busy"])]),
+        ("db_writer_waiters", "gauge", "等待寫入鎖的請求數", [({}, pool["writer_waiters"])]),
+        ("metadata_cache_entries", "gauge", "中繼資料快取的項目數",
+         [({"cache": name}, cache["size"]) for name, cache in caches.items()]),
+        ("metadata_cache_hits_total", "counter", "中繼資料快取命中次數",
+         [({"cache": name}, cache["hits"]) for name, cache in caches.items()]),
+        ("metadata_cache_misses_total", "counter", "中繼資料快取未命中次數",
+         [({"cache": name}, cache["misses"]) for name, cache in caches.items()]),
+        ("cache_sync_events_total", "counter", "本程序送出與套用的快取失效通知數",
+         [({"direction": "published"}, sync["published"]), ({"direction": "received"}, sync["received"])]),
+        ("thumbnail_cache_bytes", "gauge", "縮圖資料夾的大小", [({}, derivatives["bytes"])]),
+        ("thumbnail_cache_evicted_total", "counter", "逐出的縮圖數", [({}, derivatives["evicted"])]),
+        ("thumbnail_renders_in_flight", "gauge", "進行中的縮圖工作數", [({}, derivatives["in_flight"])]),
+        ("jobs_depth", "gauge", "各狀態與種類的背景工作數", [
+            ({"status": status, "kind": kind}, count)
+            for status, depth in job_stats["depth"].items() for kind, count in depth["by_kind"].items()]),
+        ("jobs_oldest_queued_seconds", "gauge", "可執行但尚未開始的工作中等待最久的秒數",
+         [({}, job_stats["oldest_queued_s"] or 0)]),
+        ("jobs_active", "gauge", "執行中的背景工作數", [({}, job_stats["active"])]),
+        ("jobs_processed_total", "counter", "本程序完成、失敗與重試的工作次數",
+         [({"outcome": outcome}, count) for outcome, count in job_stats["processed"].items()]),
+        ("storage_cache_bytes", "gauge", "物件儲存的本機讀取快取大小", [(backend, storage.get("cache_bytes"))]),
+        ("storage_cache_hits_total", "counter", "物件儲存的本機讀取快取命中次數",
+         [(backend, storage.get("cache_hits"))]),
+        ("storage_cache_misses_total", "counter", "物件儲存的本機讀取快取未命中次數",
+         [(backend, storage.get("cache_misses"))]),
+        ("storage_uploaded_bytes_total", "counter", "上傳到物件儲存的位元組數", [(backend, storage.get("uploaded_bytes"))]),
+        ("storage_downloaded_bytes_total", "counter", "從物件儲存下載的位元組數",
+         [(backend, storage.get("downloaded_bytes"))]),
+        ("sendfile_responses_total", "counter", "以 os.sendfile 傳送的回應數", [({}, serving["sendfile_responses"])]),
+        ("sendfile_bytes_total", "counter", "以 sendfile 傳送的位元組數", [({}, serving["sendfile_bytes"])]),
+        ("sendfile_fallback_responses_total", "counter", "sendfile 無法使用而改由事件迴圈讀寫的回應數",
+         [({}, serving["fallback_responses"])]),
+        ("sendfile_unsupported_requests_total", "counter", "連線不支援 sendfile 的請求數",
+         [({}, serving["unsupported_requests"])]),
+        ("log_queue_records", "gauge", "日誌佇列中尚未寫入的記錄數", [({}, logging_stats["queued"])]),
+        ("log_records_dropped_total", "counter", "日誌佇列已滿而丟棄的記錄數", [({}, logging_stats["dropped"])]),
+        ("slow_queries_total", "counter", "超過 SLOW_QUERY_MS 的 SQL 語句數", [({}, slow_query_log.count)]),
+        ("profiler_samples_total", "counter", "CPU 取樣數", [({}, profiler.samples)]),
+    ]
+
+# Prometheus 指標
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Prometheus 文字格式的指標：每個路由的延遲分佈、狀態碼與傳輸量、資料庫連線的等待與使用時間，
+    以及各元件的統計（每個程序各自計算）
+    """
+    return Response(await metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # 啟動指令
 if __name__ == "__main__":
     import uvicorn
@@ -73,5 +212,8 @@ if __name__ == "__main__":
         host="0.0.0.0", 
         port=8000, 
         reload=True,
+        # 以 os.sendfile 傳送檔案（需要 asyncio 事件迴圈，uvloop 沒有 loop.sendfile）
+        http="sendfile_protocol:SendfileProtocol",
+        loop="asyncio",
         log_level="info"
     )
\ No newline at end of file
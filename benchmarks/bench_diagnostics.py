@@ -0,0 +1,139 @@
+"""
+CPU 取樣與慢查詢記錄的成本
+
+- middleware：ProfilingMiddleware 停用時（sample_rate 為 0）每個請求多出的時間
+- statement：TimedConnection 執行一個簡單查詢（execute + fetchone）的時間，與一般 sqlite3 連線比較，
+  分為停用與啟用（門檻高到不會記錄）兩種
+- endpoints：在暫存目錄以 ASGI 直接呼叫 /notes/all/ 與 /tags/{id}/notes/ 的延遲中位數，
+  比較全部停用、只啟用慢查詢記錄、對 10% 與全部請求做 CPU 取樣
+
+結果以微秒表示（JSON）：
+
+    python benchmarks/bench_diagnostics.py --notes 500 --requests 200
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_metrics import bare_app, make_scope, receive, send  # noqa: E402
+
+
+async def time_app(app, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app(make_scope(), receive, send)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_middleware(args) -> dict:
+    from middleware import ProfilingMiddleware
+
+    apps = {"bare": bare_app, "profiling_disabled": ProfilingMiddleware(bare_app)}
+    samples = {name: [] for name in apps}
+    loop = asyncio.new_event_loop()
+    try:
+        for _ in range(10):
+            for name, app in apps.items():
+                samples[name].append(loop.run_until_complete(time_app(app, args.iterations // 10)))
+    finally:
+        loop.close()
+    bare, disabled = (statistics.median(samples[name]) for name in apps)
+    return {"bare_us": round(bare, 3), "profiling_disabled_us": round(disabled, 3),
+            "overhead_us": round(disabled - bare, 3)}
+
+
+def bench_statement(args) -> dict:
+    from slow_query import TimedConnection, slow_query_log
+
+    def measure(factory) -> float:
+        conn = sqlite3.connect(":memory:", factory=factory)
+        conn.execute("CREATE TABLE t (a INTEGER PRIMARY KEY, b TEXT)")
+        conn.executemany("INSERT INTO t VALUES (?, ?)", [(index, "x") for index in range(100)])
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            for index in range(args.iterations // 5):
+                conn.execute("SELECT b FROM t WHERE a = ?", (index % 100,)).fetchone()
+            best = min(best, (time.perf_counter() - start) / (args.iterations // 5) * 1e6)
+        conn.close()
+        return best
+
+    plain = measure(sqlite3.Connection)
+    slow_query_log.configure(None)
+    disabled = measure(TimedConnection)
+    slow_query_log.configure(60 * 1000)
+    enabled = measure(TimedConnection)
+    slow_query_log.configure(None)
+    return {"sqlite3_us": round(plain, 3), "timed_disabled_us": round(disabled, 3),
+            "timed_enabled_us": round(enabled, 3)}
+
+
+async def bench_endpoints(args) -> dict:
+    from app import app
+    from profiling import profiler
+    from slow_query import slow_query_log
+
+    settings = {
+        "disabled": (None, 0.0),
+        "slow_query_log": (1000, 0.0),
+        "profiler_10pct": (None, 0.1),
+        "profiler_all": (None, 1.0),
+    }
+    endpoints = {"notes_all": "/notes/all/?limit=50", "tag_notes": "/tags/1/notes/?limit=50"}
+    latencies = {(setting, name): [] for setting in settings for name in endpoints}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for index in range(args.notes):
+                content = base64.b64encode((f"# 標題 {index}\n\n" + "內容 " * 200).encode()).decode()
+                response = await client.post("/notes/create/", json={"content": content,
+                                                                       "tags": ["bench", f"tag{index % 10}"]})
+                response.raise_for_status()
+            for url in endpoints.values():
+                (await client.get(url)).raise_for_status()
+
+            # 交替執行各種設定，減少其他因素隨時間變化的影響
+            block = 20
+            for _ in range(max(1, args.requests // block)):
+                for setting, (threshold_ms, sample_rate) in settings.items():
+                    slow_query_log.configure(threshold_ms)
+                    profiler.configure(sample_rate)
+                    for name, url in endpoints.items():
+                        for _ in range(block):
+                            start = time.perf_counter()
+                            await client.get(url)
+                            latencies[(setting, name)].append(time.perf_counter() - start)
+            slow_query_log.configure(None)
+            profiler.configure(0.0)
+
+    return {name: {setting: round(statistics.median(latencies[(setting, name)]) * 1e6, 1) for setting in settings}
+            for name in endpoints}
+
+
+def main(args):
+    results = {"middleware": bench_middleware(args), "statement": bench_statement(args)}
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", os.path.join(workdir, "static"))
+    results["endpoints_p50_us"] = asyncio.run(bench_endpoints(args))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000, help="中間件與單一語句量測的次數")
+    parser.add_argument("--notes", type=int, default=500, help="預先建立的文章數")
+    parser.add_argument("--requests", type=int, default=200, help="每種設定、每個端點的請求數")
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
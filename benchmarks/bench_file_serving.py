@@ -0,0 +1,242 @@
+"""
+檔案下載的傳送方式基準測試
+
+在暫存目錄啟動 uvicorn 並經由上傳 API 存入約 1GB 的混合媒體（影片、音訊、JPEG 圖片、文件），
+再以不同方式各啟動一次伺服器，用 curl 同時下載全部檔案數輪：
+
+- stream：uvicorn 預設的 protocol，FileResponse 每次讀取 64KB 再寫入 socket
+- sendfile：`--http sendfile_protocol:SendfileProtocol`，內容以 os.sendfile 從檔案直接送到 socket
+- x-accel-redirect：應用程式只回應 X-Accel-Redirect 標頭（這裡沒有 nginx，量測的是應用程式這一側的成本）
+
+回報每種方式的吞吐量、伺服器程序的 CPU 時間（/proc/<pid>/stat），
+以及伺服器的 read 系統呼叫次數與 /cache/stats 的 sendfile 統計，用來確認內容確實經由 sendfile 傳送（JSON）：
+
+    python benchmarks/bench_file_serving.py --clients 8 --passes 3
+
+需要 curl（7.66 以上，支援 --parallel），以及 httpx、uvicorn、Pillow。
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_upload_streaming import REPO_ROOT, free_port, make_payload, wait_ready  # noqa: E402
+
+# (類型, 副檔名, 檔案數, 每個檔案的大小 KB)：合計約 1GB
+MEDIA_MIX = [
+    ("video", "mp4", 8, 80 * 1024),
+    ("audio", "mp3", 40, 6 * 1024),
+    ("image", "jpg", 250, 400),
+    ("document", "pdf", 200, 200),
+]
+MODES = {
+    "stream": {"http": "auto", "mode": "sendfile"},
+    "sendfile": {"http": "sendfile_protocol:SendfileProtocol", "mode": "sendfile"},
+    "x-accel-redirect": {"http": "sendfile_protocol:SendfileProtocol", "mode": "x-accel-redirect"},
+}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def make_jpeg(path: str, size_kb: int):
+    """產生接近指定大小的 JPEG（隨機雜訊幾乎無法壓縮），讓背景縮圖工作可以成功完成"""
+    from PIL import Image
+
+    side = int((size_kb * 1024 / 1.5) ** 0.5)
+    noise = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    noise.save(buffer, "JPEG", quality=90)
+    with open(path, "wb") as out:
+        out.write(buffer.getvalue())
+
+
+def make_media(directory: str, scale: float) -> list:
+    """建立測試檔，回傳 [(路徑, 上傳檔名, MIME 類型)]"""
+    mime_types = {"mp4": "video/mp4", "mp3": "audio/mpeg", "jpg": "image/jpeg", "pdf": "application/pdf"}
+    files = []
+    for file_type, extension, count, size_kb in MEDIA_MIX:
+        for index in range(max(1, int(count * scale))):
+            path = os.path.join(directory, f"{file_type}{index}.{extension}")
+            if file_type == "image":
+                make_jpeg(path, size_kb)
+            elif size_kb >= 1024:
+                make_payload(path, size_kb // 1024)
+            else:
+                with open(path, "wb") as out:
+                    out.write(os.urandom(size_kb * 1024))
+            files.append((path, os.path.basename(path), mime_types[extension]))
+    return files
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime 與 stime 是第 14、15 個欄位（去掉前兩個欄位後的索引 11、12）
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_syscalls(pid: int) -> int:
+    with open(f"/proc/{pid}/io") as io_stats:
+        for line in io_stats:
+            if line.startswith("syscr:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(workdir: str, port: int, mode: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    return subprocess.Popen([sys.executable, __file__, "--serve", mode, "--port", str(port)], cwd=workdir, env=env)
+
+
+def serve(mode: str, port: int):
+    """在目前的工作目錄以指定的傳送方式啟動伺服器（由基準測試在子程序中呼叫）"""
+    import uvicorn
+
+    from common import Config
+
+    Config.FILE_SERVE_MODE = MODES[mode]["mode"]
+    uvicorn.run("app:app", port=port, log_level="warning", loop="asyncio", http=MODES[mode]["http"])
+
+
+async def seed(base_url: str, files: list) -> list:
+    """上傳測試檔並等待縮圖等背景工作完成，回傳下載網址"""
+    urls = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600)) as client:
+        await wait_ready(client)
+        for path, name, mime_type in files:
+            with open(path, "rb") as data:
+                response = await client.post("/files/upload/", files={"file": (name, data, mime_type)})
+            response.raise_for_status()
+            urls.append(f"{base_url}/files/download/{response.json()['filename']}")
+        while True:
+            depth = (await client.get("/jobs/stats")).json()["depth"]
+            if depth["queued"]["total"] + depth["running"]["total"] == 0:
+                return urls
+            await asyncio.sleep(0.5)
+
+
+async def wait_until_ready(base_url: str):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        await wait_ready(client)
+
+
+def download_all(urls: list, clients: int, config_path: str) -> tuple:
+    """
+    以 curl 同時下載全部網址
+
+    Returns:
+        (耗時秒數, 下載的位元組數)
+    """
+    with open(config_path, "w") as config:
+        for url in urls:
+            config.write(f'url = "{url}"\noutput = "/dev/null"\n')
+    start = time.perf_counter()
+    result = subprocess.run(["curl", "-sS", "--fail", "-Z", "--parallel-max", str(clients), "-K", config_path,
+                             "-w", "%{size_download}\n"], capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(int(line) for line in result.stdout.split())
+
+
+def measure(workdir: str, mode: str, urls: list, args) -> dict:
+    port = free_port()
+    server = start_server(workdir, port, mode)
+    base_url = f"http://127.0.0.1:{port}"
+    urls = [url.replace(url.split("/files/")[0], base_url) for url in urls]
+    config_path = os.path.join(workdir, "curl.cfg")
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        sample = httpx.get(urls[0])
+        download_all(urls, args.clients, config_path)  # 暖機（page cache 與連線）
+        serving_before = httpx.get(f"{base_url}/cache/stats").json()["serving"]
+        passes = []
+        for _ in range(args.passes):
+            cpu_before, reads_before = cpu_seconds(server.pid), read_syscalls(server.pid)
+            elapsed, received = download_all(urls, args.clients, config_path)
+            passes.append({
+                "seconds": elapsed,
+                "bytes": received,
+                "server_cpu_s": cpu_seconds(server.pid) - cpu_before,
+                "read_syscalls": read_syscalls(server.pid) - reads_before,
+            })
+        serving_after = httpx.get(f"{base_url}/cache/stats").json()["serving"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    seconds = statistics.median(item["seconds"] for item in passes)
+    cpu = statistics.median(item["server_cpu_s"] for item in passes)
+    result = {
+        "requests_per_pass": len(urls),
+        "seconds_per_pass": round(seconds, 2),
+        "requests_per_s": round(len(urls) / seconds, 1),
+        "server_cpu_s_per_pass": round(cpu, 2),
+        "server_cpu_ms_per_request": round(cpu * 1000 / len(urls), 3),
+        "read_syscalls_per_pass": int(statistics.median(item["read_syscalls"] for item in passes)),
+        # 量測期間伺服器的 sendfile 統計
+        "serving_stats": {key: value - serving_before[key] for key, value in serving_after.items() if key != "mode"},
+    }
+    if mode == "x-accel-redirect":
+        result["x_accel_redirect"] = sample.headers.get("x-accel-redirect")
+    else:
+        megabytes = statistics.median(item["bytes"] for item in passes) / 1024 / 1024
+        result.update({
+            "mb_per_pass": round(megabytes, 1),
+            "mb_per_s": round(megabytes / seconds, 1),
+            "server_cpu_s_per_gb": round(cpu / megabytes * 1024, 2),
+            # 經由 sendfile 傳送的位元組比例
+            "sendfile_share": round(result["serving_stats"]["sendfile_bytes"] / sum(item["bytes"] for item in passes),
+                                    3),
+        })
+    return result
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    try:
+        os.symlink(REPO_ROOT / "static", os.path.join(workdir, "static"))
+        media_dir = os.path.join(workdir, "media")
+        os.makedirs(media_dir)
+        files = make_media(media_dir, args.scale)
+        total_mb = sum(os.path.getsize(path) for path, _, _ in files) / 1024 / 1024
+
+        port = free_port()
+        server = start_server(workdir, port, "sendfile")
+        try:
+            urls = asyncio.run(seed(f"http://127.0.0.1:{port}", files))
+        finally:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(media_dir)
+
+        results = {"files": len(files), "total_mb": round(total_mb, 1), "clients": args.clients,
+                   "passes": args.passes}
+        for mode in args.modes:
+            results[mode] = measure(workdir, mode, urls, args)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8, help="同時下載的連線數")
+    parser.add_argument("--passes", type=int, default=3, help="量測的輪數（另有一輪暖機），結果取中位數")
+    parser.add_argument("--scale", type=float, default=1.0, help="檔案數的倍率（1.0 約 1GB）")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--serve", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.serve:
+        serve(arguments.serve, arguments.port)
+    else:
+        print(json.dumps(main(arguments), ensure_ascii=False, indent=2))
@@ -0,0 +1,125 @@
+"""
+背景工作佇列基準測試
+
+在暫存目錄中啟動應用程式（含背景工作者），以不做事的處理函式量測佇列本身的成本：
+
+- enqueue：在寫入交易中加入一個工作的延遲
+- pickup：加入工作到處理函式開始執行的延遲（工作者由 notify 喚醒）
+- throughput：一次加入大量工作後，全部完成的速度（每個工作是兩個寫入交易：取出、完成）
+- stats：jobs 資料表已有大量完成記錄時，`GET /jobs/stats` 的延遲
+
+輸出 JSON：
+
+    python benchmarks/bench_job_queue.py --jobs 2000 --history 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed_history(path: str, count: int):
+    """已完成的工作記錄（佇列長時間運作後的狀態）"""
+    now = time.time()
+    conn = sqlite3.connect(path)
+    conn.executemany("""
+        INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_after, created_at, started_at,
+                          finished_at)
+        VALUES ('image_derivatives', '{}', 'succeeded', 1, 5, ?, ?, ?, ?)
+    """, [(now - index, now - index, now - index, now - index + 0.2) for index in range(count, 0, -1)])
+    conn.commit()
+    conn.close()
+
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    sys.path.insert(0, str(REPO_ROOT))
+    from common import Config, init_db
+    init_db()
+    seed_history(Config.DB_PATH, args.history)
+    from app import app
+    from common import db
+    import jobs
+
+    started = {}
+
+    @jobs.job_handler("bench_noop")
+    async def noop(database, payload):
+        started[payload["n"]] = time.perf_counter()
+
+    async def drain():
+        while True:
+            depth = (await jobs.job_queue.stats())["depth"]
+            if depth["queued"]["total"] == 0 and depth["running"]["total"] == 0:
+                return
+            await asyncio.sleep(0.01)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # 逐一加入，每次等處理函式開始後再加入下一個
+            enqueue_latencies = []
+            pickup_latencies = []
+            for n in range(args.rounds):
+                start = time.perf_counter()
+                async with db.writer() as conn:
+                    await jobs.enqueue(conn, "bench_noop", {"n": n})
+                committed = time.perf_counter()
+                enqueue_latencies.append(committed - start)
+                while n not in started:
+                    await asyncio.sleep(0)
+                pickup_latencies.append(started[n] - committed)
+            await drain()
+
+            # 一次加入大量工作
+            start = time.perf_counter()
+            async with db.writer() as conn:
+                for n in range(args.rounds, args.rounds + args.jobs):
+                    await jobs.enqueue(conn, "bench_noop", {"n": n})
+            await drain()
+            drain_seconds = time.perf_counter() - start
+
+            stats_latencies = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                response = await client.get("/jobs/stats")
+                stats_latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+    return {
+        "workers": Config.JOB_WORKERS,
+        "history_rows": args.history,
+        "enqueue": summarize(enqueue_latencies),
+        "pickup": summarize(pickup_latencies),
+        "throughput": {"jobs": args.jobs, "seconds": round(drain_seconds, 2),
+                       "jobs_per_s": round(args.jobs / drain_seconds)},
+        "stats_endpoint": summarize(stats_latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=200)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
@@ -0,0 +1,167 @@
+"""
+日誌對請求延遲的影響
+
+在暫存目錄以 ASGI 直接呼叫應用程式（不經過網路），對常用的端點交替執行兩種情況：
+
+- logging：依 Config 的日誌設定
+- disabled：logging.disable(CRITICAL)，日誌呼叫立即返回（f-string 參數仍會先被格式化）
+
+兩者的延遲差即為每個請求花在日誌上的時間，另回報每個請求寫入的日誌行數，
+以及呼叫端每次 logger.info 的成本。
+`--write-delay-ms` 讓每次寫入日誌檔多等待指定的毫秒數，模擬磁碟忙碌或網路檔案系統，
+同步寫入時這段時間會卡住事件迴圈。
+
+以 `--repo` 指定其他 checkout（例如 `git worktree add /tmp/before HEAD~1`）即可比較修改前後（JSON）：
+
+    python benchmarks/bench_logging.py --requests 300
+    python benchmarks/bench_logging.py --repo /tmp/before --requests 300 --write-delay-ms 1
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def p50_us(latencies: list) -> float:
+    return round(statistics.median(latencies) * 1e6, 1)
+
+
+def count_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as log_file:
+        return sum(1 for _ in log_file)
+
+
+async def drain_logs(common):
+    """等待背景執行緒寫完佇列中的記錄（同步寫入的版本不需要）"""
+    handler = getattr(common, "log_handler", None)
+    while handler is not None and handler.queue.qsize():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+
+
+async def run(args, app, common) -> dict:
+    counter = 0
+
+    def unique_payload() -> bytes:
+        nonlocal counter
+        counter += 1
+        return f"bench {counter} {time.time_ns()}".encode() * 20
+
+    note_content = base64.b64encode("# 標題\n\n內容".encode()).decode()
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for _ in range(args.files):
+                response = await client.post("/files/upload/", files={"file": ("seed.txt", unique_payload())})
+                response.raise_for_status()
+            filename = response.json()["filename"]
+            response = await client.post("/notes/create/", json={"content": note_content, "tags": ["bench"]})
+            note_id = response.json()["note_id"]
+
+            endpoints = {
+                "upload": lambda: client.post("/files/upload/", files={"file": ("b.txt", unique_payload())}),
+                "download": lambda: client.get(f"/files/download/{filename}"),
+                "list_files": lambda: client.get("/files/all/"),
+                "create_note": lambda: client.post("/notes/create/", json={"content": note_content, "tags": ["bench"]}),
+                "get_note": lambda: client.get(f"/notes/{note_id}"),
+            }
+            for request in endpoints.values():
+                (await request()).raise_for_status()
+
+            # 每個請求寫入的日誌行數
+            log_file = getattr(common.Config, "LOG_FILE", "app.log")
+            lines = {}
+            for name, request in endpoints.items():
+                await drain_logs(common)
+                before = count_lines(log_file)
+                for _ in range(50):
+                    await request()
+                await drain_logs(common)
+                after = count_lines(log_file)
+                lines[name] = round((after - before) / 50, 2)
+
+            # 交替執行兩種情況，減少其他因素隨時間變化的影響
+            latencies = {(phase, name): [] for phase in ("logging", "disabled") for name in endpoints}
+            block = 25
+            for _ in range(max(1, args.requests // block)):
+                for phase in ("logging", "disabled"):
+                    logging.disable(logging.CRITICAL if phase == "disabled" else logging.NOTSET)
+                    for name, request in endpoints.items():
+                        for _ in range(block):
+                            start = time.perf_counter()
+                            await request()
+                            latencies[(phase, name)].append(time.perf_counter() - start)
+            logging.disable(logging.NOTSET)
+
+            # 呼叫端每次記錄的成本（背景寫入時只包含放進佇列的時間）
+            bench_logger = logging.getLogger("bench")
+            per_call = []
+            for _ in range(20):
+                await drain_logs(common)
+                start = time.perf_counter()
+                for index in range(200):
+                    bench_logger.info("量測 %s: %s", index, filename)
+                per_call.append((time.perf_counter() - start) / 200)
+            await drain_logs(common)
+
+    results = {"logger_call_us": p50_us(per_call)}
+    for name in endpoints:
+        enabled, disabled = p50_us(latencies[("logging", name)]), p50_us(latencies[("disabled", name)])
+        results[name] = {
+            "p50_us": enabled,
+            "p50_us_logging_disabled": disabled,
+            "logging_overhead_us": round(enabled - disabled, 1),
+            "log_lines_per_request": lines[name],
+        }
+    return results
+
+
+def main(args):
+    repo = Path(args.repo).resolve() if args.repo else REPO_ROOT
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(repo / "static", os.path.join(workdir, "static"))
+    sys.path.insert(0, str(repo))
+
+    if args.write_delay_ms:
+        write = logging.FileHandler.emit
+
+        def slow_emit(handler, record):
+            time.sleep(args.write_delay_ms / 1000)
+            write(handler, record)
+        logging.FileHandler.emit = slow_emit
+
+    import common
+    from app import app
+
+    results = asyncio.run(run(args, app, common))
+    logger_call_us = results.pop("logger_call_us")
+    return {
+        "repo": str(repo),
+        "async_logging": hasattr(common, "log_handler"),
+        "write_delay_ms": args.write_delay_ms,
+        "requests_per_endpoint": max(1, args.requests // 25) * 25,
+        "logger_call_us": logger_call_us,
+        "endpoints": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=None, help="要量測的 checkout（預設為這個 repo）")
+    parser.add_argument("--requests", type=int, default=300, help="每個端點、每種情況的請求數")
+    parser.add_argument("--files", type=int, default=50, help="預先上傳的檔案數（影響檔案列表的大小）")
+    parser.add_argument("--write-delay-ms", type=float, default=0, help="每次寫入日誌檔額外等待的毫秒數")
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,167 @@
+"""
+指標收集的額外成本
+
+- middleware：以最簡單的 ASGI 應用程式（回應固定內容並設定 scope["route"]）量測
+  MetricsMiddleware 包住前後每個請求的時間差；另以只轉送訊息、什麼都不做的中間件（同樣包裝 send）
+  作為對照，區分多一層中間件本身與收集指標的成本
+- operations：Counter.inc、帶標籤的 Counter / Histogram 更新，以及 Database.reader() 前後計時的成本
+- render：指定路由數量時輸出 /metrics 文字的時間
+
+結果以每次的微秒數表示，各量測取多輪的中位數（JSON）：
+
+    python benchmarks/bench_metrics.py --iterations 200000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import metrics  # noqa: E402
+from middleware import MetricsMiddleware  # noqa: E402
+
+
+class _Route:
+    path = "/files/download/{filename}"
+
+
+_ROUTE = _Route()
+_START = {"type": "http.response.start", "status": 200,
+          "headers": [(b"content-type", b"application/octet-stream"), (b"content-length", b"5")]}
+_BODY = {"type": "http.response.body", "body": b"hello"}
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = _ROUTE
+    await send(_START)
+    await send(_BODY)
+
+
+class PassthroughMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        async def forward(message):
+            await send(message)
+        await self.app(scope, receive, forward)
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def make_scope() -> dict:
+    return {"type": "http", "method": "GET", "path": "/files/download/abc.jpg",
+            "headers": [(b"host", b"bench"), (b"accept", b"*/*")]}
+
+
+def best_of(rounds: int, measure) -> float:
+    """多輪量測的中位數（每次的微秒數）"""
+    return round(statistics.median(measure() for _ in range(rounds)), 3)
+
+
+async def time_app(app, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app(make_scope(), receive, send)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def time_loop(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_middleware(args) -> dict:
+    apps = {"bare": bare_app, "passthrough": PassthroughMiddleware(bare_app), "metrics": MetricsMiddleware(bare_app)}
+    samples = {name: [] for name in apps}
+    loop = asyncio.new_event_loop()
+    try:
+        for _ in range(args.rounds):
+            for name, app in apps.items():
+                samples[name].append(loop.run_until_complete(time_app(app, args.iterations // args.rounds)))
+    finally:
+        loop.close()
+    bare, passthrough, instrumented = (statistics.median(samples[name]) for name in apps)
+    return {
+        "bare_us": round(bare, 3),
+        "passthrough_middleware_us": round(passthrough, 3),
+        "with_metrics_us": round(instrumented, 3),
+        "overhead_us": round(instrumented - bare, 3),
+        # 扣除多一層中間件本身的成本
+        "metrics_only_us": round(instrumented - passthrough, 3),
+    }
+
+
+def bench_operations(args) -> dict:
+    registry = metrics.Registry()
+    counter = metrics.Counter("bench_total", "bench", registry=registry)
+    labeled_counter = metrics.Counter("bench_labeled_total", "bench", ("method", "route", "status"), registry=registry)
+    histogram = metrics.Histogram("bench_seconds", "bench", ("method", "route"), registry=registry)
+    bound = histogram.labels("GET", "/files/download/{filename}")
+    iterations = args.iterations // args.rounds
+
+    def timed_block():
+        # Database.reader() 增加的部分：兩次 perf_counter 與兩次 observe
+        start = time.perf_counter()
+        acquired = time.perf_counter()
+        bound.observe(acquired - start)
+        bound.observe(time.perf_counter() - acquired)
+
+    baseline = best_of(args.rounds, lambda: time_loop(lambda: None, iterations))
+    return {
+        "counter_inc_us": round(best_of(args.rounds, lambda: time_loop(counter.inc, iterations)) - baseline, 3),
+        "labeled_counter_inc_us": round(best_of(args.rounds, lambda: time_loop(
+            lambda: labeled_counter.labels("GET", "/files/download/{filename}", 200).inc(), iterations)) - baseline, 3),
+        "labeled_histogram_observe_us": round(best_of(args.rounds, lambda: time_loop(
+            lambda: histogram.labels("GET", "/files/download/{filename}").observe(0.0042), iterations)) - baseline,
+            3),
+        "db_timing_per_block_us": round(best_of(args.rounds, lambda: time_loop(timed_block, iterations)) - baseline, 3),
+    }
+
+
+def bench_render(args) -> dict:
+    registry = metrics.Registry()
+    histogram = metrics.Histogram("bench_seconds", "bench", ("method", "route"), registry=registry)
+    counter = metrics.Counter("bench_total", "bench", ("method", "route", "status"), registry=registry)
+    for index in range(args.routes):
+        histogram.labels("GET", f"/route/{index}").observe(0.01)
+        counter.labels("GET", f"/route/{index}", 200).inc()
+    loop = asyncio.new_event_loop()
+    try:
+        text = loop.run_until_complete(registry.render())
+        start = time.perf_counter()
+        for _ in range(20):
+            loop.run_until_complete(registry.render())
+        elapsed = (time.perf_counter() - start) / 20
+    finally:
+        loop.close()
+    return {"routes": args.routes, "lines": text.count("\n"), "bytes": len(text.encode()),
+            "render_ms": round(elapsed * 1000, 2)}
+
+
+def main(args):
+    return {
+        "iterations": args.iterations,
+        "middleware": bench_middleware(args),
+        "operations": bench_operations(args),
+        "render": bench_render(args),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000, help="每項量測的總次數")
+    parser.add_argument("--rounds", type=int, default=10, help="分成幾輪，結果取中位數")
+    parser.add_argument("--routes", type=int, default=40, help="輸出 /metrics 時的路由數")
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,137 @@
+"""
+文章批次匯入／匯出基準測試
+
+在暫存目錄啟動一個 uvicorn 伺服器，比較：
+
+- create：逐篇呼叫 `POST /notes/create/`（base64 內容，每篇一個交易）
+- bulk_import：以串流 NDJSON 呼叫 `POST /notes/bulk/`
+- bulk_export：串流讀取 `GET /notes/bulk/`
+
+回報每秒處理的文章數與伺服器峰值記憶體（VmHWM，僅限 Linux），輸出 JSON。
+以不同的 --notes 執行，可確認峰值記憶體不隨文章數增加：
+
+    python benchmarks/bench_note_bulk.py --notes 50000
+
+需要安裝 httpx 與 uvicorn。
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_upload_streaming import REPO_ROOT, free_port, peak_rss_mb, wait_ready  # noqa: E402
+
+
+def rss_mb(pid: int) -> dict:
+    """目前的匿名記憶體（Python 物件、SQLite 頁面快取）與檔案映射記憶體（mmap 的資料庫）"""
+    result = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                result[line.split(":")[0]] = round(int(line.split()[1]) / 1024, 1)
+    return result
+
+
+def make_note(rng: random.Random, index: int, note_chars: int) -> dict:
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 2500)]
+    body = "".join(rng.choice(chars) for _ in range(note_chars))
+    return {"content": f"# 日記 {index}\n\n{body}", "tags": [f"標籤{i}" for i in rng.sample(range(200), 3)]}
+
+
+async def ndjson_body(notes: int, note_chars: int, seed: int):
+    """邊產生邊送出，客戶端也不會把整份資料放進記憶體"""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(notes):
+        lines.append(json.dumps(make_note(rng, index, note_chars), ensure_ascii=False))
+        if len(lines) == 500:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def run(args, base_url: str, server_pid: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600)) as client:
+        await wait_ready(client)
+
+        rng = random.Random(args.seed + 1)
+        start = time.perf_counter()
+        for index in range(args.create_notes):
+            note = make_note(rng, index, args.note_chars)
+            response = await client.post("/notes/create/", json={
+                "content": base64.b64encode(note["content"].encode()).decode(),
+                "tags": note["tags"],
+            })
+            response.raise_for_status()
+        create_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = await client.post("/notes/bulk/", content=ndjson_body(args.notes, args.note_chars, args.seed),
+                                     headers={"Content-Type": "application/x-ndjson"})
+        response.raise_for_status()
+        import_elapsed = time.perf_counter() - start
+        imported = response.json()["imported"]
+        import_rss = peak_rss_mb(server_pid)
+        import_rss_detail = rss_mb(server_pid)
+
+        start = time.perf_counter()
+        exported = 0
+        async with client.stream("GET", "/notes/bulk/") as response:
+            async for _ in response.aiter_lines():
+                exported += 1
+        export_elapsed = time.perf_counter() - start
+
+    return {
+        "create": {
+            "notes": args.create_notes,
+            "rows_per_second": round(args.create_notes / create_elapsed, 1),
+        },
+        "bulk_import": {
+            "notes": imported,
+            "rows_per_second": round(imported / import_elapsed, 1),
+            "server_peak_rss_mb": import_rss,
+            "server_rss_mb": import_rss_detail,
+        },
+        "bulk_export": {
+            "notes": exported,
+            "rows_per_second": round(exported / export_elapsed, 1),
+            "server_peak_rss_mb": peak_rss_mb(server_pid),
+            "server_rss_mb": rss_mb(server_pid),
+        },
+    }
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        result = asyncio.run(run(args, f"http://127.0.0.1:{port}", server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+    return {"note_chars": args.note_chars, **result}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--create-notes", type=int, default=1000)
+    parser.add_argument("--note-chars", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,107 @@
+"""
+文章列表載入（hydration）基準測試
+
+比較兩種載入一頁文章與標籤的方式在不同頁面大小下的查詢次數與延遲（JSON）：
+
+- legacy: 先查詢文章，再為每篇文章各查一次標籤（N+1）
+- batched: `common.fetch_notes_page`，固定兩次查詢
+
+    python benchmarks/bench_note_hydration.py --notes 20000 --page-sizes 10 50 200 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed_database(path: str, notes: int, tags: int, tags_per_note: int):
+    """建立測試用文章與標籤資料（使用正式的資料表結構）"""
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)",
+                     [(f"標籤{i}",) for i in range(tags)])
+    conn.executemany("INSERT INTO markdown_notes (content) VALUES (?)",
+                     [(f"# 日記 {i}\n\n" + "今天天氣很好。" * 40,) for i in range(notes)])
+    conn.executemany("INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)",
+                     [(n, (n * 7 + k) % tags + 1) for n in range(1, notes + 1) for k in range(tags_per_note)])
+    conn.commit()
+    conn.close()
+
+
+async def legacy_page(conn, limit: int, offset: int):
+    """原本的 N+1 寫法，保留作為對照"""
+    cursor = await conn.execute("""
+        SELECT id, content, created_at FROM markdown_notes
+        ORDER BY created_at DESC LIMIT ? OFFSET ?
+    """, (limit, offset))
+    notes = []
+    for row in await cursor.fetchall():
+        tag_cursor = await conn.execute("""
+            SELECT t.id, t.name FROM tags t
+            JOIN note_tags nt ON t.id = nt.tag_id
+            WHERE nt.note_id = ?
+        """, (row[0],))
+        tags = [{"id": t[0], "name": t[1]} for t in await tag_cursor.fetchall()]
+        notes.append({"id": row[0], "content": row[1], "created_at": row[2], "tags": tags})
+    return notes
+
+
+async def measure(conn, loader, page_size: int, rounds: int):
+    statements = []
+    await conn.set_trace_callback(statements.append)
+    await loader(conn, page_size, 0)
+    queries = len(statements)
+    await conn.set_trace_callback(None)
+
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await loader(conn, page_size, 0)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "queries": queries,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    from common import Config, fetch_notes_page, init_db
+    init_db()  # 在暫存目錄建立資料表
+    seed_database(Config.DB_PATH, args.notes, args.tags, args.tags_per_note)
+
+    async def batched_page(conn, limit, offset):
+        notes, _ = await fetch_notes_page(conn, limit, offset)
+        return notes
+
+    results = []
+    async with aiosqlite.connect(Config.DB_PATH) as conn:
+        for page_size in args.page_sizes:
+            results.append({
+                "page_size": page_size,
+                "legacy": await measure(conn, legacy_page, page_size, args.rounds),
+                "batched": await measure(conn, batched_page, page_size, args.rounds),
+            })
+    return {"notes": args.notes, "tags_per_note": args.tags_per_note, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--tags-per-note", type=int, default=3)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--rounds", type=int, default=20)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
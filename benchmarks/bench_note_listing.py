@@ -0,0 +1,115 @@
+"""
+文章列表回應大小與序列化時間基準測試
+
+以長篇文章建立資料庫，比較一頁文章列表的兩種回應：
+
+- full：預設欄位（含整篇 content），以 FastAPI 預設的 jsonable_encoder + JSONResponse 序列化
+- summary：`fields=id,title,excerpt,size,updated_at,tags`，以 common.ORJSONResponse 序列化
+
+回報查詢時間、序列化時間與回應大小（JSON）：
+
+    python benchmarks/bench_note_listing.py --notes 5000 --note-kb 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SUMMARY_FIELDS = ("id", "title", "excerpt", "size", "updated_at", "tags")
+
+
+def seed_database(path: str, notes: int, note_kb: int, summarize_note):
+    rng = random.Random(42)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 2500)]
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO tags (name) VALUES (?)", [(f"標籤{i}",) for i in range(50)])
+    for start in range(0, notes, 500):
+        batch = []
+        for i in range(start, min(start + 500, notes)):
+            # 每個中文字佔 3 bytes
+            body = "".join(rng.choice(chars) for _ in range(note_kb * 1024 // 3))
+            content = f"# 日記 {i}\n\n{body}"
+            batch.append({"content": content, **summarize_note(content)})
+        conn.executemany("""
+            INSERT INTO markdown_notes (content, title, excerpt, size, updated_at)
+            VALUES (:content, :title, :excerpt, :size, CURRENT_TIMESTAMP)
+        """, batch)
+    conn.execute("""
+        INSERT INTO note_tags (note_id, tag_id)
+        SELECT id, (id % 50) + 1 FROM markdown_notes
+    """)
+    conn.commit()
+    conn.close()
+
+
+def timed(func, rounds: int) -> float:
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return round(statistics.median(latencies) * 1000, 3)
+
+
+async def timed_async(factory, rounds: int) -> float:
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await factory()
+        latencies.append(time.perf_counter() - start)
+    return round(statistics.median(latencies) * 1000, 3)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    from common import Config, ORJSONResponse, fetch_notes_page, init_db, summarize_note
+    init_db()  # 在暫存目錄建立資料表
+    seed_database(Config.DB_PATH, args.notes, args.note_kb, summarize_note)
+
+    results = []
+    async with aiosqlite.connect(Config.DB_PATH) as conn:
+        for limit in args.page_sizes:
+            full, _ = await fetch_notes_page(conn, limit)
+            summary, _ = await fetch_notes_page(conn, limit, fields=SUMMARY_FIELDS)
+            full_body = {"notes": full, "total": None, "next_cursor": None}
+            summary_body = {"notes": summary, "total": None, "next_cursor": None}
+            results.append({
+                "page_size": limit,
+                "full": {
+                    "query_ms": await timed_async(lambda: fetch_notes_page(conn, limit), args.rounds),
+                    "serialize_ms": timed(lambda: JSONResponse(jsonable_encoder(full_body)), args.rounds),
+                    "bytes": len(JSONResponse(jsonable_encoder(full_body)).body),
+                },
+                "summary": {
+                    "query_ms": await timed_async(
+                        lambda: fetch_notes_page(conn, limit, fields=SUMMARY_FIELDS), args.rounds),
+                    "serialize_ms": timed(lambda: ORJSONResponse(summary_body), args.rounds),
+                    "bytes": len(ORJSONResponse(summary_body).body),
+                },
+                # 同樣內容只換序列化方式，單獨看 orjson 的效果
+                "full_orjson_serialize_ms": timed(lambda: ORJSONResponse(full_body), args.rounds),
+            })
+    return {"notes": args.notes, "note_kb": args.note_kb, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--note-kb", type=int, default=20)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 50, 200])
+    parser.add_argument("--rounds", type=int, default=20)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
@@ -0,0 +1,120 @@
+"""
+文章全文搜尋基準測試
+
+以合成的中文文章建立資料庫，比較 `common.search_note_index`（FTS5 trigram）
+與直接對 markdown_notes 做 `LIKE '%q%'` 掃描的延遲（JSON）：
+
+    python benchmarks/bench_note_search.py --notes 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def build_vocabulary(rng: random.Random, size: int) -> list:
+    """產生由常用漢字組成的二到四字詞彙"""
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 2500)]
+    return ["".join(rng.choice(chars) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def seed_database(path: str, notes: int, vocabulary: list, rng: random.Random):
+    """詞頻依 Zipf 分佈，少數詞非常常見、大部分詞很少出現"""
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    conn = sqlite3.connect(path)
+    batch = []
+    for i in range(notes):
+        words = rng.choices(vocabulary, weights=weights, k=rng.randint(40, 200))
+        batch.append((f"# 日記 {i}\n\n" + "，".join(words),))
+        if len(batch) == 5000:
+            conn.executemany("INSERT INTO markdown_notes (content) VALUES (?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO markdown_notes (content) VALUES (?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def build_queries(vocabulary: list) -> dict:
+    """依詞頻排名挑選查詢：常見詞、中等詞、罕見詞、多詞組合、一兩個字的短詞與不存在的詞"""
+    common, medium = vocabulary[0], vocabulary[len(vocabulary) // 50]
+    return {
+        "common": common,
+        "medium": medium,
+        "rare": vocabulary[len(vocabulary) // 2],
+        "two_terms": f"{vocabulary[5]} {vocabulary[200]}",
+        "two_common": f"{common} {vocabulary[1]}",
+        "common_medium": f"{common} {medium}",
+        "two_chars": common[:2],
+        "one_char": common[:1],
+        "missing": "這個詞不存在",
+    }
+
+
+async def like_scan(conn, query: str, limit: int):
+    """對照組：每個關鍵字一個 LIKE 條件，掃描整個文章表"""
+    terms = query.split()
+    where = " AND ".join("content LIKE ?" for _ in terms)
+    cursor = await conn.execute(
+        f"SELECT id, created_at FROM markdown_notes WHERE {where} ORDER BY created_at DESC LIMIT ?",
+        (*[f"%{t}%" for t in terms], limit))
+    return await cursor.fetchall()
+
+
+async def timed(coro_factory, rounds: int):
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - start)
+    return round(statistics.median(latencies) * 1000, 3)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    from common import Config, init_db, search_note_index
+    init_db()  # 在暫存目錄建立資料表與索引
+
+    rng = random.Random(args.seed)
+    vocabulary = build_vocabulary(rng, args.vocabulary)
+    start = time.perf_counter()
+    seed_database(Config.DB_PATH, args.notes, vocabulary, rng)
+    seed_seconds = time.perf_counter() - start
+
+    results = []
+    async with aiosqlite.connect(Config.DB_PATH) as conn:
+        for kind, query in build_queries(vocabulary).items():
+            results.append({
+                "kind": kind,
+                "query": query,
+                "fts_p50_ms": await timed(lambda: search_note_index(conn, query, args.limit), args.rounds),
+                "like_p50_ms": await timed(lambda: like_scan(conn, query, args.limit), args.rounds),
+            })
+    return {
+        "notes": args.notes,
+        "seed_seconds": round(seed_seconds, 1),
+        "db_bytes": os.path.getsize(Config.DB_PATH),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
@@ -0,0 +1,130 @@
+"""
+/notes/all/ 併發壓力測試
+
+以 N 個併發客戶端持續請求 `/notes/all/`，回報 p50 / p99 延遲與吞吐量（JSON）。
+壓測期間另有一個探測客戶端持續請求 `/health`，其延遲反映事件迴圈是否被資料庫查詢卡住。
+腳本只依賴公開 API，可在不同 commit 上執行以比較連線池導入前後的差異：
+
+    python benchmarks/bench_notes_concurrency.py --clients 200 --requests 2000
+
+預設在暫存目錄建立測試資料庫並以 in-process ASGI 方式執行；
+指定 `--url` 則改為對已啟動的伺服器發送 HTTP 請求。需要安裝 httpx。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed_database(path: str, notes: int, tags: int):
+    """建立測試用文章與標籤資料"""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS markdown_notes
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             content TEXT NOT NULL,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS tags
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             name TEXT NOT NULL UNIQUE,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS note_tags
+            (note_id INTEGER, tag_id INTEGER, PRIMARY KEY (note_id, tag_id));
+    """)
+    conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)",
+                     [(f"標籤{i}",) for i in range(tags)])
+    conn.executemany("INSERT INTO markdown_notes (content) VALUES (?)",
+                     [(f"# 日記 {i}\n\n" + "今天天氣很好。" * 40,) for i in range(notes)])
+    conn.executemany("INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)",
+                     [(n, (n * 7 + k) % tags + 1) for n in range(1, notes + 1) for k in range(3)])
+    conn.commit()
+    conn.close()
+
+
+async def run_clients(client: httpx.AsyncClient, path: str, clients: int, total: int):
+    latencies = []
+    probe_latencies = []
+    remaining = iter(range(total))
+    done = asyncio.Event()
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/health")
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    async def load():
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        done.set()
+
+    start = time.perf_counter()
+    await asyncio.gather(load(), probe())
+    return latencies, probe_latencies, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def main(args):
+    if args.url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.clients))
+        base_url = args.url
+    else:
+        # 在暫存目錄中執行，避免動到專案內的 diary.db
+        workdir = tempfile.mkdtemp(prefix="journal_bench_")
+        os.chdir(workdir)
+        sys.path.insert(0, str(REPO_ROOT))
+        seed_database(os.path.join(workdir, "diary.db"), args.notes, args.tags)
+        from app import app
+        from common import initialize
+        # ASGITransport 不執行 lifespan，直接完成初始化（套用資料庫遷移）
+        initialize()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+        await client.get(args.path)  # 暖機
+        latencies, probe_latencies, elapsed = await run_clients(client, args.path, args.clients, args.requests)
+
+    return {
+        "path": args.path,
+        "clients": args.clients,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "health_probe_p50_ms": round(statistics.median(probe_latencies) * 1000, 2),
+        "health_probe_p99_ms": round(percentile(probe_latencies, 99) * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="對已啟動的伺服器測試，例如 http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/notes/all/")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=50)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
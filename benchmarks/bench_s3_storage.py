@@ -0,0 +1,155 @@
+"""
+S3 儲存後端基準測試
+
+在子程序中啟動本機的 S3 替身（benchmarks/s3_standin.py，也可以用 --endpoint 指向 MinIO），量測：
+
+- requests：HEAD 請求的延遲，共用連線池 vs 每次建立新連線
+- upload：大檔案單一 PUT vs multipart upload（1 段與多段同時上傳）的耗時
+- download：應用程式處理一次下載的成本——預簽網址（只計算簽章，不傳送內容）、
+  經由本機快取傳送（快取命中只需 stat，未命中需先從物件儲存下載）
+
+輸出 JSON：
+
+    python benchmarks/bench_s3_storage.py --size-mb 64 --concurrency 4
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+from s3_storage import S3Storage  # noqa: E402
+
+ACCESS_KEY, SECRET_KEY = "bench", "bench-secret"
+
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+
+def time_each(func, items) -> list:
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def start_standin(workdir: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen([sys.executable, str(REPO_ROOT / "benchmarks" / "s3_standin.py"), "--port", str(port),
+                               "--data", os.path.join(workdir, "s3"), "--access-key", ACCESS_KEY,
+                               "--secret-key", SECRET_KEY])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("S3 替身沒有啟動")
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    server = None if args.endpoint else start_standin(workdir, args.port)
+    endpoint = args.endpoint or f"http://127.0.0.1:{args.port}"
+
+    def storage(**options) -> S3Storage:
+        return S3Storage(endpoint, args.bucket, args.access_key or ACCESS_KEY, args.secret_key or SECRET_KEY,
+                         cache_dir=os.path.join(workdir, "cache"), **options)
+
+    try:
+        pooled = storage()
+        source = os.path.join(workdir, "big.bin")
+        with open(source, "wb") as out:
+            for _ in range(args.size_mb):
+                out.write(os.urandom(1024 * 1024))
+        small = os.path.join(workdir, "small.bin")
+        with open(small, "wb") as out:
+            out.write(os.urandom(args.object_kb * 1024))
+        names = [f"{index:064x}.bin" for index in range(args.requests)]
+        for name in names[:args.objects]:
+            pooled.upload(small, name)
+        probes = [names[index % args.objects] for index in range(args.requests)]
+
+        # 連線池：同一條 keep-alive 連線 vs 每次請求都建立新連線
+        pooled.exists(probes[0])
+        pooled_latencies = time_each(pooled.exists, probes)
+        unpooled = storage()
+        unpooled._client.close()
+        unpooled._client = httpx.Client(limits=httpx.Limits(max_keepalive_connections=0))
+        unpooled_latencies = time_each(unpooled.exists, probes)
+        unpooled.close()
+
+        # 上傳
+        uploads = {}
+        for label, options in (
+            ("single_put", {"multipart_threshold": args.size_mb * 1024 * 1024 + 1}),
+            ("multipart_1", {"multipart_threshold": 0, "upload_concurrency": 1}),
+            (f"multipart_{args.concurrency}", {"multipart_threshold": 0, "upload_concurrency": args.concurrency}),
+        ):
+            target = storage(part_size=args.part_mb * 1024 * 1024, **options)
+            start = time.perf_counter()
+            target.upload(source, f"{'f' * 60}{len(uploads):04x}.bin")
+            elapsed = time.perf_counter() - start
+            target.close()
+            uploads[label] = {"seconds": round(elapsed, 2), "mb_per_s": round(args.size_mb / elapsed, 1)}
+
+        # 下載：應用程式內的成本
+        presign_latencies = time_each(lambda name: pooled.presigned_url(name, "a.bin", "application/octet-stream"),
+                                      probes)
+        shutil.rmtree(pooled.cache.root)
+        pooled.cache.root.mkdir()
+        cold_names = names[:args.objects]
+        miss_latencies = time_each(pooled.locate, cold_names)
+        hit_latencies = time_each(pooled.locate, probes)
+        stats = pooled.stats()
+        pooled.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "endpoint": "s3_standin (localhost)" if server is not None else endpoint,
+        "head_request": {"pooled": summarize(pooled_latencies), "new_connection": summarize(unpooled_latencies)},
+        "upload": {"size_mb": args.size_mb, "part_mb": args.part_mb, **uploads},
+        "download_in_app": {
+            "object_kb": args.object_kb,
+            "presigned_url": summarize(presign_latencies),
+            "cache_hit": summarize(hit_latencies),
+            "cache_miss": summarize(miss_latencies),
+        },
+        "cache": {"hits": stats["cache_hits"], "misses": stats["cache_misses"]},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=64, help="上傳測試的檔案大小")
+    parser.add_argument("--part-mb", type=int, default=8, help="multipart upload 每段的大小")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時上傳的分段數")
+    parser.add_argument("--objects", type=int, default=50, help="下載測試的物件數")
+    parser.add_argument("--object-kb", type=int, default=512, help="下載測試的物件大小")
+    parser.add_argument("--requests", type=int, default=500, help="HEAD 與簽章的次數")
+    parser.add_argument("--endpoint", default=None, help="使用現有的 S3 相容服務（預設啟動本機替身）")
+    parser.add_argument("--bucket", default="bench")
+    parser.add_argument("--access-key", default=None)
+    parser.add_argument("--secret-key", default=None)
+    parser.add_argument("--port", type=int, default=9190)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,89 @@
+"""
+熱門分享連結基準測試
+
+在暫存目錄中以 ASGI 直接呼叫應用程式（不經過網路），重複存取同一個小檔案：
+
+- download：`GET /files/download/{filename}`
+- share_redirect：`GET /share/{code}`，跟隨 303 重定向
+- share_direct：`Config.SHARE_SERVE_DIRECT = True` 時的 `GET /share/{code}`
+
+回報每種存取方式的延遲與查詢次數（JSON）：
+
+    python benchmarks/bench_share_links.py --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def count_queries(database):
+    """包裝唯讀連線池，計算每個請求借出連線的次數"""
+    counter = {"reads": 0}
+    reader = database.reader
+
+    def counting_reader():
+        counter["reads"] += 1
+        return reader()
+
+    database.reader = counting_reader
+    return counter
+
+
+async def measure(client: httpx.AsyncClient, url: str, requests: int, counter: dict) -> dict:
+    latencies = []
+    counter["reads"] = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(url, follow_redirects=True)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "db_reads_per_request": round(counter["reads"] / requests, 2),
+    }
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    sys.path.insert(0, str(REPO_ROOT))
+    from app import app
+    from common import Config, db
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/files/upload/", files={"file": ("hot.jpg", os.urandom(args.size), "image/jpeg")})
+            filename = response.json()["filename"]
+            files = (await client.get("/files/all/")).json()
+            file_id = (files["files"] if isinstance(files, dict) else files)[0]["id"]
+            share_code = (await client.post(f"/share/create/{file_id}")).json()["share_code"]
+
+            counter = count_queries(db)
+            results = {"download": await measure(client, f"/files/download/{filename}", args.requests, counter)}
+            results["share_redirect"] = await measure(client, f"/share/{share_code}", args.requests, counter)
+            Config.SHARE_SERVE_DIRECT = True
+            results["share_direct"] = await measure(client, f"/share/{share_code}", args.requests, counter)
+            response = await client.get("/cache/stats")
+            stats = response.json() if response.status_code == 200 else None
+
+    return {"requests": args.requests, "size": args.size, "results": results, "cache": stats}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=4096)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
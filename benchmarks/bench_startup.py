@@ -0,0 +1,174 @@
+"""
+冷啟動時間
+
+- import：以 `python -X importtime -c "import app"` 匯入應用程式，回報匯入 app 的時間、這個 repo 各模組的累計時間
+  （含它們匯入的模組）與由這些模組直接匯入、最耗時的相依套件；另以沒有 -X importtime 的
+  `python -c "import app"` 與 `python -c pass` 量測整個程序與直譯器本身的時間
+- first_response：在子程序以與正式環境相同的設定啟動 uvicorn（sendfile_protocol、asyncio 事件迴圈），
+  量測從建立程序到第一個 `GET /health` 成功回應的時間（含匯入、lifespan 的初始化與資料庫遷移），
+  以及之後第一個 `GET /`（首頁模板）的時間。分為全新的資料庫（執行所有遷移）與結構版本已是最新的資料庫
+  （一般的重新啟動、自動擴充的新執行個體）
+
+每種量測重複 --runs 次取中位數，結果為 JSON（毫秒）。指定 --repo 可量測另一個 checkout，
+例如以 git worktree 取出改動前的 commit 比較：
+
+    git worktree add /tmp/journal_before HEAD~1
+    python benchmarks/bench_startup.py --repo /tmp/journal_before
+    python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_upload_streaming import free_port  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_workdir(repo: Path) -> str:
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.symlink(repo / "static", os.path.join(workdir, "static"))
+    return workdir
+
+
+def python_env(repo: Path) -> dict:
+    return dict(os.environ, PYTHONPATH=str(repo))
+
+
+def parse_importtime(output: str) -> list:
+    """
+    解析 -X importtime 的輸出
+
+    Returns:
+        [(模組, 父模組或 None, 自身毫秒, 累計毫秒)]；輸出中子模組在父模組之前，這裡由後往前找出父模組
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = len(name) - len(name.lstrip())
+        entries.append((depth, name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    parsed, stack = [], []
+    for depth, name, self_ms, cumulative_ms in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        parsed.append((name, stack[-1][1] if stack else None, self_ms, cumulative_ms))
+        stack.append((depth, name))
+    return parsed
+
+
+def repo_modules(repo: Path) -> set:
+    names = {path.stem for path in repo.glob("*.py")}
+    names |= {f"routers.{path.stem}" for path in (repo / "routers").glob("*.py")} | {"routers"}
+    return names
+
+
+def timed_run(command: list, repo: Path, workdir: str) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=workdir, env=python_env(repo), check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_import(args) -> dict:
+    own = repo_modules(args.repo)
+    workdir = make_workdir(args.repo)
+    # 第一次執行會寫入 .pyc，不列入結果
+    timed_run([sys.executable, "-c", "import app"], args.repo, workdir)
+
+    app_ms, process_ms, interpreter_ms = [], [], []
+    modules: dict = {}
+    dependencies: dict = {}
+    for _ in range(args.runs):
+        interpreter_ms.append(timed_run([sys.executable, "-c", "pass"], args.repo, workdir))
+        process_ms.append(timed_run([sys.executable, "-c", "import app"], args.repo, workdir))
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=workdir,
+                                env=python_env(args.repo), check=True, capture_output=True, text=True)
+        for name, parent, _, cumulative_ms in parse_importtime(result.stderr):
+            if name == "app":
+                app_ms.append(cumulative_ms)
+            if name in own:
+                modules.setdefault(name, []).append(cumulative_ms)
+            elif parent in own:
+                dependencies.setdefault(name, []).append(cumulative_ms)
+
+    def summarize(samples: dict, limit: int | None = None) -> dict:
+        medians = sorted(((name, statistics.median(values)) for name, values in samples.items()),
+                         key=lambda item: -item[1])
+        return {name: round(value, 1) for name, value in medians[:limit] if value >= args.min_ms}
+
+    return {
+        "app_ms": round(statistics.median(app_ms), 1),
+        "process_ms": round(statistics.median(process_ms), 1),
+        "interpreter_ms": round(statistics.median(interpreter_ms), 1),
+        "repo_modules_ms": summarize(modules),
+        "dependencies_ms": summarize(dependencies, args.top),
+    }
+
+
+def start_and_wait(repo: Path, workdir: str) -> dict:
+    """啟動 uvicorn 並等到 /health 成功回應，回傳各階段的毫秒數"""
+    port = free_port()
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning",
+               "--http", "sendfile_protocol:SendfileProtocol", "--loop", "asyncio"]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=workdir, env=python_env(repo),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"伺服器未能啟動（結束碼 {server.returncode}）")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+            ready = time.perf_counter()
+            client.get("/").raise_for_status()
+            index = time.perf_counter()
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_response_ms": (ready - start) * 1000, "first_index_ms": (index - ready) * 1000}
+
+
+def bench_first_response(args) -> dict:
+    results = {}
+    current = make_workdir(args.repo)
+    # 建立資料庫並套用所有遷移，之後的啟動都是結構版本已是最新的情況
+    start_and_wait(args.repo, current)
+    for name in ("fresh_db", "current_db"):
+        runs = [start_and_wait(args.repo, make_workdir(args.repo) if name == "fresh_db" else current)
+                for _ in range(args.runs)]
+        results[name] = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    return results
+
+
+def main(args):
+    args.repo = Path(args.repo).resolve() if args.repo else REPO_ROOT
+    return {
+        "repo": str(args.repo),
+        "runs": args.runs,
+        "import": bench_import(args),
+        "startup": bench_first_response(args),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=None, help="要量測的 checkout（預設為這個 repo）")
+    parser.add_argument("--runs", type=int, default=10, help="每種量測的次數")
+    parser.add_argument("--top", type=int, default=10, help="列出的相依套件數")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="列出的模組與相依套件的最小累計時間（毫秒）")
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
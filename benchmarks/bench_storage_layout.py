@@ -0,0 +1,149 @@
+"""
+上傳資料夾配置基準測試：平面 vs 依 hash 前綴分層
+
+在暫存目錄建立大量空檔案（檔名同上傳檔案：sha256 + 副檔名），依序量測：
+
+1. 平面配置：檔案存在檢查（命中／未命中）、新增檔案（暫存檔 + os.replace）、
+   列出資料夾與走訪全部檔案（備份與 gc-blobs 的成本）
+2. 以 storage.LocalStorage.migrate 搬到分層配置的速度
+3. 分層配置：同樣的量測
+
+存在檢查另外在清除作業系統快取後量測一次（冷快取，需要 root 權限，加上 --drop-caches）。輸出 JSON：
+
+    python benchmarks/bench_storage_layout.py --files 1000000 --drop-caches
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from storage import LocalStorage  # noqa: E402
+
+
+def blob_name(index: int) -> str:
+    return hashlib.sha256(str(index).encode()).hexdigest() + ".jpg"
+
+
+def create_flat(root: Path, count: int) -> float:
+    start = time.perf_counter()
+    for index in range(count):
+        os.close(os.open(root / blob_name(index), os.O_CREAT | os.O_WRONLY, 0o644))
+    return time.perf_counter() - start
+
+
+def drop_caches():
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as control:
+        control.write("3\n")
+
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_us": round(statistics.median(latencies) * 1e6, 1),
+        "p99_us": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6, 1),
+    }
+
+
+def time_each(func, items) -> list:
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def measure(storage: LocalStorage, layout: str, hits: list, misses: list, inserts: list, args) -> dict:
+    locate = (lambda name: os.path.exists(storage.root / name)) if layout == "flat" else storage.locate
+    result = {
+        "exists_hit": summarize(time_each(locate, hits)),
+        "exists_miss": summarize(time_each(locate, misses)),
+    }
+    if args.drop_caches:
+        drop_caches()
+        result["exists_hit_cold"] = summarize(time_each(locate, hits[:args.cold_samples]))
+
+    def insert(name):
+        fd, temp_path = storage.create_temp()
+        os.close(fd)
+        if layout == "flat":
+            os.replace(temp_path, storage.root / name)
+        else:
+            storage.store(temp_path, name)
+    result["insert"] = summarize(time_each(insert, inserts))
+
+    if args.drop_caches:
+        drop_caches()
+    start = time.perf_counter()
+    top_level = len(os.listdir(storage.root))
+    result["list_root_s"] = round(time.perf_counter() - start, 3)
+    result["root_entries"] = top_level
+    start = time.perf_counter()
+    walked = sum(1 for _ in storage.iter_files())
+    result["walk_all_s"] = round(time.perf_counter() - start, 2)
+    result["walked_files"] = walked
+    return result
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix="journal_bench_", dir=args.dir))
+    try:
+        root = workdir / "files"
+        root.mkdir()
+        create_seconds = create_flat(root, args.files)
+        storage = LocalStorage(str(root))
+
+        hits = [blob_name(rng.randrange(args.files)) for _ in range(args.samples)]
+        misses = [blob_name(args.files + index) for index in range(args.samples)]
+        flat_inserts = [blob_name(args.files + args.samples + index) for index in range(args.inserts)]
+        sharded_inserts = [blob_name(args.files + args.samples + args.inserts + index) for index in range(args.inserts)]
+
+        flat = measure(storage, "flat", hits, misses, flat_inserts, args)
+
+        # 遷移期間（部分檔案已搬移）經由 LocalStorage 查詢平面檔案的成本
+        storage.migrate(limit=args.files // 2)
+        during = {"exists_hit": summarize(time_each(storage.locate, hits))}
+
+        start = time.perf_counter()
+        migrated = storage.migrate()
+        migrate_seconds = time.perf_counter() - start
+        sharded = measure(storage, "sharded", hits, misses, sharded_inserts, args)
+
+        return {
+            "files": args.files,
+            "create_flat_s": round(create_seconds, 1),
+            "flat": flat,
+            "during_migration": during,
+            "migration": {
+                "moved": migrated["moved"] + args.files // 2,
+                "second_half_s": round(migrate_seconds, 1),
+                "files_per_s": round(migrated["moved"] / migrate_seconds),
+                "complete": migrated["complete"],
+            },
+            "sharded": sharded,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--samples", type=int, default=20000, help="存在檢查的次數")
+    parser.add_argument("--cold-samples", type=int, default=2000, help="清除快取後存在檢查的次數")
+    parser.add_argument("--inserts", type=int, default=5000, help="新增檔案的次數")
+    parser.add_argument("--drop-caches", action="store_true", help="量測冷快取（需要 root 權限）")
+    parser.add_argument("--dir", default=None, help="暫存目錄的位置（預設為系統暫存目錄）")
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
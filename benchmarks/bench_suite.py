@@ -0,0 +1,412 @@
+"""
+所有路由的負載測試
+
+在暫存目錄建立可重現的合成資料集（同一個 --seed 產生相同的內容）：
+
+- N 篇文章（以 POST /notes/bulk/ 匯入），每篇 1~5 個標籤，標籤與內文用字的出現頻率依 Zipf 分布
+- M 個大小混合的檔案（以 POST /files/upload/ 上傳到 uploads/files）：
+  60% 為 1~64KB 的 .txt、30% 為 64KB~1MB 的 .pdf、10% 為 1~8MB 的 .mp4
+- 其中一部分檔案的分享連結
+
+接著依序執行文章、標籤、檔案、分享各端點的情境（與混合情境），每個情境以 --concurrency 個併發客戶端
+送出 --requests 個請求，回報吞吐量、p50 / p95 / p99 延遲、錯誤數與峰值 RSS：
+
+- --mode inprocess：以 httpx.ASGITransport 在同一個程序中呼叫（不經過網路，RSS 包含客戶端）
+- --mode http：在子程序啟動 uvicorn，經由 127.0.0.1 的 TCP 連線呼叫（RSS 為伺服器程序）；
+  指定 --workers 時改以 serve.py 啟動多個工作程序
+
+峰值 RSS 為 /proc/<pid>/status 的 VmHWM，每個情境開始前以 /proc/<pid>/clear_refs 重設（僅限 Linux）；
+伺服器有子程序（serve.py 的工作程序）時為各程序的總和，共用的記憶體頁會重複計算。
+結果為 JSON，包含 commit 與資料集參數，可存檔後在不同 commit 間比較：
+
+    python benchmarks/bench_suite.py --notes 2000 --files 60 --output before.json
+    python benchmarks/bench_suite.py --notes 2000 --files 60 --output after.json
+    python benchmarks/bench_suite.py --compare before.json after.json --threshold 0.1
+
+比較時吞吐量下降或 p95 延遲增加超過 --threshold 的情境列為退步，有退步時以結束碼 1 結束。
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_upload_streaming import free_port, peak_rss_mb, wait_ready  # noqa: E402
+
+_SYLLABLES = ["ka", "lo", "mi", "ren", "to", "shi", "na", "vu", "pe", "ria", "don", "ke", "sa", "tri", "mo", "zen"]
+_PHRASES = ["日記", "旅行", "工作", "會議", "讀書", "心得", "家庭", "運動", "電影", "音樂", "程式", "計畫"]
+# (比例, 最小 bytes, 最大 bytes, 副檔名, MIME 類型)
+_FILE_MIX = [
+    (0.6, 1024, 64 * 1024, ".txt", "text/plain"),
+    (0.3, 64 * 1024, 1024 * 1024, ".pdf", "application/pdf"),
+    (0.1, 1024 * 1024, 8 * 1024 * 1024, ".mp4", "video/mp4"),
+]
+_BULK_CHUNK = 1000
+
+
+def zipf_weights(count: int, s: float) -> list:
+    """第 k 名（從 1 起算）的權重為 1 / k^s"""
+    return [1 / rank ** s for rank in range(1, count + 1)]
+
+
+def process_tree(pid: int) -> list:
+    """pid 與其所有子孫程序"""
+    pids, index = [pid], 0
+    while index < len(pids):
+        try:
+            with open(f"/proc/{pids[index]}/task/{pids[index]}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+        index += 1
+    return pids
+
+
+def reset_peak_rss(pid: int) -> bool:
+    """重設 pid 與子孫程序的 VmHWM（Linux 4.0 以上，須有寫入 clear_refs 的權限）"""
+    try:
+        for member in process_tree(pid):
+            with open(f"/proc/{member}/clear_refs", "w") as refs:
+                refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def tree_peak_rss_mb(pid: int) -> float:
+    return round(sum(peak_rss_mb(member) for member in process_tree(pid)), 1)
+
+
+def git_revision() -> dict:
+    def git(*command):
+        result = subprocess.run(["git", *command], cwd=REPO_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+class Dataset:
+    """合成資料集：由 seed 決定所有內容，seed() 之後記錄實際建立的 ID 供情境使用"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.tags = [f"topic-{rank}" if rank % 2 else f"主題{rank}" for rank in range(1, args.tags + 1)]
+        self.tag_weights = zipf_weights(len(self.tags), args.zipf_s)
+        self.words = self._vocabulary(args.vocabulary)
+        self.word_weights = zipf_weights(len(self.words), args.zipf_s)
+        self.note_ids: list = []
+        self.tag_ids: list = []
+        self.tag_id_weights: list = []
+        self.files: list = []  # (id, filename)
+        self.share_codes: list = []
+
+    def _vocabulary(self, size: int) -> list:
+        words = set()
+        while len(words) < size:
+            if self.rng.random() < 0.2:
+                words.add("".join(self.rng.sample(_PHRASES, 2)))
+            else:
+                words.add("".join(self.rng.choice(_SYLLABLES) for _ in range(self.rng.randint(2, 4))))
+        return sorted(words)
+
+    def pick_tag(self, rng: random.Random) -> str:
+        return rng.choices(self.tags, self.tag_weights)[0]
+
+    def pick_word(self, rng: random.Random) -> str:
+        return rng.choices(self.words, self.word_weights)[0]
+
+    def note_content(self, rng: random.Random, index: int) -> str:
+        paragraphs = []
+        remaining = rng.randint(self.args.note_words // 4, self.args.note_words * 7 // 4)
+        while remaining > 0:
+            length = min(remaining, rng.randint(20, 80))
+            paragraphs.append(" ".join(rng.choices(self.words, self.word_weights, k=length)))
+            remaining -= length
+        return f"# 筆記 {index} {self.pick_word(rng)}\n\n" + "\n\n".join(paragraphs)
+
+    def note_tags(self, rng: random.Random) -> list:
+        return sorted(set(rng.choices(self.tags, self.tag_weights, k=rng.randint(1, 5))))
+
+    async def seed(self, client: httpx.AsyncClient) -> dict:
+        started = time.perf_counter()
+        for first in range(0, self.args.notes, _BULK_CHUNK):
+            lines = [json.dumps({"content": self.note_content(self.rng, index), "tags": self.note_tags(self.rng)},
+                                ensure_ascii=False)
+                     for index in range(first, min(first + _BULK_CHUNK, self.args.notes))]
+            response = await client.post("/notes/bulk/", content="\n".join(lines).encode(),
+                                         headers={"content-type": "application/x-ndjson"})
+            response.raise_for_status()
+            if response.json()["skipped"]:
+                raise RuntimeError(f"匯入文章失敗: {response.json()['errors']}")
+        notes_s = time.perf_counter() - started
+
+        uploaded_bytes = 0
+        for index in range(self.args.files):
+            share, low, high, suffix, mime = self.rng.choices(_FILE_MIX, [mix[0] for mix in _FILE_MIX])[0]
+            payload = self.rng.randbytes(self.rng.randint(low, high))
+            response = await client.post("/files/upload/", files={"file": (f"bench{index}{suffix}", payload, mime)})
+            response.raise_for_status()
+            uploaded_bytes += len(payload)
+
+        tags = (await client.get("/tags/all/")).raise_for_status().json()["tags"]
+        self.tag_ids = [tag["id"] for tag in tags]
+        # 標籤相關文章的請求依文章數加權，與實際使用時熱門標籤較常被點選一致
+        self.tag_id_weights = [max(tag["note_count"], 1) for tag in tags]
+        notes = (await client.get("/notes/all/", params={"limit": self.args.notes, "fields": "id",
+                                                         "include_total": "false"})).raise_for_status().json()
+        self.note_ids = [note["id"] for note in notes["notes"]]
+        files = (await client.get("/files/all/")).raise_for_status().json()["files"]
+        self.files = [(row["id"], row["filename"]) for row in files]
+        for file_id, _ in self.files[:self.args.shares]:
+            response = await client.post(f"/share/create/{file_id}")
+            response.raise_for_status()
+            self.share_codes.append(response.json()["share_code"])
+
+        return {
+            "seed": self.args.seed,
+            "notes": len(self.note_ids),
+            "tags": len(self.tag_ids),
+            "zipf_s": self.args.zipf_s,
+            "note_words": self.args.note_words,
+            "vocabulary": self.args.vocabulary,
+            "files": len(self.files),
+            "file_bytes": uploaded_bytes,
+            "shares": len(self.share_codes),
+            "seed_notes_s": round(notes_s, 2),
+            "seed_total_s": round(time.perf_counter() - started, 2),
+        }
+
+
+def scenarios(data: Dataset) -> dict:
+    """情境名稱 → 以亂數產生一個請求 (method, url, 其他參數) 的函式；只讀的情境在前，寫入的在後"""
+    listing_fields = "id,title,excerpt,size,updated_at,tags"
+
+    def encoded(rng):
+        return base64.b64encode(data.note_content(rng, rng.randint(0, 10 ** 6)).encode()).decode()
+
+    reads = {
+        "notes_list": lambda rng: ("GET", "/notes/all/", {"params": {
+            "limit": 50, "fields": listing_fields, "include_total": "false"}}),
+        "notes_list_by_tag": lambda rng: ("GET", "/notes/all/", {"params": {
+            "tag": data.pick_tag(rng), "limit": 50, "fields": listing_fields}}),
+        "notes_get": lambda rng: ("GET", f"/notes/{rng.choice(data.note_ids)}", {}),
+        "notes_search": lambda rng: ("GET", "/notes/search/", {"params": {"q": data.pick_word(rng)}}),
+        "tags_all": lambda rng: ("GET", "/tags/all/", {}),
+        "tags_search": lambda rng: ("GET", "/tags/search/", {"params": {"query": data.pick_tag(rng)[:3]}}),
+        "tag_notes": lambda rng: ("GET", f"/tags/{rng.choices(data.tag_ids, data.tag_id_weights)[0]}/notes/",
+                                  {"params": {"limit": 50, "include_total": "false"}}),
+        "files_list": lambda rng: ("GET", "/files/all/", {"params": {"limit": 50}}),
+        "files_download": lambda rng: ("GET", f"/files/download/{rng.choice(data.files)[1]}", {}),
+        "share_get": lambda rng: ("GET", f"/share/{rng.choice(data.share_codes)}", {}),
+    }
+    writes = {
+        "notes_create": lambda rng: ("POST", "/notes/create/", {"json": {
+            "content": encoded(rng), "tags": data.note_tags(rng)}}),
+        "notes_update": lambda rng: ("PUT", f"/notes/{rng.choice(data.note_ids)}", {"json": {
+            "content": encoded(rng), "tags": data.note_tags(rng)}}),
+        "share_create": lambda rng: ("POST", f"/share/create/{rng.choice(data.files)[0]}", {}),
+    }
+    # 混合情境：讀取約 90%，權重大致依前端的使用頻率
+    mix = [("notes_list", 20), ("notes_get", 25), ("notes_search", 10), ("notes_list_by_tag", 8),
+           ("tags_all", 5), ("tags_search", 8), ("tag_notes", 6), ("files_list", 4), ("files_download", 3),
+           ("share_get", 1), ("notes_create", 4), ("notes_update", 5), ("share_create", 1)]
+    every = {**reads, **writes}
+    names, weights = zip(*mix)
+
+    def mixed(rng):
+        return every[rng.choices(names, weights)[0]](rng)
+
+    return {**every, "mixed": mixed}
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request, rng: random.Random, args, pid: int) -> dict:
+    for _ in range(args.warmup):
+        method, url, kwargs = make_request(rng)
+        await client.request(method, url, **kwargs)
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, kwargs = make_request(rng)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    rss_reset = reset_peak_rss(pid)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        # 無法重設時為整個程序至今的峰值
+        "peak_rss_mb": tree_peak_rss_mb(pid) if rss_reset else None,
+    }
+
+
+async def run(args, client: httpx.AsyncClient, pid: int) -> dict:
+    data = Dataset(args)
+    reset_peak_rss(pid)
+    dataset = await data.seed(client)
+    dataset["seed_peak_rss_mb"] = tree_peak_rss_mb(pid)
+
+    available = scenarios(data)
+    selected = args.scenarios.split(",") if args.scenarios else list(available)
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        raise SystemExit(f"未知的情境: {', '.join(unknown)}（可用: {', '.join(available)}）")
+    results = {}
+    for name in selected:
+        # 每個情境使用自己的亂數序列，只執行部分情境時結果仍可比較
+        rng = random.Random(f"{args.seed}:{name}")
+        results[name] = await run_scenario(client, available[name], rng, args, pid)
+    return {"dataset": dataset, "scenarios": results}
+
+
+async def run_inprocess(args) -> dict:
+    from app import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run(args, client, os.getpid())
+
+
+async def run_http(args, workdir: str) -> dict:
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    if args.workers:
+        command = [sys.executable, str(REPO_ROOT / "serve.py"), "--workers", str(args.workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app"]
+    server = subprocess.Popen(command + ["--port", str(port), "--log-level", "warning"], cwd=workdir, env=env)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency + 1)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            await wait_ready(client)
+            return await run(args, client, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", os.path.join(workdir, "static"))
+    if args.mode == "http":
+        results = asyncio.run(run_http(args, workdir))
+    else:
+        results = asyncio.run(run_inprocess(args))
+    return {
+        **git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "mode": args.mode,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        **results,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float) -> dict:
+    """比較兩次結果中相同的情境；吞吐量下降或 p95 增加超過 threshold（比例）時列為退步"""
+
+    def change(before, after):
+        return round(after / before - 1, 3) if before else None
+
+    rows = {}
+    for name, before in base["scenarios"].items():
+        after = new["scenarios"].get(name)
+        if after is None:
+            continue
+        row = {
+            "throughput_rps": [before["throughput_rps"], after["throughput_rps"]],
+            "throughput_change": change(before["throughput_rps"], after["throughput_rps"]),
+            "p95_ms": [before["p95_ms"], after["p95_ms"]],
+            "p95_change": change(before["p95_ms"], after["p95_ms"]),
+            "p99_change": change(before["p99_ms"], after["p99_ms"]),
+            "peak_rss_change": change(before["peak_rss_mb"], after["peak_rss_mb"])
+            if before["peak_rss_mb"] and after["peak_rss_mb"] else None,
+        }
+        row["regression"] = ((row["throughput_change"] or 0) < -threshold or (row["p95_change"] or 0) > threshold
+                             or after["errors"] > before["errors"])
+        rows[name] = row
+    parameters = ("seed", "notes", "tags", "zipf_s", "note_words", "vocabulary", "files", "shares")
+    return {
+        "base": base.get("commit"),
+        "new": new.get("commit"),
+        # 資料集、模式或併發數不同時的比較沒有意義
+        "comparable": (all(base["dataset"].get(key) == new["dataset"].get(key) for key in parameters)
+                       and all(base.get(key) == new.get(key) for key in ("mode", "workers", "concurrency"))),
+        "threshold": threshold,
+        "regressions": [name for name, row in rows.items() if row["regression"]],
+        "scenarios": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--seed", type=int, default=1, help="亂數種子，決定資料集與請求序列")
+    parser.add_argument("--notes", type=int, default=2000, help="文章數")
+    parser.add_argument("--tags", type=int, default=300, help="標籤數")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="標籤與用字的 Zipf 指數")
+    parser.add_argument("--note-words", type=int, default=200, help="每篇文章的平均字數")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="內文的詞彙數")
+    parser.add_argument("--files", type=int, default=60, help="上傳的檔案數")
+    parser.add_argument("--shares", type=int, default=20, help="建立分享連結的檔案數")
+    parser.add_argument("--scenarios", default=None, help="以逗號分隔要執行的情境，預設為全部")
+    parser.add_argument("--requests", type=int, default=500, help="每個情境的請求數")
+    parser.add_argument("--warmup", type=int, default=20, help="每個情境開始計時前的請求數")
+    parser.add_argument("--concurrency", type=int, default=8, help="併發客戶端數")
+    parser.add_argument("--workers", type=int, default=None, help="--mode http 時以 serve.py 啟動的工作程序數")
+    parser.add_argument("--output", default=None, help="另外將結果寫入此 JSON 檔")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), default=None,
+                        help="比較兩個結果檔，不執行測試")
+    parser.add_argument("--threshold", type=float, default=0.1, help="比較時視為退步的變化比例")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as base_file, open(args.compare[1]) as new_file:
+            report = compare(json.load(base_file), json.load(new_file), args.threshold)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(1 if report["regressions"] else 0)
+
+    # main() 會切換到暫存目錄，相對路徑先轉為絕對路徑
+    output = Path(args.output).resolve() if args.output else None
+    text = json.dumps(main(args), ensure_ascii=False, indent=2)
+    if output:
+        output.write_text(text + "\n")
+    print(text)
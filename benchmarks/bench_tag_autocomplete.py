@@ -0,0 +1,136 @@
+"""
+標籤自動完成基準測試
+
+產生大量標籤（中文與英文混合，使用次數呈長尾分布），比較：
+
+- index：tag_search.TagSearchIndex.search（`GET /tags/search/` 使用的記憶體索引）
+- sql_like：原本的 `WHERE name LIKE '%query%' ORDER BY note_count DESC` 查詢
+
+查詢模擬編輯器逐字輸入：隨機標籤名稱、拼音、拼音首字母的前 1～4 個字，
+另有打錯一個字母與找不到的查詢；每次查詢之間穿插使用次數的變動（文章存檔），
+確認前綴快取的就地更新不會拖慢查詢。回報延遲分位數、建立索引時間與記憶體用量（JSON）：
+
+    python benchmarks/bench_tag_autocomplete.py --tags 100000
+"""
+import argparse
+import gc
+import json
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from tag_search import TagSearchIndex, normalize, search_keys  # noqa: E402
+
+WORDS = ("note", "travel", "python", "recipe", "music", "work", "study", "photo", "idea", "book",
+         "daily", "health", "money", "garden", "movie", "design", "code", "family", "plan", "review")
+
+
+def make_tags(count: int, rng: random.Random) -> list:
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    names = set()
+    while len(names) < count:
+        if rng.random() < 0.6:
+            names.add("".join(rng.choice(chars) for _ in range(rng.randint(2, 4))))
+        else:
+            names.add(f"{rng.choice(WORDS)}-{rng.choice(WORDS)}{rng.randint(0, 999)}")
+    # 長尾分布：少數標籤很常用
+    return [(tag_id, name, int(rng.paretovariate(1.2)) - 1) for tag_id, name in enumerate(sorted(names), 1)]
+
+
+def make_queries(tags: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        _, name, _ = rng.choice(tags)
+        kind = rng.random()
+        if kind < 0.7:
+            key = rng.choice(sorted(search_keys(name)))
+            queries.append(key[:rng.randint(1, 4)])
+        elif kind < 0.9:
+            text = normalize(name)
+            if len(text) > 3:
+                position = rng.randrange(len(text))
+                text = text[:position] + "x" + text[position + 1:]
+            queries.append(text)
+        else:
+            queries.append(f"qqq{rng.randint(0, 99)}")
+    return queries
+
+
+def percentiles(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 4)
+    return {"p50_ms": pick(0.5), "p99_ms": pick(0.99), "max_ms": round(latencies[-1] * 1000, 4)}
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    tags = make_tags(args.tags, rng)
+    queries = make_queries(tags, args.queries, rng)
+
+    # tracemalloc 會拖慢建立速度，記憶體另外量一次
+    tracemalloc.start()
+    TagSearchIndex().build(tags)
+    memory_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    start = time.perf_counter()
+    index = TagSearchIndex()
+    index.build(tags)
+    build_seconds = time.perf_counter() - start
+    # 與 app.py 的 lifespan 相同
+    gc.freeze()
+
+    # 預熱一輪（與實際服務相同，前綴快取在第一次查詢時建立）
+    for query in queries:
+        index.search(query, args.limit)
+
+    latencies = []
+    update_latencies = []
+    empty = 0
+    tag_ids = [tag_id for tag_id, _, _ in tags]
+    for query in queries:
+        start = time.perf_counter()
+        index.adjust_counts({tag_id: rng.choice((1, 1, -1)) for tag_id in rng.sample(tag_ids, 3)})
+        update_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        results = index.search(query, args.limit)
+        latencies.append(time.perf_counter() - start)
+        empty += not results
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT UNIQUE, note_count INTEGER)")
+    conn.execute("CREATE INDEX idx_tags_note_count ON tags (note_count DESC, name)")
+    conn.executemany("INSERT INTO tags VALUES (?, ?, ?)", tags)
+    sql_latencies = []
+    for query in queries[:args.sql_queries]:
+        start = time.perf_counter()
+        conn.execute("SELECT id, name, note_count FROM tags WHERE name LIKE ? ORDER BY note_count DESC, name "
+                     "LIMIT ?", (f"%{query}%", args.limit)).fetchall()
+        sql_latencies.append(time.perf_counter() - start)
+
+    return {
+        "tags": args.tags,
+        "queries": len(queries),
+        "index": {
+            "build_s": round(build_seconds, 2),
+            "peak_memory_mb": round(memory_mb, 1),
+            "cached_prefixes": len(index._top),
+            "empty_results": empty,
+            **percentiles(latencies),
+            "count_update": percentiles(update_latencies),
+        },
+        "sql_like": {"queries": len(sql_latencies), **percentiles(sql_latencies)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tags", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--sql-queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,127 @@
+"""
+標籤寫入與標籤列表基準測試
+
+在暫存目錄中以 ASGI 直接呼叫應用程式，先建立大量標籤與文章，再量測：
+
+- create：`POST /notes/create/`，每篇 5 個既有標籤
+- update_same_tags：`PUT /notes/{id}`，標籤不變
+- update_one_tag：`PUT /notes/{id}`，替換其中一個標籤
+- tags_all：`GET /tags/all/`
+
+回報延遲與每個請求在寫入連線上執行的 SQL 數（不含觸發器內的語句），輸出 JSON：
+
+    python benchmarks/bench_tag_writes.py --tags 5000 --notes 20000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def seed_database(path: str, tags: int, notes: int, tags_per_note: int, rng: random.Random):
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO tags (name) VALUES (?)", [(f"標籤{i}",) for i in range(tags)])
+    conn.executemany("INSERT INTO markdown_notes (content) VALUES (?)", [(f"# 日記 {i}",) for i in range(notes)])
+    conn.executemany("INSERT INTO note_tags (note_id, tag_id) VALUES (?, ?)", [
+        (note_id, tag_id)
+        for note_id in range(1, notes + 1)
+        for tag_id in rng.sample(range(1, tags + 1), tags_per_note)
+    ])
+    conn.commit()
+    conn.close()
+
+
+async def measure(request_factory, rounds: int, statements: list) -> dict:
+    latencies = []
+    counts = []
+    for index in range(rounds):
+        statements.clear()
+        start = time.perf_counter()
+        response = await request_factory(index)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        counts.append(sum(1 for sql in statements if not sql.startswith("--")))
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "sql_per_request": statistics.median(counts),
+    }
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    sys.path.insert(0, str(REPO_ROOT))
+    from common import Config, init_db
+    rng = random.Random(args.seed)
+    # 若 app 匯入時已載入標籤對照表，需先建立資料
+    init_db()
+    seed_database(Config.DB_PATH, args.tags, args.notes, 3, rng)
+    from app import app
+    from common import db, tag_dictionary
+
+    def content(text: str) -> str:
+        return base64.b64encode(text.encode()).decode()
+
+    def tag_names(count: int) -> list:
+        return [f"標籤{i}" for i in rng.sample(range(args.tags), count)]
+
+    async with app.router.lifespan_context(app):
+        # 標籤對照表在背景建立，等它完成，量測建立後的一般情況
+        await tag_dictionary.start_loading(db)
+        statements = []
+        await db._writer.set_trace_callback(statements.append)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            created = []
+
+            async def create(index):
+                response = await client.post("/notes/create/", json={"content": content(f"新文章 {index}"),
+                                                                      "tags": tag_names(5)})
+                created.append((response.json()["note_id"], tag_names(5)))
+                return response
+
+            async def update_same(index):
+                note_id, _ = created[index]
+                response = await client.get(f"/notes/{note_id}")
+                tags = response.json()["note"]["tags"]
+                statements.clear()
+                return await client.put(f"/notes/{note_id}", json={"content": content(f"更新 {index}"), "tags": tags})
+
+            async def update_one(index):
+                note_id, _ = created[index]
+                response = await client.get(f"/notes/{note_id}")
+                tags = response.json()["note"]["tags"][1:] + tag_names(1)
+                statements.clear()
+                return await client.put(f"/notes/{note_id}", json={"content": content(f"再更新 {index}"), "tags": tags})
+
+            results = {
+                "create": await measure(create, args.rounds, statements),
+                "update_same_tags": await measure(update_same, args.rounds, statements),
+                "update_one_tag": await measure(update_one, args.rounds, statements),
+                "tags_all": await measure(lambda _: client.get("/tags/all/"), args.rounds, statements),
+            }
+        await db._writer.set_trace_callback(None)
+
+    return {"tags": args.tags, "notes": args.notes, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tags", type=int, default=5000)
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
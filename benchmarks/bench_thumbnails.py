@@ -0,0 +1,166 @@
+"""
+圖片縮圖基準測試
+
+在暫存目錄中以 ASGI 直接呼叫應用程式，上傳一批照片大小的圖片（PNG 與 JPEG 各半），量測：
+
+- upload：上傳圖片的延遲（背景產生縮圖），與上傳相同大小的非圖片檔案比較
+- background：所有圖片的背景縮圖與 blurhash 全部完成所需的時間
+- listing_bytes：檔案列表顯示所有圖片時下載的位元組數：原圖、`?w=320` 的 WebP 與 AVIF，
+  以及高解析度螢幕（srcset 選擇 640）時的 WebP
+- latency：下載原圖、已產生的縮圖、縮圖資料夾清空後當場產生縮圖的延遲
+
+輸出 JSON：
+
+    python benchmarks/bench_thumbnails.py --images 20
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_photo(width: int, height: int, rng: random.Random, fmt: str) -> bytes:
+    """多種尺度的雜訊疊加（大塊色塊到細紋理），縮小後仍有細節，壓縮率接近實際照片"""
+    channels = []
+    for _ in range(3):
+        channel = None
+        for scale, weight in ((200, 0.45), (50, 0.25), (12, 0.2), (3, 0.1)):
+            noise = Image.effect_noise((max(2, width // scale), max(2, height // scale)), rng.uniform(40, 80))
+            noise = noise.resize((width, height), Image.BICUBIC)
+            channel = noise if channel is None else Image.blend(channel, noise, weight / (weight + 0.5))
+        channels.append(channel)
+    buffer = io.BytesIO()
+    image = Image.merge("RGB", channels)
+    if fmt == "jpg":
+        image.save(buffer, "JPEG", quality=90)
+    else:
+        image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+async def timed(request) -> tuple:
+    start = time.perf_counter()
+    response = await request
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return response, elapsed
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    os.chdir(workdir)
+    os.symlink(REPO_ROOT / "static", Path(workdir) / "static")
+    sys.path.insert(0, str(REPO_ROOT))
+    from app import app
+    from common import Config
+    from jobs import job_queue
+
+    async def drain():
+        """等待背景工作全部完成"""
+        while True:
+            depth = (await job_queue.stats())["depth"]
+            if depth["queued"]["total"] == 0 and depth["running"]["total"] == 0:
+                return
+            await asyncio.sleep(0.05)
+
+    rng = random.Random(args.seed)
+    photos = [(f"photo{index}.{fmt}", make_photo(args.width, args.height, rng, fmt))
+              for index, fmt in enumerate(("png", "jpg") * ((args.images + 1) // 2))][:args.images]
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # 先產生一張縮圖，行程池啟動的時間不算在量測內
+            await client.post("/files/upload/", files={"file": ("warmup.png", make_photo(64, 64, rng, "png"))})
+            await drain()
+
+            upload_latencies = []
+            filenames = []
+            background_start = time.perf_counter()
+            for name, data in photos:
+                response, elapsed = await timed(client.post("/files/upload/", files={"file": (name, data)}))
+                upload_latencies.append(elapsed)
+                filenames.append(response.json()["filename"])
+            await drain()
+            background_seconds = time.perf_counter() - background_start
+
+            # 相同大小的非圖片檔案，不會產生縮圖
+            baseline_latencies = []
+            for index, (_, data) in enumerate(photos):
+                payload = rng.randbytes(len(data))
+                _, elapsed = await timed(client.post("/files/upload/", files={"file": (f"data{index}.zip", payload)}))
+                baseline_latencies.append(elapsed)
+
+            listing = (await client.get("/files/all/")).json()["files"]
+            placeholders = sum(1 for file in listing if file["blurhash"])
+
+            async def fetch_all(path: str, params: dict = None, accept: str = "*/*") -> tuple:
+                total = 0
+                latencies = []
+                for filename in filenames:
+                    response, elapsed = await timed(client.get(f"{path}/{filename}", params=params,
+                                                               headers={"accept": accept}))
+                    total += len(response.content)
+                    latencies.append(elapsed)
+                return total, latencies
+
+            original_bytes, original_latencies = await fetch_all("/files/download")
+            webp_bytes, cached_latencies = await fetch_all("/files/thumbnail", {"w": 320}, "image/webp,*/*")
+            avif_bytes, _ = await fetch_all("/files/thumbnail", {"w": 320}, "image/avif,image/webp,*/*")
+            webp_2x_bytes, _ = await fetch_all("/files/thumbnail", {"w": 640}, "image/webp,*/*")
+
+            # 模擬縮圖被逐出：清空資料夾後第一次請求當場產生
+            shutil.rmtree(Config.DERIVATIVE_FOLDER)
+            os.makedirs(Config.DERIVATIVE_FOLDER)
+            _, on_demand_latencies = await fetch_all("/files/thumbnail", {"w": 320}, "image/webp,*/*")
+
+    os.chdir("/")
+    shutil.rmtree(workdir, ignore_errors=True)
+    mb = lambda size: round(size / 1024 / 1024, 2)
+    return {
+        "images": len(photos),
+        "original_size": f"{args.width}x{args.height}",
+        "upload": {"image": summarize(upload_latencies), "non_image_same_size": summarize(baseline_latencies)},
+        "background": {"total_s": round(background_seconds, 2), "with_blurhash": placeholders - 1},
+        "listing_bytes": {
+            "original_mb": mb(original_bytes),
+            "webp_320_mb": mb(webp_bytes),
+            "avif_320_mb": mb(avif_bytes),
+            "webp_640_mb": mb(webp_2x_bytes),
+            "reduction_webp_320": round(original_bytes / webp_bytes, 1),
+        },
+        "latency": {
+            "original": summarize(original_latencies),
+            "thumbnail_cached": summarize(cached_latencies),
+            "thumbnail_on_demand": summarize(on_demand_latencies),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), ensure_ascii=False, indent=2))
@@ -0,0 +1,127 @@
+"""
+檔案上傳記憶體與吞吐量基準測試
+
+在暫存目錄啟動一個 uvicorn 伺服器，以 N 個併發客戶端同時上傳大檔案到 `/files/upload/`，
+回報吞吐量、伺服器峰值記憶體（/proc/<pid>/status 的 VmHWM，僅限 Linux）
+以及上傳期間 `/health` 的延遲（反映事件迴圈是否被卡住），輸出 JSON：
+
+    python benchmarks/bench_upload_streaming.py --clients 10 --size-mb 100
+
+可在不同 commit 上執行以比較串流上傳導入前後的差異。需要安裝 httpx 與 uvicorn。
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+def make_payload(path: str, size_mb: int):
+    """建立隨機內容的測試檔（避免被壓縮或去重影響結果）"""
+    with open(path, "wb") as out:
+        for _ in range(size_mb):
+            out.write(os.urandom(1024 * 1024))
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("伺服器未能啟動")
+
+
+async def run(args, base_url: str, payloads: list):
+    timeout = httpx.Timeout(600)
+    limits = httpx.Limits(max_connections=args.clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        await wait_ready(client)
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def upload(index: int):
+            with open(payloads[index % len(payloads)], "rb") as payload:
+                response = await client.post("/files/upload/", files={"file": (f"bench{index}.mp4", payload, "video/mp4")})
+            response.raise_for_status()
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        async def load():
+            await asyncio.gather(*(upload(i) for i in range(args.clients)))
+            done.set()
+
+        start = time.perf_counter()
+        await asyncio.gather(load(), probe())
+        return time.perf_counter() - start, probe_latencies
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    payloads = []
+    # 每個客戶端使用不同內容，避免相同 hash 互相覆寫
+    for index in range(args.clients):
+        path = os.path.join(workdir, f"payload{index}.bin")
+        make_payload(path, args.size_mb)
+        payloads.append(path)
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        elapsed, probe_latencies = asyncio.run(run(args, f"http://127.0.0.1:{port}", payloads))
+        rss = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    total_mb = args.clients * args.size_mb
+    return {
+        "clients": args.clients,
+        "size_mb": args.size_mb,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_mb_s": round(total_mb / elapsed, 1),
+        "server_peak_rss_mb": rss,
+        "health_probe_p50_ms": round(statistics.median(probe_latencies) * 1000, 2),
+        "health_probe_max_ms": round(max(probe_latencies) * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=100)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
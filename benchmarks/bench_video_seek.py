@@ -0,0 +1,140 @@
+"""
+影片拖曳（seek）與重新載入基準測試
+
+在暫存目錄啟動一個 uvicorn 伺服器並上傳一部影片，模擬播放器的行為：
+
+- seek：隨機跳到某個位置，送出 `Range: bytes=<offset>-` 後讀取一小段就中斷連線；
+  伺服器不支援 Range（回應 200）時，播放器必須從頭讀到該位置
+- revalidate：以第一次下載取得的 ETag / Last-Modified 重新驗證（重新載入頁面）
+
+回報延遲與實際傳輸的位元組數（JSON）：
+
+    python benchmarks/bench_video_seek.py --size-mb 80 --seeks 200
+
+可在不同 commit 上執行以比較差異。需要安裝 httpx 與 uvicorn。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_upload_streaming import REPO_ROOT, free_port, make_payload, wait_ready  # noqa: E402
+
+
+async def read_window(client: httpx.AsyncClient, url: str, offset: int, window: int, headers=None):
+    """
+    從 offset 開始讀取 window 個位元組後中斷連線
+
+    Returns:
+        (狀態碼, 讀到所需資料的時間, 實際讀取的位元組數)
+    """
+    start = time.perf_counter()
+    async with client.stream("GET", url, headers=headers or {}) as response:
+        # 200 表示伺服器忽略了 Range，只能從檔案開頭讀到需要的位置
+        needed = window if response.status_code == 206 else offset + window
+        received = 0
+        async for data in response.aiter_raw():
+            received += len(data)
+            if received >= needed:
+                break
+        return response.status_code, time.perf_counter() - start, received
+
+
+def summarize(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+async def run(args, base_url: str, payload: str):
+    rng = random.Random(args.seed)
+    size = args.size_mb * 1024 * 1024
+    window = args.window_kb * 1024
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600)) as client:
+        await wait_ready(client)
+        with open(payload, "rb") as data:
+            response = await client.post("/files/upload/", files={"file": ("seek.mp4", data, "video/mp4")})
+        response.raise_for_status()
+        url = f"/files/download/{response.json()['filename']}"
+
+        first = await client.get(url)
+        validators = {}
+        if "etag" in first.headers:
+            validators["If-None-Match"] = first.headers["etag"]
+        if "last-modified" in first.headers:
+            validators["If-Modified-Since"] = first.headers["last-modified"]
+
+        seek_latencies, seek_bytes, seek_statuses = [], 0, set()
+        for _ in range(args.seeks):
+            offset = rng.randrange(0, size - window)
+            status, elapsed, received = await read_window(
+                client, url, offset, window, {"Range": f"bytes={offset}-"})
+            seek_latencies.append(elapsed)
+            seek_bytes += received
+            seek_statuses.add(status)
+
+        revalidate_latencies, revalidate_bytes, revalidate_statuses = [], 0, set()
+        for _ in range(args.revalidations):
+            start = time.perf_counter()
+            response = await client.get(url, headers=validators)
+            revalidate_latencies.append(time.perf_counter() - start)
+            revalidate_bytes += len(response.content)
+            revalidate_statuses.add(response.status_code)
+
+    return {
+        "size_mb": args.size_mb,
+        "cache_control": first.headers.get("cache-control"),
+        "etag": first.headers.get("etag"),
+        "seek": {
+            "requests": args.seeks,
+            "statuses": sorted(seek_statuses),
+            "mb_transferred": round(seek_bytes / 1024 / 1024, 1),
+            **summarize(seek_latencies),
+        },
+        "revalidate": {
+            "requests": args.revalidations,
+            "statuses": sorted(revalidate_statuses),
+            "mb_transferred": round(revalidate_bytes / 1024 / 1024, 1),
+            **summarize(revalidate_latencies),
+        },
+    }
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="journal_bench_")
+    payload = os.path.join(workdir, "seek.bin")
+    make_payload(payload, args.size_mb)
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        return asyncio.run(run(args, f"http://127.0.0.1:{port}", payload))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=80)
+    parser.add_argument("--seeks", type=int, default=200)
+    parser.add_argument("--window-kb", type=int, default=512)
+    parser.add_argument("--revalidations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(main(parser.parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,185 @@
+"""
+本機的 S3 相容物件儲存替身，供開發與基準測試使用（不需要安裝 MinIO）
+
+只實作 s3_storage.S3Storage 用到的 API：PutObject、GetObject（含預簽網址的回應標頭覆寫）、HeadObject、
+DeleteObject、ListObjectsV2 與 multipart upload，並驗證 SigV4 簽章（標頭簽章與預簽網址）。
+物件以檔案存放在 `<data>/<bucket>/<key>`，bucket 資料夾不存在時自動建立。
+
+    python benchmarks/s3_standin.py --port 9000 --data /tmp/s3 --access-key dev --secret-key devsecret
+
+應用程式設定 `Config.STORAGE_BACKEND = "s3"`、`S3_ENDPOINT = "http://127.0.0.1:9000"`，
+並以環境變數 S3_ACCESS_KEY / S3_SECRET_KEY 提供相同的金鑰。
+"""
+import argparse
+import calendar
+import hashlib
+import os
+import re
+import secrets
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.routing import Route
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from s3_storage import ALGORITHM, EMPTY_SHA256, UNSIGNED_PAYLOAD, XML_NAMESPACE, sign  # noqa: E402
+
+NAMESPACE = XML_NAMESPACE.strip("{}")
+AUTHORIZATION = re.compile(r"Credential=([^/]+)/(\d{8})/([^/]+)/s3/aws4_request, *"
+                           r"SignedHeaders=([^,]+), *Signature=([0-9a-f]+)")
+RESPONSE_OVERRIDES = {
+    "response-content-type": "content-type",
+    "response-content-disposition": "content-disposition",
+    "response-cache-control": "cache-control",
+}
+
+
+def error(status_code: int, code: str, message: str) -> Response:
+    body = f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>"
+    return Response(body, status_code=status_code, media_type="application/xml")
+
+
+def iso_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def create_app(data_dir: str, access_key: str, secret_key: str) -> Starlette:
+    data = Path(data_dir)
+    uploads = data / ".multipart"
+    uploads.mkdir(parents=True, exist_ok=True)
+
+    def authenticate(request: Request, body: bytes) -> Response | None:
+        """驗證簽章，失敗時回傳錯誤回應"""
+        params = dict(request.query_params)
+        path = request.url.path
+        if "X-Amz-Signature" in params:
+            signature = params.pop("X-Amz-Signature")
+            amz_date = params.get("X-Amz-Date", "")
+            credential = params.get("X-Amz-Credential", "").split("/")
+            signed_names = params.get("X-Amz-SignedHeaders", "").split(";")
+            signed_at = calendar.timegm(time.strptime(amz_date, "%Y%m%dT%H%M%SZ"))
+            if time.time() > signed_at + int(params.get("X-Amz-Expires", "0")):
+                return error(403, "AccessDenied", "Request has expired")
+            payload_hash = UNSIGNED_PAYLOAD
+        else:
+            match = AUTHORIZATION.search(request.headers.get("authorization", ""))
+            if not match or not request.headers.get("authorization", "").startswith(ALGORITHM):
+                return error(403, "AccessDenied", "Missing or malformed authorization")
+            credential = [match.group(1), match.group(2), match.group(3)]
+            signed_names = match.group(4).split(";")
+            signature = match.group(5)
+            amz_date = request.headers.get("x-amz-date", "")
+            payload_hash = request.headers.get("x-amz-content-sha256", "")
+            expected_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+            if payload_hash != UNSIGNED_PAYLOAD and payload_hash != expected_hash:
+                return error(400, "XAmzContentSHA256Mismatch", "Payload hash does not match")
+        if credential[0] != access_key:
+            return error(403, "InvalidAccessKeyId", "Unknown access key")
+        headers = {name: request.headers.get(name, "") for name in signed_names}
+        expected = sign(secret_key, credential[2], amz_date, request.method, path, params, headers, payload_hash)
+        if expected != signature:
+            return error(403, "SignatureDoesNotMatch", "Signature does not match")
+        return None
+
+    async def bucket(request: Request) -> Response:
+        body = await request.body()
+        if (failure := authenticate(request, body)) is not None:
+            return failure
+        root = data / request.path_params["bucket"]
+        prefix = request.query_params.get("prefix", "")
+        start_after = request.query_params.get("continuation-token", "")
+        max_keys = int(request.query_params.get("max-keys", "1000"))
+        keys = sorted(str(path.relative_to(root)) for path in root.rglob("*") if path.is_file()) \
+            if root.is_dir() else []
+        keys = [key for key in keys if key.startswith(prefix) and key > start_after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = []
+        for key in page:
+            stat = (root / key).stat()
+            contents.append(f"<Contents><Key>{escape(key)}</Key><LastModified>{iso_time(stat.st_mtime)}"
+                            f"</LastModified><Size>{stat.st_size}</Size></Contents>")
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        body = (f'<ListBucketResult xmlns="{NAMESPACE}"><Name>{request.path_params["bucket"]}</Name>'
+                f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+                f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{''.join(contents)}"
+                f"</ListBucketResult>")
+        return Response(body, media_type="application/xml")
+
+    async def obj(request: Request) -> Response:
+        body = await request.body()
+        if (failure := authenticate(request, body)) is not None:
+            return failure
+        path = data / request.path_params["bucket"] / request.path_params["key"]
+        params = request.query_params
+        method = request.method
+
+        if method == "POST" and "uploads" in params:
+            upload_id = secrets.token_hex(16)
+            (uploads / upload_id).mkdir()
+            return Response(f'<InitiateMultipartUploadResult xmlns="{NAMESPACE}"><UploadId>{upload_id}'
+                            f"</UploadId></InitiateMultipartUploadResult>", media_type="application/xml")
+        if "uploadId" in params:
+            parts = uploads / params["uploadId"]
+            if not parts.is_dir():
+                return error(404, "NoSuchUpload", "Upload does not exist")
+            if method == "PUT":
+                (parts / f"{int(params['partNumber']):05d}").write_bytes(body)
+                return Response(headers={"etag": f'"{hashlib.md5(body).hexdigest()}"'})
+            if method == "DELETE":
+                for part in parts.iterdir():
+                    part.unlink()
+                parts.rmdir()
+                return Response(status_code=204)
+            numbers = [int(number) for number in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp = path.with_name(f".{path.name}.{params['uploadId']}")
+            with open(temp, "wb") as out:
+                for number in numbers:
+                    out.write((parts / f"{number:05d}").read_bytes())
+            os.replace(temp, path)
+            for part in parts.iterdir():
+                part.unlink()
+            parts.rmdir()
+            return Response(f'<CompleteMultipartUploadResult xmlns="{NAMESPACE}"><Key>{escape(path.name)}</Key>'
+                            f"</CompleteMultipartUploadResult>", media_type="application/xml")
+
+        if method == "PUT":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp = path.with_name(f".{path.name}.{secrets.token_hex(8)}")
+            temp.write_bytes(body)
+            os.replace(temp, path)
+            return Response(headers={"etag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if method == "DELETE":
+            path.unlink(missing_ok=True)
+            return Response(status_code=204)
+        if not path.is_file():
+            return error(404, "NoSuchKey", "The specified key does not exist.")
+        if method == "HEAD":
+            return Response(headers={"content-length": str(path.stat().st_size)})
+        headers = {header: params[name] for name, header in RESPONSE_OVERRIDES.items() if name in params}
+        return FileResponse(path, headers=headers, media_type=headers.pop("content-type", None))
+
+    return Starlette(routes=[
+        Route("/{bucket}", bucket, methods=["GET"]),
+        Route("/{bucket}/{key:path}", obj, methods=["GET", "HEAD", "PUT", "POST", "DELETE"]),
+    ])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--data", default="s3-data", help="存放物件的資料夾")
+    parser.add_argument("--access-key", default="dev")
+    parser.add_argument("--secret-key", default="devsecret")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.data, args.access_key, args.secret_key), host=args.host, port=args.port,
+                log_level="warning")
@@ -2,25 +2,74 @@
 共用模組，提供全局設定、資料庫連接和日誌功能
 """
 import os
+import re
+import json
+import base64
+import time
+import shutil
+import asyncio
+import inspect
 import sqlite3
 import logging
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 
-# 設置日誌，使用 UTF-8 編碼支援中文
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    encoding='utf-8'  # 添加 UTF-8 編碼設定
-)
+import aiosqlite
+import orjson
+from fastapi.responses import JSONResponse
+
+import metrics
+from logs import setup_logging
+from profiling import profiler
+from slow_query import TimedConnection, slow_query_log
+from storage import BlobStorage, LocalStorage
+from tag_search import TOP_CACHE_SIZE, TagSearchIndex
+
 logger = logging.getLogger(__name__)
 
 # 設定類
 class Config:
     UPLOAD_FOLDER = "uploads/files"  # 統一的上傳資料夾
+    UPLOAD_SHARD_DEPTH = 2  # 依檔名（內容 hash）前綴分層的資料夾層數，例如 ab/cd/abcd....jpg
+    UPLOAD_SHARD_WIDTH = 2  # 每層資料夾名稱的字元數
+    
+    # 檔案儲存後端："local"（上傳資料夾）或 "s3"（S3 相容物件儲存，多個應用程式節點共用；需要 httpx）
+    STORAGE_BACKEND = "local"
+    S3_ENDPOINT = "http://127.0.0.1:9000"  # MinIO 等；AWS 為 https://s3.<region>.amazonaws.com
+    S3_REGION = "us-east-1"
+    S3_BUCKET = "journal-uploads"
+    S3_PREFIX = ""  # 物件名稱前綴，例如 "files/"
+    S3_PATH_STYLE = True  # True 時網址為 endpoint/bucket/key，False 時為 bucket.endpoint/key
+    S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "")  # 金鑰不寫在程式碼中
+    S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "")
+    S3_POOL_SIZE = 16  # 連線池的連線數上限
+    S3_TIMEOUT = 30  # 單一請求的逾時秒數
+    S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024  # 超過此大小的檔案分段上傳
+    S3_PART_SIZE = 8 * 1024 * 1024  # 分段大小（至少 5MB）
+    S3_UPLOAD_CONCURRENCY = 4  # 同時上傳的分段數
+    S3_PRESIGN_EXPIRES = 60 * 60  # 下載重定向到的預簽網址有效秒數；0 表示不重定向，經由本機快取傳送
+    S3_CACHE_FOLDER = "uploads/cache"  # 本機讀取快取（產生縮圖等需要本機檔案時）與上傳暫存檔
+    S3_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 讀取快取的大小上限，超過時刪除最久未使用的檔案
+    UPLOAD_SESSION_FOLDER = "uploads/sessions"  # 續傳上傳的分段暫存資料夾
     DB_PATH = "diary.db"
     API_VERSION = "1.0.0"
     
+    # 日誌：JSON Lines，由背景執行緒寫入，依大小或時間輪替（先達到者為準）
+    LOG_FILE = "app.log"
+    LOG_LEVEL = "INFO"
+    LOG_LEVELS = {}  # 個別模組（logger 名稱）的等級，例如 {"routers.files": "DEBUG", "jobs": "WARNING"}
+    LOG_MAX_BYTES = 100 * 1024 * 1024
+    LOG_ROTATE_WHEN = "midnight"  # 與 TimedRotatingFileHandler 的 when 相同，例如 "H"、"midnight"
+    LOG_BACKUP_COUNT = 14  # 保留的舊日誌檔數
+    LOG_QUEUE_SIZE = 10000  # 等待寫入的記錄上限，寫入跟不上時丟棄新的記錄並計數
+    
+    # 效能診斷，預設停用；執行中可由 /admin/profiler 與 /admin/slow-queries 調整
+    PROFILER_SAMPLE_RATE = 0.0  # 做 CPU 取樣的請求比例（0 ~ 1），結果為 collapsed stacks（火焰圖）
+    PROFILER_INTERVAL = 0.005  # 取樣間隔（秒，CPU 時間）
+    SLOW_QUERY_MS = None  # 執行超過此毫秒數的 SQL 連同查詢計畫記錄到慢查詢記錄，None 為停用
+    SLOW_QUERY_LOG_SIZE = 200  # 保留供查詢的最近慢查詢筆數
+    
     # 合併的檔案類型設定
     ALLOWED_EXTENSIONS = {
         'image': {'png', 'jpg', 'jpeg', 'gif', 'webp'},
@@ -32,10 +81,95 @@ class Config:
     
     # 檔案大小限制
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
+    MAX_REQUEST_OVERHEAD = 64 * 1024  # multipart 邊界與表單欄位的額外空間
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上傳檔案每次讀取與寫入的大小
+    BLOB_HASH_ALGORITHM = "sha256"  # 檔案內容定址使用的 hash（hashlib 名稱）
+    
+    # 續傳上傳設定
+    UPLOAD_SESSION_CHUNK_SIZE = 8 * 1024 * 1024  # 預設分段大小
+    UPLOAD_SESSION_MIN_CHUNK_SIZE = 256 * 1024
+    UPLOAD_SESSION_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+    UPLOAD_SESSION_TTL = 24 * 60 * 60  # 閒置超過此秒數的上傳工作階段會被清除
+    
+    # 資料庫連線池設定
+    DB_READER_POOL_SIZE = 8  # 唯讀連線數量上限
+    
+    # 資料庫儲存設定，套用到每一條連線
+    DB_JOURNAL_MODE = "WAL"  # 讀取不會被寫入阻擋
+    DB_SYNCHRONOUS = "NORMAL"  # WAL 模式下兼顧安全與寫入速度
+    DB_BUSY_TIMEOUT = 5000  # 遇到鎖定時最多等待的毫秒數
+    DB_CACHE_SIZE = -64000  # 負值代表 KiB，約 64MB
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # 256MB
+    
+    # 全文搜尋設定
+    SEARCH_RANK_WINDOW = 500  # 符合的文章不超過 N 筆時依相關度排序，超過時依新到舊排序（bm25 的成本與符合數成正比）
+    SEARCH_MAX_EXPANSIONS = 256  # 兩個字的關鍵字最多展開成幾個三字組，超過時改以逐篇比對
+    
+    # 文章摘要設定（寫入文章時計算並儲存）
+    NOTE_TITLE_LENGTH = 100
+    NOTE_EXCERPT_LENGTH = 200
+    
+    # 批次匯入與匯出
+    BULK_BATCH_SIZE = 1000  # 每個交易寫入或每次查詢讀取的文章數
+    BULK_MAX_NOTE_SIZE = 10 * 1024 * 1024  # 匯入時單篇文章的大小上限
+    BULK_MAX_CONTENT_LENGTH = 4 * 1024 * 1024 * 1024  # 批次匯入的請求大小上限（取代 MAX_CONTENT_LENGTH），None 為不限制
+    
+    # 檔案與分享連結的中繼資料快取
+    METADATA_CACHE_SIZE = 4096  # 每個快取最多保留的項目數
+    METADATA_CACHE_TTL = 300  # 項目保留的秒數
+    SHARE_SERVE_DIRECT = False  # True 時 /share/{code} 直接傳送檔案，不再重定向到 /files/download
+    
+    # 本機檔案（上傳檔案與縮圖）的傳送方式：
+    # "sendfile"：由應用程式傳送；以 sendfile_protocol 啟動 uvicorn 時內容以 os.sendfile 從檔案直接送到 socket
+    # "x-accel-redirect"：應用程式只檢查權限與條件式請求，回應 X-Accel-Redirect 標頭，由前端的 nginx 傳送檔案
+    # "x-sendfile"：同上，回應 X-Sendfile 標頭（檔案的絕對路徑），適用 Apache mod_xsendfile、lighttpd
+    FILE_SERVE_MODE = "sendfile"
+    FILE_SERVE_INTERNAL_ROOT = "uploads"  # X-Accel-Redirect 對應的資料夾，需包含上傳、縮圖與 S3 讀取快取資料夾
+    FILE_SERVE_INTERNAL_PREFIX = "/_protected/"  # nginx 中以 internal 與 alias 對應到上面資料夾的 location
+    
+    # 圖片縮圖（衍生檔）
+    DERIVATIVE_FOLDER = "uploads/derivatives"  # 縮圖以「原圖 hash_寬度.格式」命名
+    THUMBNAIL_WIDTHS = (160, 320, 640, 1280)  # ?w= 對應到不小於它的最小寬度
+    THUMBNAIL_FORMATS = ("avif", "webp")  # 偏好順序，依瀏覽器的 Accept 標頭選擇
+    THUMBNAIL_FALLBACK_FORMATS = ("jpeg", "png")  # Pillow 不支援上面任何格式時，改用其中第一個支援的格式
+    THUMBNAIL_WORKERS = 2  # 產生縮圖的行程數
+    DERIVATIVE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 縮圖資料夾的大小上限，超過時刪除最久未使用的縮圖
+    
+    # 背景工作佇列（jobs 資料表）
+    JOB_WORKERS = 2  # 同時執行的背景工作數
+    JOB_MAX_ATTEMPTS = 5  # 失敗時最多執行的次數（含第一次）
+    JOB_RETRY_BASE_DELAY = 5  # 第 n 次失敗後約等待 base × 2^(n-1) 秒再重試
+    JOB_RETRY_MAX_DELAY = 60 * 60  # 重試等待時間的上限
+    JOB_TIMEOUT = 10 * 60  # 單次執行超過此秒數視為失敗
+    JOB_POLL_INTERVAL = 5  # 沒有新工作通知時，檢查資料表的間隔（其他程序加入的工作、到期的重試）
+    JOB_RETENTION = 7 * 24 * 60 * 60  # 已完成的工作保留的秒數
+    
+    # 多個工作程序（serve.py）
+    SERVER_WORKERS = None  # 工作程序數，None 為可使用的 CPU 數
+    SERVER_GRACEFUL_TIMEOUT = 30  # 結束時等待進行中請求的秒數，逾時的工作程序被強制結束
+    # 程序內快取（檔案與分享連結中繼資料、標籤對照表）的失效通知經由 cache_events 資料表傳給其他工作程序
+    CACHE_SYNC_INTERVAL = 1.0  # 檢查其他程序通知的間隔（秒），也是其他程序看到舊資料的最長時間；None 為停用
+    CACHE_SYNC_RETENTION = 10 * 60  # 通知保留的秒數
     
     @classmethod
     def init(cls):
         os.makedirs(cls.UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(cls.UPLOAD_SESSION_FOLDER, exist_ok=True)
+        os.makedirs(cls.DERIVATIVE_FOLDER, exist_ok=True)
+    
+    @classmethod
+    def db_pragmas(cls, read_only: bool = False) -> list:
+        """回傳每條資料庫連線建立後要執行的 PRAGMA"""
+        pragmas = [
+            f"PRAGMA busy_timeout = {int(cls.DB_BUSY_TIMEOUT)}",
+            f"PRAGMA cache_size = {int(cls.DB_CACHE_SIZE)}",
+            f"PRAGMA mmap_size = {int(cls.DB_MMAP_SIZE)}",
+        ]
+        # journal_mode 記錄在資料庫檔案中，只能由可寫入的連線設定
+        if not read_only:
+            pragmas.insert(0, f"PRAGMA journal_mode = {cls.DB_JOURNAL_MODE}")
+            pragmas.append(f"PRAGMA synchronous = {cls.DB_SYNCHRONOUS}")
+        return pragmas
     
     @classmethod
     def get_file_type(cls, extension: str) -> str:
@@ -52,89 +186,1442 @@ class Config:
         extension = filename.split('.')[-1].lower()
         return any(extension in exts for exts in cls.ALLOWED_EXTENSIONS.values())
 
-# 初始化設定
-Config.init()
+# 安裝在根 logger 上的 AsyncLogHandler，由 initialize() 建立
+log_handler = None
+
+def create_blob_storage() -> BlobStorage:
+    """依 `Config.STORAGE_BACKEND` 建立檔案儲存後端"""
+    if Config.STORAGE_BACKEND == "s3":
+        # 只有使用物件儲存時才需要 httpx
+        from s3_storage import S3Storage
+        return S3Storage(
+            Config.S3_ENDPOINT, Config.S3_BUCKET, Config.S3_ACCESS_KEY, Config.S3_SECRET_KEY,
+            region=Config.S3_REGION, prefix=Config.S3_PREFIX, path_style=Config.S3_PATH_STYLE,
+            cache_dir=Config.S3_CACHE_FOLDER, cache_max_bytes=Config.S3_CACHE_MAX_BYTES,
+            presign_expires=Config.S3_PRESIGN_EXPIRES, multipart_threshold=Config.S3_MULTIPART_THRESHOLD,
+            part_size=Config.S3_PART_SIZE, upload_concurrency=Config.S3_UPLOAD_CONCURRENCY,
+            pool_size=Config.S3_POOL_SIZE, timeout=Config.S3_TIMEOUT,
+            depth=Config.UPLOAD_SHARD_DEPTH, width=Config.UPLOAD_SHARD_WIDTH,
+        )
+    if Config.STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown storage backend: {Config.STORAGE_BACKEND}")
+    return LocalStorage(Config.UPLOAD_FOLDER, Config.UPLOAD_SHARD_DEPTH, Config.UPLOAD_SHARD_WIDTH)
 
-# 建立資料庫連接工廠函數
+# 上傳檔案（blob）的儲存位置，所有讀寫與刪除都經由此物件
+blob_storage = create_blob_storage()
+
+@contextmanager
+def file_lock(path: str):
+    """
+    以 flock 取得跨程序的獨占鎖（程序結束時由系統釋放）；不支援 fcntl 的平台（Windows）不加鎖
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+# 建立資料庫連接工廠函數（同步版本，僅供啟動與維護腳本使用）
 def get_db_connection():
     conn = sqlite3.connect(Config.DB_PATH)
     conn.row_factory = sqlite3.Row  # 使結果以字典形式返回
+    for pragma in Config.db_pragmas():
+        conn.execute(pragma)
     return conn
 
-# 建立資料表
-def init_db():
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # 建立檔案表
-        cursor.execute('''CREATE TABLE IF NOT EXISTS files
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        url TEXT NOT NULL,
-                        filename TEXT NOT NULL,
-                        original_filename TEXT NOT NULL,
-                        size INTEGER NOT NULL,
-                        type TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+DB_WAIT = metrics.Histogram("db_connection_wait_seconds", "等待取得資料庫連線的時間（秒），寫入為等待寫入鎖",
+                            ("mode",))
+DB_HOLD = metrics.Histogram("db_connection_hold_seconds", "借出資料庫連線期間（查詢或交易，含 commit）的時間（秒）",
+                            ("mode",))
+_READ_WAIT, _READ_HOLD = DB_WAIT.labels("read"), DB_HOLD.labels("read")
+_WRITE_WAIT, _WRITE_HOLD = DB_WAIT.labels("write"), DB_HOLD.labels("write")
+
+class Database:
+    """
+    非同步資料庫存取層
+    
+    - 讀取：有上限的唯讀連線池，多個請求可同時查詢
+    - 寫入：單一寫入連線，以鎖序列化所有寫入交易
+    
+    所有查詢都在 aiosqlite 的背景執行緒中執行，不會阻塞事件迴圈。
+    連線池滿載時依先來後到（FIFO）分配連線，避免高併發下部分請求被餓死。
+    等待連線與借出連線的時間記錄在 `db_connection_wait_seconds` / `db_connection_hold_seconds`。
+    """
+    
+    def __init__(self, path: str, pool_size: int):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle: deque = deque()
+        self._waiters: deque = deque()
+        self._reader_conns: list = []
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock: asyncio.Lock | None = None
+        self._open_lock = asyncio.Lock()
+        self._rollback_callbacks: list = []
+        self._commit_callbacks: list = []
+        self._writers_waiting = 0
+    
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+    
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        # 每個語句經由 TimedCursor 執行，超過 Config.SLOW_QUERY_MS 時記錄到慢查詢記錄
+        if read_only:
+            uri = f"file:{Path(self.path).resolve().as_posix()}?mode=ro"
+            conn = await aiosqlite.connect(uri, uri=True, check_same_thread=False, factory=TimedConnection)
+        else:
+            conn = await aiosqlite.connect(self.path, check_same_thread=False, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in Config.db_pragmas(read_only=read_only):
+            await conn.execute(pragma)
+        return conn
+    
+    async def open(self):
+        """建立寫入連線與唯讀連線池（重複呼叫不會重複建立）"""
+        if self.is_open:
+            return
+        async with self._open_lock:
+            if self.is_open:
+                return
+            writer = await self._connect(read_only=False)
+            for _ in range(self.pool_size):
+                conn = await self._connect(read_only=True)
+                self._reader_conns.append(conn)
+                self._idle.append(conn)
+            self._write_lock = asyncio.Lock()
+            self._writer = writer
+            logger.info("資料庫連線池已建立: %s (讀取連線=%s)", self.path, self.pool_size)
+    
+    async def close(self):
+        """關閉所有連線"""
+        if not self.is_open:
+            return
+        for conn in self._reader_conns:
+            await conn.close()
+        await self._writer.close()
+        self._reader_conns = []
+        self._idle.clear()
+        self._waiters.clear()
+        self._writer = None
+        self._write_lock = None
+        # 重新建立鎖，讓連線池可以在新的事件迴圈中再次開啟
+        self._open_lock = asyncio.Lock()
+        logger.info("資料庫連線池已關閉")
+    
+    async def _acquire_reader(self) -> aiosqlite.Connection:
+        if self._idle:
+            return self._idle.popleft()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # 已分配到連線但請求被取消時，把連線交給下一位
+            if waiter.done() and not waiter.cancelled():
+                self._release_reader(waiter.result())
+            raise
+    
+    def _release_reader(self, conn: aiosqlite.Connection):
+        # 直接交給等待最久的請求，不放回閒置佇列，確保 FIFO
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(conn)
+                return
+        self._idle.append(conn)
+    
+    @asynccontextmanager
+    async def reader(self):
+        """從連線池借出一條唯讀連線，用完自動歸還"""
+        await self.open()
+        start = time.perf_counter()
+        conn = await self._acquire_reader()
+        acquired = time.perf_counter()
+        _READ_WAIT.observe(acquired - start)
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+            _READ_HOLD.observe(time.perf_counter() - acquired)
+    
+    @asynccontextmanager
+    async def writer(self):
+        """
+        取得寫入連線並開始一個交易
         
-        # 建立文章表
-        cursor.execute('''CREATE TABLE IF NOT EXISTS notes
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        title TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        以 BEGIN IMMEDIATE 開始，交易一開始就取得 SQLite 的寫入鎖：程序內的鎖只在這個程序內互斥，
+        區塊中的查詢與檢查（例如實體檔案是否存在）因此也不會與其他工作程序的寫入交錯。
+        區塊正常結束時自動 commit，發生例外時自動 rollback。
+        """
+        await self.open()
+        start = time.perf_counter()
+        self._writers_waiting += 1
+        try:
+            await self._write_lock.acquire()
+        finally:
+            self._writers_waiting -= 1
+        acquired = time.perf_counter()
+        _WRITE_WAIT.observe(acquired - start)
+        try:
+            await self._writer.execute("BEGIN IMMEDIATE")
+            yield self._writer
+            await self._writer.commit()
+        except BaseException:
+            await self._writer.rollback()
+            for callback in self._rollback_callbacks:
+                callback()
+            raise
+        else:
+            for callback in self._commit_callbacks:
+                callback()
+        finally:
+            self._write_lock.release()
+            _WRITE_HOLD.observe(time.perf_counter() - acquired)
+    
+    def on_rollback(self, callback):
+        """註冊寫入交易 rollback 後要執行的函式（用來丟棄交易中更新的記憶體快取）"""
+        self._rollback_callbacks.append(callback)
+    
+    def on_commit(self, callback):
+        """註冊寫入交易 commit 後要執行的函式"""
+        self._commit_callbacks.append(callback)
+    
+    def stats(self) -> dict:
+        """連線池的使用狀況：借出中的讀取連線、等待讀取連線與等待寫入鎖的請求數"""
+        return {
+            "pool_size": self.pool_size,
+            "readers_in_use": len(self._reader_conns) - len(self._idle),
+            "reader_waiters": len(self._waiters),
+            "writer_busy": self._write_lock is not None and self._write_lock.locked(),
+            "writer_waiters": self._writers_waiting,
+        }
+
+# 全域資料庫連線池
+db = Database(Config.DB_PATH, Config.DB_READER_POOL_SIZE)
+
+async def get_db() -> Database:
+    """
+    FastAPI 依賴：取得共用的資料庫連線池
+    
+    用法: `db: Database = Depends(get_db)`
+    """
+    await db.open()
+    return db
+
+class CacheSync:
+    """
+    多個工作程序之間的程序內快取失效通知
+    
+    寫入交易中以 `publish` 在 cache_events 資料表加入通知，與資料的變更一起 commit 或 rollback；
+    每個程序的背景工作每隔 `Config.CACHE_SYNC_INTERVAL` 秒讀取其他程序加入的新通知，交給該快取登記的處理函式。
+    通知的 ID 連續遞增，發現中間有缺漏（程序停頓超過保留時間，通知已被刪除）時清除所有快取。
+    """
+    
+    def __init__(self, database: Database):
+        self.db = database
+        self.last_id: int | None = None
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+        self._handlers: dict = {}  # 快取名稱 → handler(keys)
+        self._task: asyncio.Task | None = None
+        self._last_prune = 0.0
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(Config.CACHE_SYNC_INTERVAL)
+    
+    def register(self, name: str, handler):
+        """
+        登記快取的處理函式 handler(keys)：keys 為失效的鍵（字串），空 tuple 表示整個快取失效；
+        handler 可以是 async 函式
+        """
+        self._handlers[name] = handler
+    
+    async def publish(self, conn: aiosqlite.Connection, name: str, *keys):
+        """在目前的寫入交易中通知其他程序；不指定 keys 時整個快取失效"""
+        if not self.enabled:
+            return
+        pid, now = os.getpid(), time.time()
+        await conn.executemany("INSERT INTO cache_events (cache, key, pid, created_at) VALUES (?, ?, ?, ?)",
+                               [(name, str(key), pid, now) for key in keys] or [(name, None, pid, now)])
+        self.published += 1
+    
+    async def start(self):
+        """從目前最新的通知開始接收（應用程式啟動時呼叫，之前的通知與空的快取無關）"""
+        if not self.enabled or self._task is not None:
+            return
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("SELECT MAX(id) FROM cache_events")
+            self.last_id = (await cursor.fetchone())[0] or 0
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(Config.CACHE_SYNC_INTERVAL)
+            try:
+                await self.poll()
+                if time.time() - self._last_prune > Config.CACHE_SYNC_RETENTION / 2:
+                    await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("讀取快取失效通知失敗: %s", e)
+    
+    async def poll(self) -> int:
+        """
+        套用其他程序加入的新通知
         
-        # 建立標籤表
-        cursor.execute('''CREATE TABLE IF NOT EXISTS tags
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL UNIQUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        Returns:
+            套用的通知數
+        """
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("SELECT id, cache, key, pid FROM cache_events WHERE id > ? ORDER BY id",
+                                        (self.last_id,))
+            rows = await cursor.fetchall()
+        if not rows:
+            return 0
         
-        # 建立文章標籤關聯表
-        cursor.execute('''CREATE TABLE IF NOT EXISTS note_tags
-                        (note_id INTEGER,
-                        tag_id INTEGER,
-                        FOREIGN KEY (note_id) REFERENCES notes (id),
-                        FOREIGN KEY (tag_id) REFERENCES tags (id),
-                        PRIMARY KEY (note_id, tag_id))''')
+        pid = os.getpid()
+        if rows[0][0] != self.last_id + 1:
+            logger.warning("快取失效通知有缺漏 (%s → %s)，清除所有快取", self.last_id, rows[0][0])
+            self.resets += 1
+            pending = dict.fromkeys(self._handlers)
+        else:
+            # 同一個快取的通知合併處理；None 表示整個快取失效
+            pending = {}
+            for _, name, key, source in rows:
+                if source == pid:
+                    continue
+                if key is None:
+                    pending[name] = None
+                elif pending.get(name, ()) is not None:
+                    pending.setdefault(name, set()).add(key)
+        for name, keys in pending.items():
+            handler = self._handlers.get(name)
+            if handler is not None:
+                result = handler(tuple(keys) if keys is not None else ())
+                if inspect.isawaitable(result):
+                    await result
         
-        # 建立檔案分享表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS file_shares (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER NOT NULL,
-                share_code TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (file_id) REFERENCES files (id)
-            )
-        """)
+        self.last_id = rows[-1][0]
+        applied = sum(1 for row in rows if row[3] != pid)
+        self.received += applied
+        return applied
+    
+    async def prune(self):
+        """刪除超過保留時間的通知"""
+        self._last_prune = time.time()
+        async with self.db.writer() as conn:
+            await conn.execute("DELETE FROM cache_events WHERE created_at < ?",
+                               (time.time() - Config.CACHE_SYNC_RETENTION,))
+    
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pid": os.getpid(),
+            "last_id": self.last_id,
+            "published": self.published,
+            "received": self.received,
+            "resets": self.resets,
+        }
+
+# 程序內快取的跨程序失效通知（快取在定義處登記）
+cache_sync = CacheSync(db)
+
+class TagDictionary:
+    """
+    行程內的標籤名稱 ↔ ID 對照表
+    
+    啟動時在背景建立（start_loading），之後在寫入交易中新增、改名或刪除標籤時同步更新，
+    寫入文章時不必逐一查詢標籤 ID；建立完成前直接查詢資料庫。
+    改動過對照表的寫入交易 rollback 時整個對照表失效，下次自動完成時在背景重新建立，不會留下未提交的標籤；只調整了使用次數的交易 rollback 時把次數改回去，
+    沒有碰到標籤的交易（例如回應 404 的請求）rollback 時不受影響。
+    
+    `index` 是同一份資料的自動完成索引（含使用次數），由相同的寫入路徑維護。
+    """
+    
+    def __init__(self):
+        self.by_name: dict = {}
+        self.by_id: dict = {}
+        self.index = TagSearchIndex()
+        self.loaded = False
+        # 目前的寫入交易是否新增、改名或刪除了標籤，以及調整過的使用次數（commit 後清除）
+        self._dirty = False
+        self._pending_counts: dict = {}
+        # 背景建立的工作；reset 時遞增世代，丟棄建立到一半、已經過時的結果
+        self._loading: asyncio.Task | None = None
+        self._generation = 0
+    
+    @staticmethod
+    def _build(rows: list) -> tuple:
+        index = TagSearchIndex()
+        index.build(rows)
+        return {name: tag_id for tag_id, name, _ in rows}, {tag_id: name for tag_id, name, _ in rows}, index
+    
+    @staticmethod
+    async def _select_all(conn: aiosqlite.Connection) -> list:
+        cursor = await conn.execute("SELECT id, name, note_count FROM tags")
+        return [tuple(row) for row in await cursor.fetchall()]
+    
+    async def load(self, database: Database):
+        """
+        建立對照表與自動完成索引
         
-        # 移轉舊的圖片資料到新的檔案表
+        建立索引（正規化、拼音）在標籤很多時需要數秒，以唯讀連線的快照在執行緒中進行，不持有寫入鎖；
+        完成後在寫入鎖內重新讀取標籤，補上建立期間其他交易新增、改名、刪除的標籤與使用次數的變動。
+        """
+        generation = self._generation
+        async with database.reader() as conn:
+            snapshot = await self._select_all(conn)
+        by_name, by_id, index = await asyncio.to_thread(self._build, snapshot)
+        async with database.writer() as conn:
+            if generation != self._generation:
+                return
+            snapshot = {tag_id: (name, count) for tag_id, name, count in snapshot}
+            deltas = {}
+            current = set()
+            for tag_id, name, count in await self._select_all(conn):
+                current.add(tag_id)
+                old = snapshot.get(tag_id)
+                if old is None:
+                    index.add(tag_id, name, count)
+                else:
+                    if old[0] != name:
+                        # 名稱可能已由其他標籤取用（例如兩個標籤互換名稱）
+                        if by_name.get(old[0]) == tag_id:
+                            del by_name[old[0]]
+                        index.rename(tag_id, name)
+                    if old[1] != count:
+                        deltas[tag_id] = count - old[1]
+                by_name[name] = tag_id
+                by_id[tag_id] = name
+            for tag_id in snapshot.keys() - current:
+                if by_name.get(by_id[tag_id]) == tag_id:
+                    del by_name[by_id[tag_id]]
+                del by_id[tag_id]
+                index.remove(tag_id)
+            index.adjust_counts(deltas)
+            self.by_name, self.by_id, self.index = by_name, by_id, index
+            self.loaded = True
+    
+    def start_loading(self, database: Database) -> asyncio.Task:
+        """在背景建立對照表（已在建立中時不重複建立），回傳建立的工作"""
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(self._load_in_background(database))
+        return self._loading
+    
+    async def _load_in_background(self, database: Database):
+        if self.loaded:
+            return
+        start = time.perf_counter()
         try:
-            cursor.execute("SELECT url, filename FROM images")
-            old_images = cursor.fetchall()
-            
-            for image in old_images:
-                # 檢查檔案是否已存在於新表中
-                cursor.execute("SELECT id FROM files WHERE filename = ?", (image['filename'],))
-                if not cursor.fetchone():
-                    # 獲取檔案大小
-                    file_path = os.path.join(Config.UPLOAD_FOLDER, image['filename'])
-                    file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
-                    
-                    # 插入到新表中
-                    cursor.execute(
-                        "INSERT INTO files (url, filename, original_filename, size, type) VALUES (?, ?, ?, ?, ?)",
-                        (image['url'], image['filename'], image['filename'], file_size, 'image')
-                    )
-            
-            # 刪除舊的圖片表
-            cursor.execute("DROP TABLE IF EXISTS images")
-            
+            await self.load(database)
         except Exception as e:
-            logger.error(f"移轉圖片資料時發生錯誤: {str(e)}")
+            logger.error("載入標籤對照表失敗: %s", e, exc_info=True)
+            return
+        if self.loaded:
+            logger.info("已載入標籤對照表: %s 個標籤 (%.2fs)", len(self.by_id), time.perf_counter() - start)
+    
+    async def stop(self):
+        """停止建立中的背景工作（關閉時呼叫）"""
+        if self._loading is not None:
+            self._loading.cancel()
+            await asyncio.gather(self._loading, return_exceptions=True)
+            self._loading = None
+    
+    def reset(self):
+        self.by_name = {}
+        self.by_id = {}
+        self.index = TagSearchIndex()
+        self.loaded = False
+        self._dirty = False
+        self._pending_counts = {}
+        self._generation += 1
+    
+    def commit(self):
+        """寫入交易 commit 後呼叫"""
+        self._dirty = False
+        self._pending_counts = {}
+    
+    def rollback(self):
+        """寫入交易 rollback 後呼叫：丟棄交易中的變動"""
+        if self._dirty:
+            self.reset()
+        elif self._pending_counts:
+            self.index.adjust_counts({tag_id: -delta for tag_id, delta in self._pending_counts.items()})
+            self._pending_counts = {}
+    
+    async def resolve(self, conn: aiosqlite.Connection, names: list) -> dict:
+        """
+        取得標籤名稱對應的 ID，不存在的標籤在目前的寫入交易中建立
+        
+        Returns:
+            {名稱: ID}，依 names 的順序且不重複
+        """
+        names = list(dict.fromkeys(names))
+        if not self.loaded:
+            # 對照表還在建立中：直接查詢資料庫，建立完成時會補上這段期間新增的標籤
+            resolved = await self._insert_missing(conn, names)
+            return {name: resolved[name] for name in names}
+        known = {name: self.by_name[name] for name in names if name in self.by_name}
+        if known:
+            # 其他工作程序刪除或改名的標籤要等下次同步才會通知到這個程序：在寫入交易中確認 ID 與名稱仍一致，
+            # 不一致的標籤先依資料庫更新對照表，再當作不存在的標籤重新取得
+            cursor = await conn.execute("SELECT id, name FROM tags WHERE id IN (SELECT value FROM json_each(?))",
+                                        (json.dumps(list(known.values())),))
+            current = {tag_id: name for tag_id, name in await cursor.fetchall()}
+            stale = [tag_id for name, tag_id in known.items() if current.get(tag_id) != name]
+            if stale:
+                await self.refresh(conn, stale)
+        missing = [name for name in names if name not in self.by_name]
+        if missing:
+            self._dirty = True
+            for name, tag_id in (await self._insert_missing(conn, missing)).items():
+                if tag_id in self.by_id:
+                    # 其他工作程序改成這個名稱的標籤
+                    self.rename(tag_id, name)
+                    continue
+                self.by_name[name] = tag_id
+                self.by_id[tag_id] = name
+                self.index.add(tag_id, name)
+        return {name: self.by_name[name] for name in names}
+    
+    @staticmethod
+    async def _insert_missing(conn: aiosqlite.Connection, names: list) -> dict:
+        """建立不存在的標籤，回傳 {名稱: ID}"""
+        cursor = await conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in names])
+        inserted = cursor.rowcount > 0
+        cursor = await conn.execute("SELECT id, name FROM tags WHERE name IN (SELECT value FROM json_each(?))",
+                                    (json.dumps(names),))
+        resolved = {name: tag_id for tag_id, name in await cursor.fetchall()}
+        if inserted:
+            # 其他程序把新的標籤加入自己的對照表與自動完成索引
+            await cache_sync.publish(conn, "tags", *resolved.values())
+        return resolved
+    
+    def rename(self, tag_id: int, name: str):
+        if not self.loaded:
+            return
+        self._dirty = True
+        old_name = self.by_id.get(tag_id)
+        # 舊名稱可能已由其他標籤取用（其他工作程序的改名）
+        if old_name is not None and self.by_name.get(old_name) == tag_id:
+            del self.by_name[old_name]
+        self.by_name[name] = tag_id
+        self.by_id[tag_id] = name
+        self.index.rename(tag_id, name)
+    
+    def remove(self, tag_id: int):
+        if not self.loaded:
+            return
+        self._dirty = True
+        name = self.by_id.pop(tag_id, None)
+        if name is not None and self.by_name.get(name) == tag_id:
+            del self.by_name[name]
+        self.index.remove(tag_id)
+    
+    @staticmethod
+    async def search_database(conn: aiosqlite.Connection, query: str, limit: int) -> list:
+        """
+        索引建立完成前的自動完成：以 LIKE 比對名稱（掃描標籤表），名稱以關鍵字開頭的在前，再依使用次數排序
+        
+        Returns:
+            [{"id", "name", "note_count"}]
+        """
+        contains = _like_pattern(query.strip())
+        cursor = await conn.execute("""
+            SELECT id, name, note_count FROM tags
+            WHERE name LIKE ? ESCAPE '\\'
+            ORDER BY name LIKE ? ESCAPE '\\' DESC, note_count DESC, length(name), name
+            LIMIT ?
+        """, (contains, contains[1:], max(1, min(limit, TOP_CACHE_SIZE))))
+        return [{"id": tag_id, "name": name, "note_count": count} for tag_id, name, count in await cursor.fetchall()]
+    
+    async def refresh(self, conn: aiosqlite.Connection, tag_ids: list):
+        """
+        依資料庫目前的內容更新指定的標籤（其他程序新增、改名或刪除的標籤），在寫入交易中呼叫
+        """
+        if not self.loaded:
+            return
+        self._dirty = True
+        cursor = await conn.execute("SELECT id, name, note_count FROM tags WHERE id IN (SELECT value FROM json_each(?))",
+                                    (json.dumps(tag_ids),))
+        rows = {tag_id: (name, count) for tag_id, name, count in await cursor.fetchall()}
+        # 先刪除，名稱被刪除的標籤改用時才不會衝突
+        for tag_id in tag_ids:
+            if tag_id not in rows:
+                self.remove(tag_id)
+        for tag_id, (name, count) in rows.items():
+            if self.by_id.get(tag_id) == name:
+                continue
+            if tag_id in self.by_id:
+                self.rename(tag_id, name)
+            else:
+                self.by_name[name] = tag_id
+                self.by_id[tag_id] = name
+                self.index.add(tag_id, name, count)
+    
+    def adjust_counts(self, deltas: dict):
+        """文章的標籤關聯變動後，同步索引中的使用次數（資料庫由觸發器維護）"""
+        if self.loaded:
+            self.index.adjust_counts(deltas)
+            for tag_id, delta in deltas.items():
+                self._pending_counts[tag_id] = self._pending_counts.get(tag_id, 0) + delta
+
+tag_dictionary = TagDictionary()
+db.on_commit(tag_dictionary.commit)
+db.on_rollback(tag_dictionary.rollback)
+async def _sync_tags(keys: tuple):
+    """
+    其他程序新增、改名或刪除標籤時，依通知中的標籤 ID 更新對照表；沒有指定標籤（通知有缺漏）時在背景重新建立。
+    文章數的變動不通知，自動完成的排序在重新載入前可能略有落差
+    """
+    if not keys:
+        tag_dictionary.reset()
+        tag_dictionary.start_loading(db)
+        return
+    if not tag_dictionary.loaded:
+        return
+    # 在寫入鎖內更新，與這個程序的寫入交易不會交錯
+    async with db.writer() as conn:
+        await tag_dictionary.refresh(conn, [int(key) for key in keys])
+
+cache_sync.register("tags", _sync_tags)
+
+async def set_note_tags(conn: aiosqlite.Connection, note_id: int, names: list, new_note: bool = False) -> tuple:
+    """
+    在目前的寫入交易中把文章的標籤設為 names
+    
+    只寫入新增與移除的關聯（executemany），標籤沒有變動時不會有任何寫入。
+    
+    Returns:
+        (新增的標籤 ID, 移除的標籤 ID)
+    """
+    wanted = set((await tag_dictionary.resolve(conn, names)).values())
+    current = set()
+    if not new_note:
+        cursor = await conn.execute("SELECT tag_id FROM note_tags WHERE note_id = ?", (note_id,))
+        current = {row[0] for row in await cursor.fetchall()}
+    
+    added = wanted - current
+    removed = current - wanted
+    if removed:
+        await conn.executemany("DELETE FROM note_tags WHERE note_id = ? AND tag_id = ?",
+                               [(note_id, tag_id) for tag_id in removed])
+    if added:
+        await conn.executemany("INSERT INTO note_tags (note_id, tag_id) VALUES (?, ?)",
+                               [(note_id, tag_id) for tag_id in added])
+    tag_dictionary.adjust_counts({**{tag_id: 1 for tag_id in added}, **{tag_id: -1 for tag_id in removed}})
+    return added, removed
+
+class MetadataCache:
+    """
+    有容量上限的 LRU 快取，項目超過 TTL 後失效
+    
+    只在事件迴圈中使用，不需要加鎖。查詢資料庫前先以 `version` 取得目前版本，
+    回存時版本若已被 `invalidate` 改變就不寫入，避免查詢途中被刪除的資料又被放回快取。
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+    
+    def get(self, key):
+        """取得快取的值，不存在或已過期時回傳 None"""
+        item = self._items.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+    
+    def set(self, key, value, version: int):
+        if version != self.version:
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+    
+    def invalidate(self, *keys):
+        self.version += 1
+        for key in keys:
+            self._items.pop(key, None)
+    
+    def clear(self):
+        self.version += 1
+        self._items.clear()
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+# filename → 檔案中繼資料；share_code → 分享的檔案
+file_cache = MetadataCache(Config.METADATA_CACHE_SIZE, Config.METADATA_CACHE_TTL)
+share_cache = MetadataCache(Config.METADATA_CACHE_SIZE, Config.METADATA_CACHE_TTL)
+
+def _invalidate_handler(cache: MetadataCache):
+    return lambda keys: cache.invalidate(*keys) if keys else cache.clear()
+
+cache_sync.register("files", _invalidate_handler(file_cache))
+cache_sync.register("shares", _invalidate_handler(share_cache))
+
+class ORJSONResponse(JSONResponse):
+    """以 orjson 序列化的 JSON 回應，大型列表比標準 json 模組快得多"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# 文章摘要
+#
+# 列表只需要標題與摘要，寫入文章時一併計算並儲存，列表查詢不必讀取整篇 Markdown。
+
+_MARKDOWN_SYNTAX = [
+    (re.compile(r"^\s*(```|~~~).*$", re.M), ""),  # 程式碼區塊的圍欄
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),  # 圖片只保留替代文字
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),  # 連結只保留文字
+    (re.compile(r"<[^>]+>"), ""),  # HTML 標籤
+    (re.compile(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", re.M), ""),  # 標題、引言與清單符號
+    (re.compile(r"[*_~`]+"), ""),  # 強調符號
+]
+
+def summarize_note(content: str) -> dict:
+    """
+    計算文章的摘要欄位
+    
+    Returns:
+        - **title**: 第一個非空白行（去除 Markdown 符號）
+        - **excerpt**: 其餘內容的純文字開頭
+        - **size**: 內容的 UTF-8 位元組數
+    """
+    text = content
+    for pattern, replacement in _MARKDOWN_SYNTAX:
+        text = pattern.sub(replacement, text)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return {
+        "title": lines[0][:Config.NOTE_TITLE_LENGTH] if lines else "",
+        "excerpt": " ".join(lines[1:])[:Config.NOTE_EXCERPT_LENGTH],
+        "size": len(content.encode("utf-8"))
+    }
+
+# 文章列表可選擇的欄位；未指定時回傳 NOTE_DEFAULT_FIELDS，與舊版相容
+NOTE_FIELDS = ("id", "title", "excerpt", "size", "created_at", "updated_at", "tags", "content")
+NOTE_DEFAULT_FIELDS = ("id", "content", "created_at", "tags")
+
+def parse_note_fields(fields: str | None) -> tuple:
+    """
+    解析 `fields=` 參數（以逗號分隔）
+    
+    Raises:
+        ValueError: 包含不支援的欄位
+    """
+    if not fields:
+        return NOTE_DEFAULT_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in NOTE_FIELDS]
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+#
+# 游標是 (created_at, id) 的不透明編碼，列表依 `created_at DESC, id DESC` 排序，
+# 下一頁只需要查詢比游標更舊的資料，不必像 OFFSET 一樣掃過前面所有列。
+
+def encode_cursor(created_at, row_id: int) -> str:
+    """將排序鍵編碼為分頁游標"""
+    raw = json.dumps([created_at, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """解碼分頁游標，格式錯誤時拋出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+# 文章查詢輔助函數
+async def fetch_notes_page(conn: aiosqlite.Connection, limit: int, offset: int = 0,
+                           tag_id: int = None, tag_name: str = None,
+                           before: tuple = None, fields: tuple = NOTE_DEFAULT_FIELDS) -> tuple:
+    """
+    載入一頁文章及其所有標籤
+    
+    不論頁面大小，固定只執行兩次查詢：一次取得文章，一次以 `IN (...)` 取得這些文章的標籤。
+    可用 tag_id 或 tag_name 過濾文章；before 為 decode_cursor 的結果，只回傳更舊的文章，
+    此時游標已決定頁面位置，offset 會被忽略。
+    fields 為 NOTE_FIELDS 的子集，只查詢需要的欄位（未要求 content 時不會讀取文章內容）。
+    
+    Returns:
+        (文章字典列表, 下一頁游標)，每篇文章的 tags 為 `{"id", "name"}` 列表；
+        沒有下一頁時游標為 None
+    """
+    conditions = []
+    params = []
+    if tag_id is not None:
+        conditions.append("n.id IN (SELECT note_id FROM note_tags WHERE tag_id = ?)")
+        params.append(tag_id)
+    elif tag_name is not None:
+        conditions.append("""n.id IN (SELECT nt.note_id FROM note_tags nt
+                                      JOIN tags t ON nt.tag_id = t.id
+                                      WHERE t.name = ?)""")
+        params.append(tag_name)
+    if before is not None:
+        conditions.append("(n.created_at, n.id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    # id 與 created_at 一定要查詢，用來產生游標與載入標籤
+    columns = [f for f in fields if f not in ("id", "created_at", "tags")]
+    select = ", ".join(f"n.{c}" for c in ("id", "created_at", *columns))
+    
+    # 多取一筆用來判斷是否還有下一頁
+    cursor = await conn.execute(f"""
+        SELECT {select}
+        FROM markdown_notes n
+        {where}
+        ORDER BY n.created_at DESC, n.id DESC
+        LIMIT ? OFFSET ?
+    """, (*params, limit + 1, 0 if before is not None else offset))
+    rows = await cursor.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    
+    notes = [dict(zip(("id", "created_at", *columns), row)) for row in rows]
+    if "tags" in fields:
+        await attach_note_tags(conn, notes)
+    # 依要求的欄位順序輸出
+    notes = [{f: note[f] for f in fields} for note in notes]
+    return notes, next_cursor
+
+async def attach_note_tags(conn: aiosqlite.Connection, notes: list):
+    """以單一查詢載入多篇文章的標籤，寫入每篇文章的 tags 欄位（`{"id", "name"}` 列表）"""
+    by_id = {}
+    for note in notes:
+        note["tags"] = []
+        by_id[note["id"]] = note
+    if not by_id:
+        return
+    
+    # 以 JSON 陣列傳入文章 ID，SQL 文字固定，也不受綁定參數數量上限影響
+    cursor = await conn.execute("""
+        SELECT nt.note_id, t.id, t.name
+        FROM note_tags nt
+        JOIN tags t ON t.id = nt.tag_id
+        WHERE nt.note_id IN (SELECT value FROM json_each(?))
+        ORDER BY nt.note_id, nt.tag_id
+    """, (json.dumps(list(by_id)),))
+    for note_id, tag_id, name in await cursor.fetchall():
+        by_id[note_id]["tags"].append({"id": tag_id, "name": name})
+
+async def import_notes_batch(conn: aiosqlite.Connection, notes: list) -> int:
+    """
+    在目前的寫入交易中批次新增文章與標籤
+    
+    - **notes**: `{"content", "tags", "created_at", "updated_at"}` 字典列表，
+      tags 為標籤名稱列表，時間可為 None（使用目前時間）
+    
+    所有標籤名稱只解析一次，文章、標籤與關聯都以 executemany 寫入。
+    
+    Returns:
+        新增的文章數
+    """
+    if not notes:
+        return 0
+    
+    await conn.executemany("""
+        INSERT INTO markdown_notes (content, title, excerpt, size, created_at, updated_at)
+        VALUES (:content, :title, :excerpt, :size,
+                COALESCE(:created_at, CURRENT_TIMESTAMP), COALESCE(:updated_at, :created_at, CURRENT_TIMESTAMP))
+    """, [{
+        "content": note["content"],
+        "created_at": note.get("created_at"),
+        "updated_at": note.get("updated_at"),
+        **summarize_note(note["content"])
+    } for note in notes])
+    # 持有寫入鎖的單一 executemany 取得的 rowid 是連續的
+    cursor = await conn.execute("SELECT last_insert_rowid()")
+    last_id = (await cursor.fetchone())[0]
+    first_id = last_id - len(notes) + 1
+    
+    names = sorted({name for note in notes for name in note.get("tags") or []})
+    if names:
+        tag_ids = await tag_dictionary.resolve(conn, names)
+        links = [
+            (first_id + index, tag_ids[name])
+            for index, note in enumerate(notes)
+            for name in set(note.get("tags") or [])
+        ]
+        await conn.executemany("INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)", links)
+        tag_dictionary.adjust_counts(Counter(tag_id for _, tag_id in links))
+    return len(notes)
+
+# 全文搜尋
+#
+# notes_fts 是 markdown_notes.content 的 FTS5 索引，使用 trigram 分詞器：
+# 中文沒有空白分詞，trigram 能對任意三個字以上的子字串建立索引。
+# 少於三個字的關鍵字無法用索引比對，改以 LIKE 在結果上過濾。
+
+SEARCH_MIN_TERM_LENGTH = 3
+SNIPPET_MARK = ("<mark>", "</mark>")
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _excerpt(content: str, term: str, width: int = 32) -> str:
+    """在文章中找出關鍵字並擷取前後文，供無法使用 FTS snippet 的查詢使用"""
+    index = content.lower().find(term.lower())
+    if index < 0:
+        return content[:width * 2]
+    start = max(0, index - width)
+    end = min(len(content), index + len(term) + width)
+    matched = content[index:index + len(term)]
+    return ("…" if start > 0 else "") + content[start:index] + SNIPPET_MARK[0] + matched + \
+        SNIPPET_MARK[1] + content[index + len(term):end] + ("…" if end < len(content) else "")
+
+def _phrase(term: str) -> str:
+    # 每個關鍵字都當成一個片語，避免使用者輸入被解讀為 FTS5 語法
+    return '"' + term.replace('"', '""') + '"'
+
+async def _expand_short_term(conn: aiosqlite.Connection, term: str) -> list | None:
+    """
+    兩個字的關鍵字展開成索引中以它開頭的三字組（trigram 索引無法直接比對少於三個字的片語）
+
+    Returns:
+        三字組列表，空列表表示沒有文章包含這個關鍵字；超過 `Config.SEARCH_MAX_EXPANSIONS` 個時為 None
+    """
+    prefix = term.lower()
+    cursor = await conn.execute("SELECT term FROM notes_fts_vocab WHERE term >= ? AND term < ? LIMIT ?",
+                                (prefix, prefix + "\U0010ffff", Config.SEARCH_MAX_EXPANSIONS + 1))
+    grams = [row[0] for row in await cursor.fetchall()]
+    return grams if len(grams) <= Config.SEARCH_MAX_EXPANSIONS else None
+
+async def search_note_index(conn: aiosqlite.Connection, query: str, limit: int, offset: int = 0,
+                            tag_name: str = None) -> list:
+    """
+    全文搜尋文章
+    
+    以空白分隔的關鍵字全部都要出現（AND）。符合的文章不超過 `Config.SEARCH_RANK_WINDOW` 筆時依 bm25 相關度排序；
+    超過時（常見詞）不計算相關度，依新到舊排序，score 為 None，每個請求的成本不隨符合數增加。
+    兩個字的關鍵字展開成以它開頭的三字組後由索引比對；一個字（或展開過多）的關鍵字逐篇比對，
+    只有這類關鍵字時依建立時間排序，score 為 None。
+    
+    Returns:
+        文章字典列表，包含 id、created_at、snippet、score 與 tags
+    """
+    groups = []
+    short = []
+    for term in query.split():
+        if len(term) >= SEARCH_MIN_TERM_LENGTH:
+            groups.append(_phrase(term))
+            continue
+        grams = await _expand_short_term(conn, term) if len(term) == SEARCH_MIN_TERM_LENGTH - 1 else None
+        if grams is None:
+            short.append(term)
+        elif not grams:
+            return []
+        else:
+            groups.append("(" + " OR ".join(_phrase(gram) for gram in grams) + ")")
+    
+    conditions = []
+    params = []
+    for term in short:
+        conditions.append("n.content LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(term))
+    if tag_name is not None:
+        conditions.append("""n.id IN (SELECT nt.note_id FROM note_tags nt
+                                      JOIN tags t ON nt.tag_id = t.id
+                                      WHERE t.name = ?)""")
+        params.append(tag_name)
+    
+    if groups:
+        match = " AND ".join(groups)
+        where = "".join(f" AND {c}" for c in conditions)
+        
+        # bm25 必須對每一筆符合的文章計分；只讀取索引判斷符合的文章是否超過排序範圍（最多走過 N 筆）
+        cursor = await conn.execute("SELECT rowid FROM notes_fts WHERE notes_fts MATCH ? LIMIT 1 OFFSET ?",
+                                    (match, Config.SEARCH_RANK_WINDOW))
+        ranked = await cursor.fetchone() is None
         
+        cursor = await conn.execute(f"""
+            SELECT n.id, n.created_at, {"bm25(notes_fts)" if ranked else "NULL"} AS score,
+                   snippet(notes_fts, 0, ?, ?, '…', 32) AS snippet
+            FROM notes_fts
+            JOIN markdown_notes n ON n.id = notes_fts.rowid
+            WHERE notes_fts MATCH ?{where}
+            ORDER BY {"score" if ranked else "notes_fts.rowid DESC"}
+            LIMIT ? OFFSET ?
+        """, (*SNIPPET_MARK, match, *params, limit, offset))
+        notes = [{"id": row[0], "created_at": row[1], "score": row[2], "snippet": row[3]}
+                 for row in await cursor.fetchall()]
+    else:
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = await conn.execute(f"""
+            SELECT n.id, n.created_at, n.content
+            FROM markdown_notes n
+            {where}
+            ORDER BY n.created_at DESC, n.id DESC
+            LIMIT ? OFFSET ?
+        """, (*params, limit, offset))
+        notes = [{"id": row[0], "created_at": row[1], "score": None,
+                  "snippet": _excerpt(row[2], short[0]) if short else row[2][:64]}
+                 for row in await cursor.fetchall()]
+    
+    await attach_note_tags(conn, notes)
+    return notes
+
+def rebuild_search_index():
+    """依 markdown_notes 重建全文搜尋索引（供維護指令使用）"""
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('optimize')")
         conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM markdown_notes").fetchone()[0]
+    finally:
+        conn.close()
+
+# 內容定址儲存
+#
+# 上傳檔案以「內容 hash + 副檔名」命名，相同內容只儲存一份實體檔案（blob）。
+# blobs 資料表記錄每個 blob 被多少筆 files 記錄引用，引用數歸零時才刪除實體檔案。
+
+async def acquire_blob(conn: aiosqlite.Connection, filename: str, size: int):
+    """增加 blob 的引用數（不存在時建立記錄），須在寫入交易中呼叫"""
+    await conn.execute("""
+        INSERT INTO blobs (filename, size, ref_count) VALUES (?, ?, 1)
+        ON CONFLICT (filename) DO UPDATE SET ref_count = ref_count + 1
+    """, (filename, size))
+
+async def release_blob(conn: aiosqlite.Connection, filename: str) -> bool:
+    """
+    減少 blob 的引用數，須在寫入交易中呼叫
+    
+    Returns:
+        引用數歸零（記錄已刪除、實體檔案可以回收）時為 True
+    """
+    await conn.execute("UPDATE blobs SET ref_count = ref_count - 1 WHERE filename = ?", (filename,))
+    cursor = await conn.execute("DELETE FROM blobs WHERE filename = ? AND ref_count <= 0", (filename,))
+    return cursor.rowcount > 0
+
+def collect_blob_garbage(min_age_seconds: int = 3600) -> dict:
+    """
+    清理儲存後端中沒有被引用的檔案（供維護指令使用）
+    
+    上傳中斷留下的暫存檔、以及沒有 blobs 記錄的 blob 都會被刪除。
+    只處理修改時間超過 min_age_seconds 的檔案，避免刪到正在上傳中的檔案；建議在離峰時段執行。
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("DELETE FROM blobs WHERE ref_count <= 0")
+        conn.commit()
+        referenced = {row[0] for row in conn.execute("SELECT filename FROM blobs")}
+    finally:
+        conn.close()
+    
+    removed = {"temp_files": 0, "orphan_blobs": 0, "bytes": 0}
+    cutoff = time.time() - min_age_seconds
+    for entry in blob_storage.iter_temp_files():
+        try:
+            stat = entry.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+        removed["temp_files"] += 1
+        removed["bytes"] += stat.st_size
+        logger.info("已清理暫存檔: %s", entry.name)
+    
+    # 本機儲存時分層與平面配置（尚未遷移）的檔案都會列出
+    for name, size, mtime in blob_storage.list_blobs():
+        if name in referenced or mtime > cutoff:
+            continue
+        if blob_storage.delete(name):
+            removed["orphan_blobs"] += 1
+            removed["bytes"] += size
+            logger.info("已清理未引用的檔案: %s", name)
+    return removed
+
+def collect_expired_upload_sessions() -> int:
+    """
+    清除閒置超過 `Config.UPLOAD_SESSION_TTL` 的續傳上傳工作階段及其分段檔案
+    
+    沒有對應資料庫記錄的分段資料夾（例如程序中斷留下的）也會一併清除。
+    
+    Returns:
+        清除的工作階段數量
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("DELETE FROM upload_sessions WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+        active = {row[0] for row in conn.execute("SELECT id FROM upload_sessions")}
+    finally:
+        conn.close()
+    
+    removed = 0
+    for entry in os.scandir(Config.UPLOAD_SESSION_FOLDER):
+        if entry.is_dir() and entry.name not in active:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+            logger.info("已清除過期的上傳工作階段: %s", entry.name)
+    return removed
+
+# 資料庫結構版本遷移
+#
+# 每個遷移以 (版本, 說明, 函式) 登記，目前版本記錄在 `PRAGMA user_version`。
+# init_db 只會執行版本號大於目前版本的遷移，每個遷移在獨立交易中完成。
+# 修改資料表結構時請新增遷移，不要改動已發布的遷移。
+
+def _migrate_base_schema(cursor):
+    """建立基本資料表（既有資料庫中已存在的表會被略過）"""
+    # 檔案表
+    cursor.execute('''CREATE TABLE IF NOT EXISTS files
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    original_filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # 文章表
+    cursor.execute('''CREATE TABLE IF NOT EXISTS markdown_notes
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # 標籤表
+    cursor.execute('''CREATE TABLE IF NOT EXISTS tags
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # 文章標籤關聯表
+    cursor.execute('''CREATE TABLE IF NOT EXISTS note_tags
+                    (note_id INTEGER,
+                    tag_id INTEGER,
+                    PRIMARY KEY (note_id, tag_id),
+                    FOREIGN KEY (note_id) REFERENCES markdown_notes(id) ON DELETE CASCADE,
+                    FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE)''')
+    
+    # 檔案分享表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS file_shares (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL,
+            share_code TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+    """)
+
+def _migrate_legacy_images(cursor):
+    """移轉舊的圖片資料到新的檔案表"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'images'")
+    if not cursor.fetchone():
+        return
+    
+    cursor.execute("SELECT url, filename FROM images")
+    for image in cursor.fetchall():
+        # 檢查檔案是否已存在於新表中
+        cursor.execute("SELECT id FROM files WHERE filename = ?", (image['filename'],))
+        if not cursor.fetchone():
+            # 獲取檔案大小
+            file_path = os.path.join(Config.UPLOAD_FOLDER, image['filename'])
+            file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            
+            # 插入到新表中
+            cursor.execute(
+                "INSERT INTO files (url, filename, original_filename, size, type) VALUES (?, ?, ?, ?, ?)",
+                (image['url'], image['filename'], image['filename'], file_size, 'image')
+            )
+    
+    # 刪除舊的圖片表
+    cursor.execute("DROP TABLE images")
+
+def _migrate_pagination_indexes(cursor):
+    """建立游標分頁使用的複合索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_markdown_notes_created ON markdown_notes (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags (tag_id, note_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_created ON files (created_at, id)")
+
+def _migrate_note_search(cursor):
+    """
+    全文搜尋索引改由遷移 12（_migrate_note_search_suffix）建立
+
+    遷移 12 會刪除並重建整個索引，這裡先建立只會讓新的資料庫與從版本 3 以前升級的資料庫把所有文章索引兩次；
+    已經套用過這個遷移的資料庫（版本 4～11）的舊索引由遷移 12 取代。
+    """
+
+def _migrate_note_search_suffix(cursor):
+    """
+    建立文章全文搜尋索引（內容加上結尾的換行）、同步觸發器與索引的詞彙表，取代版本 4～11 的舊索引
+
+    兩個字的關鍵字由詞彙表展開成以它開頭的三字組；加上換行後出現在文章結尾的關鍵字也有對應的三字組。
+    """
+    cursor.execute("DROP TRIGGER IF EXISTS markdown_notes_fts_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS markdown_notes_fts_delete")
+    cursor.execute("DROP TRIGGER IF EXISTS markdown_notes_fts_update")
+    cursor.execute("DROP TABLE IF EXISTS notes_fts")
+    # 外部內容表（rebuild 與 snippet 讀取的內容）與觸發器寫入索引的內容必須一致
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS notes_fts_source AS
+        SELECT id, content || char(10) AS content FROM markdown_notes
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE notes_fts USING fts5(
+            content,
+            content='notes_fts_source',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER markdown_notes_fts_insert AFTER INSERT ON markdown_notes BEGIN
+            INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content || char(10));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER markdown_notes_fts_delete AFTER DELETE ON markdown_notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content || char(10));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER markdown_notes_fts_update AFTER UPDATE OF content ON markdown_notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content || char(10));
+            INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content || char(10));
+        END
+    """)
+    cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts_vocab USING fts5vocab(notes_fts, row)")
+
+def _migrate_blob_refcounts(cursor):
+    """建立 blob 引用數資料表，並依既有檔案記錄計算引用數"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            filename TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO blobs (filename, size, ref_count)
+        SELECT filename, MAX(size), COUNT(*) FROM files GROUP BY filename
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename)")
+
+def _migrate_upload_sessions(cursor):
+    """建立續傳上傳工作階段資料表"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON upload_sessions (expires_at)")
+
+def _migrate_note_summaries(cursor):
+    """新增文章摘要欄位，並為既有文章計算摘要"""
+    for column in ("title TEXT", "excerpt TEXT", "size INTEGER", "updated_at TIMESTAMP"):
+        cursor.execute(f"ALTER TABLE markdown_notes ADD COLUMN {column}")
+    
+    last_id = 0
+    while True:
+        rows = cursor.execute("""
+            SELECT id, content FROM markdown_notes WHERE id > ? ORDER BY id LIMIT 1000
+        """, (last_id,)).fetchall()
+        if not rows:
+            break
+        cursor.executemany("""
+            UPDATE markdown_notes SET title = :title, excerpt = :excerpt, size = :size,
+                                      updated_at = created_at
+            WHERE id = :id
+        """, [{"id": row[0], **summarize_note(row[1])} for row in rows])
+        last_id = rows[-1][0]
+
+def _migrate_tag_counts(cursor):
+    """在標籤表記錄文章數，由 note_tags 的觸發器遞增或遞減"""
+    cursor.execute("ALTER TABLE tags ADD COLUMN note_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE tags SET note_count = (SELECT COUNT(*) FROM note_tags WHERE tag_id = tags.id)
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS note_tags_count_insert AFTER INSERT ON note_tags BEGIN
+            UPDATE tags SET note_count = note_count + 1 WHERE id = new.tag_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS note_tags_count_delete AFTER DELETE ON note_tags BEGIN
+            UPDATE tags SET note_count = note_count - 1 WHERE id = old.tag_id;
+        END
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tags_note_count ON tags (note_count DESC, name)")
+
+def _migrate_image_metadata(cursor):
+    """在 blobs 記錄圖片的寬高與 blurhash 佔位圖，由縮圖流程寫入"""
+    for column in ("width INTEGER", "height INTEGER", "blurhash TEXT"):
+        cursor.execute(f"ALTER TABLE blobs ADD COLUMN {column}")
+
+def _migrate_jobs(cursor):
+    """建立背景工作佇列資料表（時間皆為 Unix 秒數）"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            lease_until REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            last_error TEXT,
+            result TEXT
+        )
+    """)
+    # 取出工作只會查詢等待中與租約到期的工作，部分索引不含已完成的大量記錄
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (run_after, id) WHERE status = 'queued'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (lease_until) WHERE status = 'running'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, kind)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)")
+
+def _migrate_cache_events(cursor):
+    """建立跨程序的快取失效通知資料表（key 為 NULL 表示整個快取失效）"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache TEXT NOT NULL,
+            key TEXT,
+            pid INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+MIGRATIONS = [
+    (1, "建立基本資料表", _migrate_base_schema),
+    (2, "移轉舊的 images 資料表", _migrate_legacy_images),
+    (3, "建立分頁索引", _migrate_pagination_indexes),
+    (4, "建立文章全文搜尋索引（改由遷移 12 建立）", _migrate_note_search),
+    (5, "建立 blob 引用數資料表", _migrate_blob_refcounts),
+    (6, "建立續傳上傳工作階段資料表", _migrate_upload_sessions),
+    (7, "新增文章摘要欄位", _migrate_note_summaries),
+    (8, "記錄標籤的文章數", _migrate_tag_counts),
+    (9, "記錄圖片寬高與 blurhash", _migrate_image_metadata),
+    (10, "建立背景工作佇列資料表", _migrate_jobs),
+    (11, "建立快取失效通知資料表", _migrate_cache_events),
+    (12, "建立文章全文搜尋索引（結尾換行與詞彙表）", _migrate_note_search_suffix),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn) -> int:
+    """讀取資料庫目前的結構版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# 建立資料表並執行尚未套用的遷移
+def init_db():
+    # 結構版本已是最新時（一般的重新啟動）只讀取一次版本，不取得檔案鎖也不設定連線
+    conn = sqlite3.connect(Config.DB_PATH)
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return
+    finally:
+        conn.close()
+    # 多個工作程序同時啟動時只有一個程序執行遷移，其他程序等它完成後只讀取版本
+    with file_lock(f"{Config.DB_PATH}.lock"):
+        _apply_migrations()
+
+def _apply_migrations():
+    conn = get_db_connection()
+    try:
+        # 改為手動控制交易，讓每個遷移都是完整的一個交易
+        conn.isolation_level = None
+        current = get_schema_version(conn)
         
-# 初始化資料庫
-init_db()
\ No newline at end of file
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            
+            # BEGIN IMMEDIATE 取得寫入鎖，避免多個程序同時執行遷移
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 取得鎖後重新確認版本，其他程序可能已完成此遷移
+                if get_schema_version(conn) >= version:
+                    conn.execute("COMMIT")
+                    continue
+                migrate(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                logger.error("資料庫遷移 %s (%s) 失敗: %s", version, description, e)
+                raise
+            logger.info("已套用資料庫遷移 %s: %s", version, description)
+    finally:
+        conn.close()
+
+_initialized = False
+
+def initialize():
+    """
+    啟動時的初始化：建立資料夾、設定日誌與效能診斷、執行尚未套用的資料庫遷移
+
+    匯入這個模組時不做任何 I/O（匯入愈快，新的執行個體愈快開始服務），由 app.py 的 lifespan、
+    serve.py 的主程序（fork 工作程序之前）與維護指令呼叫。同一個程序只執行一次，
+    fork 出的工作程序繼承已完成的狀態，不再重複檢查。
+    """
+    global log_handler, _initialized
+    if _initialized:
+        return
+    Config.init()
+    # 日誌經由佇列在背景執行緒寫入，請求處理中不做磁碟 I/O
+    log_handler = setup_logging(
+        Config.LOG_FILE, Config.LOG_LEVEL, Config.LOG_LEVELS, max_bytes=Config.LOG_MAX_BYTES,
+        when=Config.LOG_ROTATE_WHEN, backup_count=Config.LOG_BACKUP_COUNT, queue_size=Config.LOG_QUEUE_SIZE,
+    )
+    # 效能診斷（停用時幾乎沒有成本）
+    slow_query_log.configure(Config.SLOW_QUERY_MS, Config.SLOW_QUERY_LOG_SIZE)
+    profiler.configure(Config.PROFILER_SAMPLE_RATE, Config.PROFILER_INTERVAL)
+    init_db()
+    _initialized = True
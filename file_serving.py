@@ -0,0 +1,211 @@
+"""
+檔案傳送元件，/files/download 與 /share 共用
+
+上傳檔案以內容 hash 命名，檔名本身就是強 ETag，內容永遠不會改變，因此可以：
+
+- 回傳不可變的快取標頭，瀏覽器重新載入時不必再詢問伺服器
+- 以 If-None-Match / If-Modified-Since 回應 304
+- 支援單一與多重 Range 請求（206），影片拖曳時只傳送需要的片段
+
+檔名與分享代碼對應的中繼資料放在記憶體快取中，熱門檔案不必每次查詢資料庫。
+儲存後端支援預簽網址（S3）時改為重定向，檔案內容不經過應用程式。
+本機檔案依 `Config.FILE_SERVE_MODE` 由應用程式以 sendfile 傳送，或以 X-Accel-Redirect / X-Sendfile 交給前端伺服器。
+"""
+import logging
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from common import Config, Database, blob_storage, file_cache, share_cache
+from sendfile_protocol import PATHSEND
+from storage import content_disposition
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 直接在瀏覽器中預覽、不強制下載的檔案類型
+PREVIEW_TYPES = {"image", "video"}
+
+# 交給前端伺服器傳送檔案的模式
+OFFLOAD_MODES = {"x-accel-redirect", "x-sendfile"}
+
+_warned_without_sendfile = False
+
+
+def content_etag(filename: str) -> str:
+    """以檔名中的內容 hash 作為強 ETag"""
+    return f'"{Path(filename).stem}"'
+
+
+def download_url(filename: str) -> str:
+    return f"/files/download/{filename}"
+
+
+async def get_file_metadata(db: Database, filename: str) -> dict | None:
+    """
+    查詢檔案的原始檔名與類型（經過快取）
+
+    同一個 blob 可能有多筆檔案記錄，取最早的一筆。找不到記錄時回傳 None，且不快取。
+    """
+    metadata = file_cache.get(filename)
+    if metadata is not None:
+        return metadata
+
+    version = file_cache.version
+    async with db.reader() as conn:
+        cursor = await conn.execute(
+            "SELECT original_filename, type FROM files WHERE filename = ? ORDER BY id LIMIT 1", (filename,))
+        result = await cursor.fetchone()
+    if not result:
+        return None
+    metadata = {"original_filename": result["original_filename"], "type": result["type"]}
+    file_cache.set(filename, metadata, version)
+    return metadata
+
+
+async def get_shared_file_metadata(db: Database, share_code: str) -> dict | None:
+    """查詢分享代碼對應的檔案（經過快取），找不到時回傳 None"""
+    metadata = share_cache.get(share_code)
+    if metadata is not None:
+        return metadata
+
+    version = share_cache.version
+    async with db.reader() as conn:
+        cursor = await conn.execute("""
+            SELECT f.id, f.filename, f.original_filename, f.type
+            FROM files f
+            JOIN file_shares fs ON f.id = fs.file_id
+            WHERE fs.share_code = ?
+        """, (share_code,))
+        result = await cursor.fetchone()
+    if not result:
+        return None
+    metadata = dict(result)
+    share_cache.set(share_code, metadata, version)
+    return metadata
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    判斷條件式請求是否可以回應 304
+
+    依 RFC 9110，有 If-None-Match 時忽略 If-Modified-Since。
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def media_type_for(filename: str, file_type: str) -> str:
+    if file_type in PREVIEW_TYPES:
+        return f"{file_type}/{filename.split('.')[-1].lower()}"
+    return "application/octet-stream"
+
+
+async def serve_stored_file(request: Request, file_location: Path, original_filename: str,
+                            file_type: str, etag: str | None = None, extra_headers: dict | None = None) -> Response:
+    """
+    傳送上傳資料夾中的檔案
+
+    圖片和影片直接在瀏覽器中預覽，其他類型以原始檔名提供下載。
+    Range 與 If-Range 由 FileResponse 處理，其餘快取相關標頭在此設定。
+    `FILE_SERVE_MODE` 為 x-accel-redirect / x-sendfile 時只回應標頭，內容與 Range 由前端伺服器處理。
+
+    - **etag**: 可選，預設以檔名中的內容 hash 作為 ETag
+    - **extra_headers**: 可選，附加的回應標頭（例如 Vary）
+    """
+    stat_result = await run_in_threadpool(os.stat, file_location)
+    etag = etag or content_etag(file_location.name)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+        **(extra_headers or {}),
+    }
+
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type_for(file_location.name, file_type)
+    filename = None if file_type in PREVIEW_TYPES else original_filename
+    if Config.FILE_SERVE_MODE in OFFLOAD_MODES:
+        offload = offload_headers(file_location)
+        if offload is not None:
+            if filename is not None:
+                headers["content-disposition"] = content_disposition(filename)
+            return Response(headers={**headers, **offload}, media_type=media_type)
+    else:
+        warn_without_sendfile(request)
+
+    return FileResponse(
+        str(file_location),
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+def offload_headers(file_location: Path) -> dict | None:
+    """
+    讓前端伺服器傳送檔案的回應標頭
+
+    X-Accel-Redirect 的內部網址是檔案相對於 `FILE_SERVE_INTERNAL_ROOT` 的路徑加上 `FILE_SERVE_INTERNAL_PREFIX`；
+    檔案不在該資料夾之下時回傳 None，改由應用程式傳送。
+    """
+    path = os.path.abspath(file_location)
+    if Config.FILE_SERVE_MODE == "x-sendfile":
+        return {"x-sendfile": path}
+    relative = os.path.relpath(path, os.path.abspath(Config.FILE_SERVE_INTERNAL_ROOT))
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        logger.warning("檔案不在 FILE_SERVE_INTERNAL_ROOT 之下，改由應用程式傳送: %s", path)
+        return None
+    prefix = Config.FILE_SERVE_INTERNAL_PREFIX.rstrip("/")
+    return {"x-accel-redirect": f"{prefix}/{quote(Path(relative).as_posix())}"}
+
+
+def warn_without_sendfile(request: Request):
+    """伺服器沒有提供 pathsend 擴充（檔案內容會經過 Python 分段讀寫）時記錄一次警告"""
+    global _warned_without_sendfile
+    if _warned_without_sendfile or PATHSEND in request.scope.get("extensions", {}):
+        return
+    _warned_without_sendfile = True
+    logger.warning("伺服器不支援 sendfile 傳送檔案（uvicorn 沒有使用 sendfile_protocol，或使用 uvloop、TLS），"
+                   "檔案改為分段讀寫")
+
+
+def presigned_redirect(filename: str, original_filename: str, file_type: str) -> Response | None:
+    """
+    重定向到儲存後端的預簽網址，由用戶端直接下載；後端不支援時回傳 None
+
+    同一段時間內同一個檔案的預簽網址相同，重定向本身也可以被瀏覽器快取到網址失效前。
+    """
+    url = blob_storage.presigned_url(filename, None if file_type in PREVIEW_TYPES else original_filename,
+                                     media_type_for(filename, file_type))
+    if url is None:
+        return None
+    return RedirectResponse(url, status_code=302,
+                            headers={"cache-control": f"private, max-age={blob_storage.presigned_url_ttl}"})
+
+
+async def locate_blob(filename: str) -> Path | None:
+    """blob 在本機可讀取的路徑；遠端後端可能需要下載，在執行緒池中進行"""
+    if blob_storage.remote:
+        return await run_in_threadpool(blob_storage.locate, filename)
+    # 本機只需要幾次 stat，直接呼叫比經過執行緒池快
+    return blob_storage.locate(filename)
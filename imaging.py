@@ -0,0 +1,187 @@
+"""
+圖片縮圖的編碼工作，在 thumbnails 的行程池中執行
+
+這個模組只依賴 Pillow，不要匯入 common（會連帶載入 FastAPI 等整個應用程式的相依套件）：
+子行程以 spawn 啟動，執行這裡的函式時只需要匯入本模組。
+
+產生的檔案先寫到同一資料夾的暫存檔，完成後以 os.replace 放到最終位置，
+讀取端永遠不會看到寫到一半的檔案。
+"""
+import math
+import os
+import tempfile
+from functools import lru_cache
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+# 各格式的編碼參數：AVIF 的 speed 8 與 WebP 的編碼時間相近，檔案大小幾乎相同
+ENCODE_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 75, "method": 4},
+    "avif": {"format": "AVIF", "quality": 55, "speed": 8},
+    # 安裝的 Pillow 不支援上面的格式時使用（THUMBNAIL_FALLBACK_FORMATS）
+    "jpeg": {"format": "JPEG", "quality": 80, "optimize": True},
+    "png": {"format": "PNG", "optimize": True},
+}
+# 各格式在 PIL.features.check 中的名稱
+_FEATURES = {"webp": "webp", "avif": "avif", "jpeg": "jpg", "png": "zlib"}
+
+# 無法解碼的圖片（檔案損毀或超過 Pillow 的像素上限），重試也不會成功
+UNREADABLE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+@lru_cache(maxsize=None)
+def supported_formats() -> tuple:
+    """目前安裝的 Pillow 能編碼的縮圖格式"""
+    return tuple(fmt for fmt in ENCODE_OPTIONS if features.check(_FEATURES[fmt]))
+
+
+def lower_priority():
+    """行程池子行程的 initializer：降低 CPU 優先權，CPU 忙碌時讓處理請求的行程先執行"""
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+def _open(source: str, width: int) -> tuple:
+    """
+    開啟圖片並依 EXIF 轉正
+
+    JPEG 以 draft 模式在解碼時直接縮小（1/2、1/4、1/8），大圖只解碼需要的解析度。
+    動畫只取第一格。
+
+    Returns:
+        (圖片, 轉正後的原圖寬高)
+    """
+    image = Image.open(source)
+    width_original, height_original = image.size
+    # EXIF 方向 5～8 代表旋轉 90 度
+    if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        width_original, height_original = height_original, width_original
+    image.draft("RGB", (width, width))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    return image, (width_original, height_original)
+
+
+def _save(image: Image.Image, target: str, fmt: str) -> int:
+    # JPEG 沒有透明度
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".derivative-", suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            image.save(out, **ENCODE_OPTIONS[fmt])
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return os.path.getsize(target)
+
+
+def _render(image: Image.Image, variants: list) -> tuple:
+    """由寬到窄依序縮小，每個寬度都從上一個較大的結果縮小；回傳 ({輸出路徑: 大小}, 最小的圖)"""
+    sizes = {}
+    for width in sorted({width for width, _, _ in variants}, reverse=True):
+        image.thumbnail((width, image.height), Image.LANCZOS)
+        for variant_width, fmt, target in variants:
+            if variant_width == width:
+                sizes[target] = _save(image, target, fmt)
+    return sizes, image
+
+
+def render_variants(source: str, variants: list) -> dict:
+    """
+    從原圖產生縮圖（行程池的進入點）
+
+    - **source**: 原圖路徑
+    - **variants**: [(寬度, 格式, 輸出路徑)]；原圖比要求的寬度窄時不放大
+
+    Returns:
+        {輸出路徑: 檔案大小}
+    """
+    image, _ = _open(source, max(width for width, _, _ in variants))
+    return _render(image, variants)[0]
+
+
+def generate_derivatives(source: str, variants: list) -> dict:
+    """
+    上傳後的完整處理（行程池的進入點）：產生所有預設縮圖，並計算原圖寬高與 blurhash 佔位圖
+
+    原圖只解碼一次，blurhash 由最小的縮圖再縮小後計算。
+
+    Returns:
+        {"sizes": {輸出路徑: 大小}, "width", "height", "blurhash"}
+    """
+    image, (width, height) = _open(source, max(width for width, _, _ in variants))
+    sizes, smallest = _render(image, variants)
+    sample = smallest.copy()
+    sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE), Image.BILINEAR)
+    return {"sizes": sizes, "width": width, "height": height, "blurhash": blurhash_encode(sample.convert("RGB"))}
+
+
+# blurhash（https://blurha.sh）：以少量餘弦分量描述圖片的模糊輪廓，
+# 編碼成約 20 個字元，前端在縮圖載入前先畫出佔位圖。
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - 1 - index)) % 83] for index in range(length))
+
+
+def _srgb_to_linear(value: int) -> float:
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def blurhash_encode(image: Image.Image, components: tuple = BLURHASH_COMPONENTS) -> str:
+    """將小尺寸的 RGB 圖片編碼為 blurhash 字串"""
+    components_x, components_y = components
+    width, height = image.size
+    linear = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in image.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pixel = linear[row + x]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1
+    result += _base83(quantised_max, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        quantised = [max(0, min(18, int(_sign_pow(value / maximum, 0.5) * 9 + 9.5))) for value in factor]
+        result += _base83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+    return result
@@ -0,0 +1,383 @@
+"""
+背景工作佇列
+
+上傳後的處理（縮圖、日後的中繼資料擷取或掃毒）不在請求中執行，而是寫入 jobs 資料表，
+由應用程式內的工作者在背景執行：
+
+- 持久：工作與上傳的檔案記錄在同一個寫入交易中加入，交易 commit 後工作就不會遺失，
+  重新啟動後繼續執行；不需要外部的訊息佇列
+- 租約：取出工作時設定 `lease_until`，程序中斷而沒有完成的工作在租約到期後由任何工作者重新取出
+- 重試：失敗的工作以指數退避（含隨機抖動）延後重試，超過 `Config.JOB_MAX_ATTEMPTS` 次或
+  處理函式拋出 PermanentJobError 時標記為 failed
+- 工作者是事件迴圈中的 asyncio 工作，CPU 密集的處理由處理函式交給行程池或執行緒池
+
+處理函式以 `@job_handler("種類")` 登記，簽名為 `async def handler(db, payload) -> dict | None`。
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+
+from common import Config, Database, db, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "running", "succeeded", "failed")
+# 每項延遲統計保留的最近樣本數
+LATENCY_SAMPLES = 1000
+# 工作者閒置時最多每小時刪除一次過期的工作記錄
+PRUNE_INTERVAL = 60 * 60
+
+_handlers: dict = {}
+_upload_jobs: dict = {}
+
+
+class PermanentJobError(Exception):
+    """重試也不會成功的錯誤（例如檔案損毀），工作直接標記為 failed"""
+
+
+def job_handler(kind: str, on_upload=None):
+    """
+    登記工作種類的處理函式
+
+    - **kind**: 工作種類
+    - **on_upload**: 可選，`(filename) -> bool`；回傳 True 的上傳檔案會自動加入這種工作
+    """
+    def register(handler):
+        _handlers[kind] = handler
+        if on_upload is not None:
+            _upload_jobs[kind] = on_upload
+        return handler
+    return register
+
+
+async def enqueue(conn, kind: str, payload: dict = None, delay: float = 0, max_attempts: int = None) -> int:
+    """
+    在目前的寫入交易中加入工作，交易 commit 後才會被執行
+
+    - **conn**: `db.writer()` 取得的連線
+    - **delay**: 延後執行的秒數
+
+    Returns:
+        工作 ID
+    """
+    now = time.time()
+    cursor = await conn.execute(
+        "INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at) VALUES (?, ?, ?, ?, ?)",
+        (kind, json.dumps(payload or {}), max_attempts or Config.JOB_MAX_ATTEMPTS, now + delay, now)
+    )
+    job_queue.notify()
+    return cursor.lastrowid
+
+
+async def enqueue_upload_jobs(conn, filename: str) -> list:
+    """
+    新上傳的檔案寫入後呼叫：加入所有 on_upload 條件符合的工作
+
+    Returns:
+        加入的工作 ID 列表
+    """
+    return [await enqueue(conn, kind, {"filename": filename})
+            for kind, matches in _upload_jobs.items() if matches(filename)]
+
+
+def retry_delay(attempts: int) -> float:
+    """第 attempts 次失敗後的等待秒數：指數退避，取上限的一半到全部之間的隨機值，避免同時重試"""
+    delay = min(Config.JOB_RETRY_MAX_DELAY, Config.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def job_to_dict(row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def _percentiles(samples: deque) -> dict:
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 2)
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+class JobQueue:
+    """
+    jobs 資料表的工作者池
+
+    加入工作時以 notify 立即喚醒工作者；其他程序（例如維護指令）加入的工作與到期的重試
+    則在 `Config.JOB_POLL_INTERVAL` 內被取出。
+    """
+
+    def __init__(self, database: Database, workers: int):
+        self.db = database
+        self.workers = workers
+        self._tasks: list = []
+        self._wakeup: asyncio.Event | None = None
+        self._running: set = set()
+        self._last_prune = 0.0
+        self.processed = {"succeeded": 0, "failed": 0, "retried": 0}
+        # 延遲統計（本程序最近的樣本）：等待時間＝開始執行 − 可執行時間，執行時間＝完成 − 開始
+        self.wait_times: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.run_times: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def lease_seconds(self) -> float:
+        # 租約比逾時長，正常執行中的工作不會被其他工作者取走
+        return Config.JOB_TIMEOUT + 60
+
+    async def start(self):
+        """啟動工作者（應用程式啟動時呼叫）"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("背景工作佇列已啟動 (工作者=%s)", self.workers)
+
+    async def stop(self):
+        """停止工作者；執行到一半的工作放回佇列，下次啟動時重新執行"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim(self):
+        """取出一個可執行的工作並設定租約，沒有工作時回傳 None"""
+        now = time.time()
+        async with self.db.writer() as conn:
+            while True:
+                cursor = await conn.execute("""
+                    SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY run_after, id LIMIT 1
+                """, (now,))
+                row = await cursor.fetchone()
+                if row is None:
+                    # 執行中程序中斷而留下的工作
+                    cursor = await conn.execute("""
+                        SELECT id FROM jobs WHERE status = 'running' AND lease_until < ? LIMIT 1
+                    """, (now,))
+                    row = await cursor.fetchone()
+                if row is None:
+                    return None
+                # 寫入交易以 BEGIN IMMEDIATE 開始，其他工作程序不會在 SELECT 與 UPDATE 之間取走同一個工作；
+                # UPDATE 仍重新確認條件（例如以其他方式開啟的連線），沒有更新到任何資料列就重新選擇
+                cursor = await conn.execute("""
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ?
+                    WHERE id = ? AND ((status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_until < ?))
+                    RETURNING id, kind, payload, attempts, max_attempts, run_after
+                """, (now, now + self.lease_seconds, row[0], now, now))
+                job = await cursor.fetchone()
+                if job is not None:
+                    return job
+
+    async def _next_due(self) -> float | None:
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("""
+                SELECT MIN(run_after) FROM jobs WHERE status = 'queued'
+                UNION ALL
+                SELECT MIN(lease_until) FROM jobs WHERE status = 'running'
+            """)
+            times = [row[0] for row in await cursor.fetchall() if row[0] is not None]
+        return min(times) if times else None
+
+    async def _wait(self):
+        next_due = await self._next_due()
+        timeout = Config.JOB_POLL_INTERVAL
+        if next_due is not None:
+            timeout = max(0.0, min(timeout, next_due - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self):
+        while True:
+            try:
+                # 先清除通知再取工作：取工作之後才加入的工作會留下通知，不會漏接
+                self._wakeup.clear()
+                job = await self._claim()
+                if job is None:
+                    if time.time() - self._last_prune > PRUNE_INTERVAL:
+                        await self.prune()
+                    await self._wait()
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 資料庫暫時無法寫入等情況，稍後再試
+                logger.error("背景工作者發生錯誤: %s", e)
+                await asyncio.sleep(Config.JOB_POLL_INTERVAL)
+
+    async def _run(self, job):
+        job_id, kind = job["id"], job["kind"]
+        started = time.time()
+        self.wait_times.append(max(0.0, started - job["run_after"]))
+        self._running.add(job_id)
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind: {kind}")
+            result = await asyncio.wait_for(handler(self.db, json.loads(job["payload"])), Config.JOB_TIMEOUT)
+        except asyncio.CancelledError:
+            await self._release(job_id)
+            raise
+        except Exception as e:
+            self.run_times.append(time.time() - started)
+            error = f"{type(e).__name__}: {e}" if not isinstance(e, asyncio.TimeoutError) else "Timed out"
+            await self._fail(job, error, permanent=isinstance(e, PermanentJobError))
+        else:
+            finished = time.time()
+            self.run_times.append(finished - started)
+            async with self.db.writer() as conn:
+                await conn.execute("""
+                    UPDATE jobs SET status = 'succeeded', finished_at = ?, lease_until = NULL, last_error = NULL,
+                                    result = ?
+                    WHERE id = ?
+                """, (finished, json.dumps(result) if result is not None else None, job_id))
+            self.processed["succeeded"] += 1
+            logger.info("背景工作完成: #%s %s (%.2fs)", job_id, kind, finished - started)
+        finally:
+            self._running.discard(job_id)
+
+    async def _fail(self, job, error: str, permanent: bool):
+        job_id, attempts = job["id"], job["attempts"]
+        now = time.time()
+        async with self.db.writer() as conn:
+            if permanent or attempts >= job["max_attempts"]:
+                await conn.execute("""
+                    UPDATE jobs SET status = 'failed', finished_at = ?, lease_until = NULL, last_error = ?
+                    WHERE id = ?
+                """, (now, error, job_id))
+                self.processed["failed"] += 1
+                logger.error("背景工作失敗: #%s %s (第 %s 次): %s", job_id, job['kind'], attempts, error)
+                return
+            delay = retry_delay(attempts)
+            await conn.execute("""
+                UPDATE jobs SET status = 'queued', run_after = ?, lease_until = NULL, last_error = ?
+                WHERE id = ?
+            """, (now + delay, error, job_id))
+        self.processed["retried"] += 1
+        logger.warning("背景工作失敗，%.0f 秒後重試: #%s %s (第 %s 次): %s", delay, job_id, job['kind'], attempts, error)
+
+    async def _release(self, job_id: int):
+        """應用程式關閉時中斷的工作放回佇列，不計入執行次數"""
+        try:
+            async with self.db.writer() as conn:
+                await conn.execute("""
+                    UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL
+                    WHERE id = ? AND status = 'running'
+                """, (job_id,))
+        except Exception as e:
+            # 放不回去時由租約到期後重新取出
+            logger.warning("無法放回中斷的背景工作 #%s: %s", job_id, e)
+
+    async def prune(self) -> int:
+        """刪除完成超過 `Config.JOB_RETENTION` 秒的工作記錄"""
+        self._last_prune = time.time()
+        async with self.db.writer() as conn:
+            cursor = await conn.execute("""
+                DELETE FROM jobs WHERE finished_at < ? AND status IN ('succeeded', 'failed')
+            """, (self._last_prune - Config.JOB_RETENTION,))
+            removed = cursor.rowcount
+        if removed:
+            logger.info("已刪除 %s 筆過期的背景工作記錄", removed)
+        return removed
+
+    async def get(self, job_id: int) -> dict | None:
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = await cursor.fetchone()
+        return job_to_dict(row) if row else None
+
+    async def list_jobs(self, status: str = None, kind: str = None, limit: int = 50, before_id: int = None) -> list:
+        """依 ID 由新到舊列出工作"""
+        conditions, params = [], []
+        for column, value in (("status", status), ("kind", kind)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with self.db.reader() as conn:
+            cursor = await conn.execute(f"SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit))
+            rows = await cursor.fetchall()
+        return [job_to_dict(row) for row in rows]
+
+    async def retry(self, job_id: int) -> bool:
+        """將失敗的工作重新放回佇列（執行次數歸零）；工作不存在或不是 failed 時回傳 False"""
+        async with self.db.writer() as conn:
+            cursor = await conn.execute("""
+                UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, finished_at = NULL
+                WHERE id = ? AND status = 'failed'
+            """, (time.time(), job_id))
+            retried = cursor.rowcount > 0
+        if retried:
+            self.notify()
+        return retried
+
+    async def stats(self) -> dict:
+        """
+        佇列深度與延遲統計
+
+        Returns:
+            - **depth**: 各狀態（不含 succeeded）與種類的工作數
+            - **oldest_queued_s**: 已可執行但尚未開始的工作中，等待最久的秒數
+            - **processed**: 本程序啟動後完成、失敗與重試的次數
+            - **wait** / **run**: 本程序最近工作的等待與執行時間分位數
+        """
+        now = time.time()
+        async with self.db.reader() as conn:
+            cursor = await conn.execute("""
+                SELECT status, kind, COUNT(*) FROM jobs WHERE status IN ('queued', 'running', 'failed')
+                GROUP BY status, kind
+            """)
+            rows = await cursor.fetchall()
+            cursor = await conn.execute("""
+                SELECT MIN(run_after) FROM jobs WHERE status = 'queued' AND run_after <= ?
+            """, (now,))
+            oldest = (await cursor.fetchone())[0]
+        depth = {status: {} for status in ("queued", "running", "failed")}
+        for status, kind, count in rows:
+            depth[status][kind] = count
+        return {
+            "workers": len(self._tasks),
+            "active": len(self._running),
+            "depth": {status: {"total": sum(kinds.values()), "by_kind": kinds} for status, kinds in depth.items()},
+            "oldest_queued_s": round(now - oldest, 3) if oldest is not None else None,
+            "processed": dict(self.processed),
+            "wait": _percentiles(self.wait_times),
+            "run": _percentiles(self.run_times),
+        }
+
+
+# 全域背景工作佇列
+job_queue = JobQueue(db, Config.JOB_WORKERS)
+
+
+def collect_finished_jobs(max_age_seconds: int = None) -> int:
+    """
+    刪除完成（succeeded 或 failed）超過 `Config.JOB_RETENTION` 秒的工作記錄（供維護指令使用）
+
+    Returns:
+        刪除的工作數量
+    """
+    cutoff = time.time() - (Config.JOB_RETENTION if max_age_seconds is None else max_age_seconds)
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("""
+            DELETE FROM jobs WHERE finished_at < ? AND status IN ('succeeded', 'failed')
+        """, (cutoff,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
@@ -0,0 +1,195 @@
+"""
+日誌輸出：JSON Lines 格式、背景執行緒寫入、依大小與時間輪替
+
+請求處理中呼叫 logger 只把 LogRecord 放進佇列，訊息格式化、JSON 序列化與寫入檔案都在 QueueListener 的
+背景執行緒進行，事件迴圈不會因為磁碟 I/O 停頓。記錄時以 `logger.info("已刪除 %s", name)` 傳入參數：
+等級未啟用時完全不格式化，啟用時也延後到背景執行緒才格式化（因此記錄後不應再修改傳入的物件）。
+
+每行一筆 JSON：
+
+    {"time": "2024-05-01T12:00:00.123+08:00", "level": "INFO", "logger": "routers.files", "message": "..."}
+
+以 `extra={...}` 傳入的欄位會成為同一層的欄位，有例外時另有 "exception"。
+
+多個工作程序（fork）可以寫入同一個檔案：每個程序有自己的背景執行緒，以附加模式寫入；
+輪替時以檔案鎖確保只有一個程序改名，其他程序發現檔案已被輪替時改為開啟新檔。
+
+這個模組只依賴標準函式庫與 orjson，不讀取 Config；設定由 common.py 傳入。
+"""
+import logging
+import os
+import queue
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows：只支援單一程序寫入
+    fcntl = None
+
+# LogRecord 本身的屬性，其餘屬性視為 extra 欄位
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆記錄輸出為一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class RotatingLogFileHandler(TimedRotatingFileHandler):
+    """
+    依時間或大小輪替的日誌檔，先達到者為準
+
+    舊檔以時間命名（例如 `app.log.2024-05-01`），同一段時間內因大小再次輪替時依序加上 `.001`、`.002`，
+    保留 backup_count 個舊檔。
+
+    - **max_bytes**: 檔案超過此大小時輪替，0 表示只依時間輪替
+    - **when** / **interval**: 與 TimedRotatingFileHandler 相同，例如 "midnight"、"H"
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, when: str = "midnight", interval: int = 1,
+                 backup_count: int = 0):
+        super().__init__(filename, when=when, interval=interval, backupCount=backup_count, encoding="utf-8")
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        # 寫入前檢查，檔案最多超過上限一筆記錄
+        return self.max_bytes > 0 and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(self.baseFilename + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._rotated_elsewhere():
+                # 其他程序已經輪替：改寫入新檔，下次輪替時間從現在起算
+                if self.stream is not None:
+                    self.stream.close()
+                self.stream = self._open()
+                self.rolloverAt = self.computeRollover(int(time.time()))
+                return
+            super().doRollover()
+
+    def _rotated_elsewhere(self) -> bool:
+        """開啟中的檔案已不是 baseFilename（被改名）"""
+        if self.stream is None:
+            return False
+        try:
+            return not os.path.samestat(os.stat(self.baseFilename), os.fstat(self.stream.fileno()))
+        except FileNotFoundError:
+            return True
+
+    def rotation_filename(self, default_name: str) -> str:
+        # 時間命名的舊檔已存在（同一段時間內依大小輪替過）時加上序號，而不是覆蓋它
+        name, sequence = default_name, 0
+        while os.path.exists(name):
+            sequence += 1
+            name = f"{default_name}.{sequence:03d}"
+        return name
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # 佇列可能已滿；背景執行緒仍在取出記錄，等待空位而不是失敗
+        self.queue.put(self._sentinel)
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    把記錄放進佇列，由背景執行緒交給實際的 handler
+
+    佇列已滿（寫入跟不上）時丟棄新的記錄並計數，不讓呼叫端等待。
+    """
+
+    def __init__(self, handlers: list, queue_size: int):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self.listener = _Listener(self.queue, *handlers, respect_handler_level=True)
+        self._listening = False
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        if not self._listening:
+            self.listener.start()
+            self._listening = True
+
+    def _after_fork(self):
+        # fork 出的子程序沒有背景執行緒，佇列的鎖也可能停在 fork 當下的狀態：換成新的佇列與執行緒，
+        # 父程序佇列中尚未寫入的記錄由父程序寫入
+        if not self._listening:
+            return
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = _Listener(self.queue, *self.listener.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.dropped = 0
+
+    def close(self):
+        # 程序結束時由 logging.shutdown 呼叫：先寫完佇列中剩下的記錄
+        if self._listening:
+            self.listener.stop()
+            self._listening = False
+        super().close()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一個程序內的背景執行緒直接使用 LogRecord，不必像跨程序時先在呼叫端格式化成字串
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+def setup_logging(filename: str, level: str = "INFO", levels: dict | None = None, max_bytes: int = 0,
+                  when: str = "midnight", backup_count: int = 0, queue_size: int = 10000) -> AsyncLogHandler:
+    """
+    設定根 logger：記錄經由佇列在背景執行緒寫入 JSON Lines 檔案
+
+    - **level**: 根 logger 的等級
+    - **levels**: 個別 logger（模組名稱）的等級，例如 `{"routers.files": "DEBUG"}`
+    - **max_bytes** / **when** / **backup_count**: 輪替設定，見 RotatingLogFileHandler
+
+    Returns:
+        安裝在根 logger 上的 AsyncLogHandler（統計見 stats()）；程序結束時 logging.shutdown 會寫完佇列中剩下的記錄
+    """
+    file_handler = RotatingLogFileHandler(filename, max_bytes=max_bytes, when=when, backup_count=backup_count)
+    file_handler.setFormatter(JsonFormatter())
+    handler = AsyncLogHandler([file_handler], queue_size)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        if isinstance(existing, AsyncLogHandler):
+            root.removeHandler(existing)
+            existing.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    handler.start()
+    return handler
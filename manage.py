@@ -0,0 +1,105 @@
+"""
+維護指令
+
+    python manage.py rebuild-search-index   重建文章全文搜尋索引
+    python manage.py gc-blobs               清理上傳資料夾中未被引用的檔案
+    python manage.py expire-upload-sessions 清除閒置過久的續傳上傳工作階段
+    python manage.py generate-thumbnails    為尚未處理的圖片產生縮圖、寬高與 blurhash
+    python manage.py prune-jobs             刪除完成已久的背景工作記錄
+    python manage.py migrate-storage        將平面配置的上傳檔案搬到分層資料夾（可在服務運作時執行）
+    python manage.py upload-to-s3           將上傳資料夾中的檔案複製到 S3（改用 S3 儲存後端時）
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from common import (Config, blob_storage, collect_blob_garbage, collect_expired_upload_sessions, initialize,
+                    rebuild_search_index)
+from storage import LocalStorage
+from jobs import collect_finished_jobs
+from thumbnails import backfill_image_metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-search-index", help="依 markdown_notes 重建全文搜尋索引")
+    gc_parser = commands.add_parser("gc-blobs", help="清理上傳資料夾中未被引用的檔案")
+    gc_parser.add_argument("--min-age", type=int, default=3600, help="只清理超過此秒數未修改的檔案")
+    commands.add_parser("expire-upload-sessions", help="清除閒置過久的續傳上傳工作階段")
+    commands.add_parser("generate-thumbnails", help="為尚未處理的圖片產生縮圖、寬高與 blurhash")
+    prune_parser = commands.add_parser("prune-jobs", help="刪除完成已久的背景工作記錄")
+    prune_parser.add_argument("--max-age", type=int, default=None,
+                              help="刪除完成超過此秒數的工作（預設為 Config.JOB_RETENTION）")
+    migrate_parser = commands.add_parser("migrate-storage", help="將平面配置的上傳檔案搬到分層資料夾")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000, help="每批搬移的檔案數")
+    migrate_parser.add_argument("--pause", type=float, default=0.0, help="每批之間暫停的秒數，降低對線上服務的影響")
+    migrate_parser.add_argument("--limit", type=int, default=None, help="本次最多搬移的檔案數")
+    upload_parser = commands.add_parser("upload-to-s3", help="將上傳資料夾中的檔案複製到 S3")
+    upload_parser.add_argument("--concurrency", type=int, default=8, help="同時上傳的檔案數")
+    args = parser.parse_args()
+    initialize()
+
+    if args.command == "rebuild-search-index":
+        count = rebuild_search_index()
+        print(f"已重建全文搜尋索引，共 {count} 篇文章")
+    elif args.command == "gc-blobs":
+        removed = collect_blob_garbage(args.min_age)
+        print(f"已清理 {removed['temp_files']} 個暫存檔、{removed['orphan_blobs']} 個未引用檔案，"
+              f"共 {removed['bytes']} bytes")
+    elif args.command == "expire-upload-sessions":
+        removed = collect_expired_upload_sessions()
+        print(f"已清除 {removed} 個上傳工作階段")
+    elif args.command == "generate-thumbnails":
+        processed = backfill_image_metadata()
+        print(f"已處理 {processed} 張圖片")
+    elif args.command == "prune-jobs":
+        removed = collect_finished_jobs(args.max_age)
+        print(f"已刪除 {removed} 筆背景工作記錄")
+    elif args.command == "upload-to-s3":
+        upload_to_s3(args.concurrency)
+    elif args.command == "migrate-storage":
+        if Config.STORAGE_BACKEND != "local":
+            raise SystemExit("migrate-storage 只適用於本機儲存；改用 S3 時請執行 upload-to-s3")
+        result = blob_storage.migrate(args.batch_size, args.pause, args.limit,
+                                      progress=lambda result: print(f"已搬移 {result['moved']} 個檔案", flush=True))
+        state = "已全部完成" if result["complete"] else "尚未完成，重新執行會繼續"
+        print(f"已搬移 {result['moved']} 個檔案（{result['missing']} 個在搬移前已被刪除），{state}")
+
+
+def upload_to_s3(concurrency: int):
+    """
+    將上傳資料夾（兩種配置）中的檔案複製到 S3，已存在的物件略過
+
+    本機檔案不會被刪除；確認無誤後再自行移除上傳資料夾。中斷後重新執行即可繼續。
+    """
+    if Config.STORAGE_BACKEND != "s3":
+        raise SystemExit("請先將 Config.STORAGE_BACKEND 設為 \"s3\"")
+    local = LocalStorage(Config.UPLOAD_FOLDER, Config.UPLOAD_SHARD_DEPTH, Config.UPLOAD_SHARD_WIDTH)
+
+    def copy(name: str) -> bool:
+        if blob_storage.exists(name):
+            return False
+        path = local.locate(name)
+        if path is None:
+            return False
+        blob_storage.upload(str(path), name)
+        return True
+
+    copied = skipped = 0
+    names = (name for name, _, _ in local.list_blobs())
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 分批送出，檔案很多時不會一次建立所有工作
+        while batch := list(islice(names, 1000)):
+            for uploaded in executor.map(copy, batch):
+                if uploaded:
+                    copied += 1
+                else:
+                    skipped += 1
+            print(f"已上傳 {copied} 個檔案", flush=True)
+    print(f"已上傳 {copied} 個檔案，{skipped} 個已存在而略過")
+    blob_storage.close()
+
+
+if __name__ == "__main__":
+    main()
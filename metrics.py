@@ -0,0 +1,226 @@
+"""
+Prometheus 文字格式的指標
+
+- Counter / Gauge / Histogram：在請求處理中更新，建立時登錄到 REGISTRY
+- 收集函式（collector）：抓取時才把各元件既有的 stats() 轉成指標，請求處理中不需要額外計數
+
+指標只在事件迴圈的執行緒中更新，不使用鎖；每個程序各自累計。
+標籤的值應該來自有限的集合（例如路由範本而不是實際網址），每組值會一直保留在記憶體中。
+
+這個模組只依賴標準函式庫，不讀取 Config。
+"""
+import inspect
+import math
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 延遲（秒）的預設區間
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def format_family(name: str, metric_type: str, help_text: str, samples: list) -> list:
+    """
+    一個指標的文字格式
+
+    - **samples**: [(名稱後綴, 標籤 dict, 值)]，例如 ("_bucket", {"le": "0.1"}, 3)
+
+    Returns:
+        文字行的 list
+    """
+    help_text = help_text.replace("\\", "\\\\").replace("\n", "\\n")
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # 每個區間各自的次數（最後一格為超過最大上限），輸出時才累加
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # 第一個 >= value 的上限即為 value 所屬的區間（le 包含上限）
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), registry: "Registry" = None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self._default = self.labels()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """
+        取得一組標籤值的指標（第一次使用時建立）
+
+        請求處理中重複使用的組合可以先取得並保存，省去每次查表。
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, labels: dict, child) -> list:
+        return [("", labels, child.value)]
+
+    def render(self) -> list:
+        samples = []
+        for values, child in self._children.items():
+            samples.extend(self._samples(dict(zip(self.label_names, values)), child))
+        return format_family(self.name, self.metric_type, self.help, samples)
+
+
+class Counter(_Metric):
+    """只會增加的計數，名稱慣例以 `_total` 結尾"""
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    """可增可減的目前值"""
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def dec(self, amount=1):
+        self._default.value -= amount
+
+    def set(self, value):
+        self._default.value = value
+
+
+class Histogram(_Metric):
+    """
+    依區間計數的分佈（例如延遲），Prometheus 以 histogram_quantile() 計算分位數
+
+    - **buckets**: 各區間的上限，由小到大
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _samples(self, labels: dict, child) -> list:
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            samples.append(("_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+        samples.append(("_sum", labels, child.sum))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """一組指標與收集函式，render() 輸出 Prometheus 文字格式"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def collector(self, func):
+        """
+        登錄抓取時呼叫的收集函式（可以是 async），可作為裝飾器使用
+
+        收集函式回傳 [(名稱, 類型, 說明, [(標籤 dict, 值)])]，值為 None 的樣本不輸出。
+        """
+        self._collectors.append(func)
+        return func
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for func in self._collectors:
+            families = func()
+            if inspect.isawaitable(families):
+                families = await families
+            for name, metric_type, help_text, samples in families:
+                lines.extend(format_family(name, metric_type, help_text, [
+                    ("", labels, value) for labels, value in samples if value is not None]))
+        return "\n".join(lines) + "\n"
+
+
+# 全域的指標登錄處
+REGISTRY = Registry()
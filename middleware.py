@@ -0,0 +1,206 @@
+"""
+ASGI 中間件
+"""
+import logging
+from time import perf_counter
+
+import metrics
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = metrics.Histogram(
+    "http_request_duration_seconds", "請求從進入應用程式到回應送出的時間（秒）", ("method", "route"))
+REQUESTS = metrics.Counter("http_requests_total", "完成的請求數", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = metrics.Gauge("http_requests_in_flight", "處理中的請求數")
+REQUEST_BYTES = metrics.Counter("http_request_body_bytes_total", "收到的請求內容位元組數（上傳）", ("route",))
+RESPONSE_BYTES = metrics.Counter(
+    "http_response_body_bytes_total", "回應內容的位元組數（下載；以 sendfile 傳送的內容依 Content-Length 計算）",
+    ("route",))
+
+# 其他方法（任意字串）歸為 OTHER，避免標籤值無限增加
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+# 只有這些方法會帶請求內容，其他方法不必計算收到的位元組
+_BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+# (方法, 路由, 狀態碼) → 該組標籤的 (處理時間, 請求數, 回應位元組數)，每個請求只查一次表
+_series = {}
+
+
+def _series_for(method: str, route: str, status: int) -> tuple:
+    series = _series.get((method, route, status))
+    if series is None:
+        series = _series[(method, route, status)] = (
+            REQUEST_DURATION.labels(method, route), REQUESTS.labels(method, route, status), RESPONSE_BYTES.labels(route))
+    return series
+
+
+class RequestBodyTooLarge(Exception):
+    """請求內容超過上限"""
+
+
+class MaxBodySizeMiddleware:
+    """
+    限制請求內容大小
+
+    - 有 Content-Length 標頭且超過上限時，不讀取內容直接回應 413
+    - 沒有標頭（chunked 傳輸）時，在接收資料的過程中累計大小，超過上限立即中止並回應 413
+    - `path_limits` 可為個別路徑（完全相符）指定不同的上限，None 為不限制
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: dict | None = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_body_size = self.path_limits.get(scope["path"], self.max_body_size)
+        if max_body_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > max_body_size
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    logger.warning("請求內容過大，拒絕: %s (%s bytes)", scope['path'], int(value))
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    exceeded = True
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                # 表單解析器可能把中止接收轉成 400，一律改回 413
+                if not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            logger.warning("請求內容超過上限，已中止接收: %s", scope['path'])
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class MetricsMiddleware:
+    """
+    記錄每個請求的處理時間、狀態碼、請求與回應內容的位元組數，以及處理中的請求數
+
+    路由標籤使用對應到的路由範本（例如 `/files/download/{filename}`），不會因參數不同而產生大量的時間序列；
+    沒有對應路由的請求（404、被拒絕的過大請求）記為 "other"。放在最外層，量測時間包含其他中間件。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        method = scope["method"]
+        status = 500  # 沒有送出回應就拋出例外時
+        received = 0
+        sent = 0
+        sized = False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent, sized
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-length":
+                        sent, sized = int(value), True
+                        break
+            elif not sized and message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive if method in _BODY_METHODS else receive, counting_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # 路由在應用程式內對應後寫入同一個 scope
+            route = getattr(scope.get("route"), "path", "other")
+            if method not in _METHODS:
+                method = "OTHER"
+            duration, requests, response_bytes = _series_for(method, route, status)
+            duration.observe(perf_counter() - start)
+            requests.inc()
+            if received:
+                REQUEST_BYTES.labels(route).inc(received)
+            if sent and method != "HEAD":
+                response_bytes.inc(sent)
+
+
+class ProfilingMiddleware:
+    """
+    依 `profiler.sample_rate` 抽出一部分請求做 CPU 取樣（見 profiling.py）
+
+    停用時每個請求只多一次比較。放在 MetricsMiddleware 內側，取樣的根節點為請求處理本身。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.should_sample():
+            await self.app(scope, receive, send)
+            return
+        profiler.begin(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end()
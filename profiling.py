@@ -0,0 +1,152 @@
+"""
+取樣式 CPU 分析
+
+以 ITIMER_PROF 計時器每隔一段 CPU 時間中斷主執行緒（事件迴圈），記錄正在執行的 Python 呼叫堆疊。
+只有被抽中的請求（`sample_rate` 的比例）正在執行時的取樣會被記錄，堆疊的根節點是該請求的方法與路由範本；
+輸出為 flamegraph.pl、speedscope、inferno 都能讀取的 collapsed stacks 格式，每行一個堆疊與次數：
+
+    GET /notes/all/;routers/notes.py:get_all_notes;common.py:fetch_notes_page;common.py:summarize_note 12
+
+- 啟用期間計時器持續運轉，中斷時不在被抽中的請求中就直接返回；停用時（sample_rate 為 0）計時器停止，
+  每個請求只多一次比較。實際間隔受核心計時精度影響（常見為 1~4ms 的倍數）
+- 只看得到事件迴圈執行緒上的 Python 程式碼：執行緒池與 aiosqlite 背景執行緒中的工作（SQL 查詢）不在其中，
+  等待 I/O 的時間也不會被取樣，SQL 的時間見慢查詢記錄（slow_query.py）
+- 訊號處理函式只能在主執行緒安裝，須在事件迴圈（uvicorn 的主執行緒）中啟用；不支援 setitimer 的平台（Windows）無法使用
+- 多個工作程序時每個程序各自取樣；fork 出的子程序不繼承計時器，啟用中時在子程序重新啟動
+
+這個模組只依賴標準函式庫，不讀取 Config；設定由 common.py 傳入。
+"""
+import asyncio
+import os
+import random
+import signal
+from asyncio.events import Handle
+
+# 取樣時往外走到這個 frame 為止（事件迴圈本身的 frame 不記錄）
+_LOOP_ENTRY = Handle._run.__code__
+_ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = filename[len(_ROOT):]
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    return f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackProfiler:
+    """對一部分請求取樣呼叫堆疊（只在事件迴圈的執行緒中使用）"""
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.interval = 0.005
+        self.sampled_requests = 0
+        self.samples = 0
+        self._stacks: dict = {}  # (請求標籤, code 物件的 tuple) → 次數
+        self._active: dict = {}  # 被抽中的請求：task → scope
+        self._installed = False
+        self._labels: dict = {}  # code → frame 標籤
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(signal, "setitimer")
+
+    def configure(self, sample_rate: float, interval: float | None = None):
+        """
+        - **sample_rate**: 做取樣的請求比例（0 ~ 1），0 為停用
+        - **interval**: 可選，取樣間隔（秒，CPU 時間）
+
+        Raises:
+            RuntimeError: 平台不支援，或不是在主執行緒中啟用
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if interval is not None:
+            if interval <= 0:
+                raise ValueError("interval must be positive")
+            self.interval = interval
+        if sample_rate > 0 and not self._installed:
+            if not self.available():
+                raise RuntimeError("signal.setitimer is not available on this platform")
+            try:
+                # 安裝後不再移除：計時器停止後仍可能有一個尚未處理的 SIGPROF，預設動作會結束程序
+                signal.signal(signal.SIGPROF, self._on_signal)
+            except ValueError as e:  # 不是主執行緒
+                raise RuntimeError(str(e)) from e
+            self._installed = True
+        self.sample_rate = sample_rate
+        # 不在每個請求開始與結束時啟動、停止計時器：每次設定都會進位到核心的計時精度，短的請求永遠等不到中斷
+        if self._installed:
+            signal.setitimer(signal.ITIMER_PROF, self.interval if sample_rate > 0 else 0, self.interval)
+
+    def _after_fork(self):
+        self._active.clear()
+        if self._installed and self.sample_rate > 0:
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self, scope: dict):
+        """被抽中的請求開始處理（在請求的 task 中呼叫）"""
+        task = asyncio.current_task()
+        if task is None or not self._installed:
+            return
+        self.sampled_requests += 1
+        self._active[task] = scope
+
+    def end(self):
+        """被抽中的請求處理完畢"""
+        self._active.pop(asyncio.current_task(), None)
+
+    def _on_signal(self, signum, frame):
+        # 中斷時正在執行的 task 不是被抽中的請求（其他請求、背景工作、事件迴圈本身）時不記錄
+        try:
+            scope = self._active.get(asyncio.current_task())
+        except RuntimeError:  # 沒有執行中的事件迴圈
+            return
+        if scope is None:
+            return
+        codes = []
+        while frame is not None and frame.f_code is not _LOOP_ENTRY:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        route = getattr(scope.get("route"), "path", "other")
+        key = (f"{scope['method']} {route}", tuple(codes))
+        self._stacks[key] = self._stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """collapsed stacks 格式的取樣結果（由外而內，以分號分隔）"""
+        lines = []
+        for (request, codes), count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+            frames = [request]
+            for code in reversed(codes):
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _frame_label(code).replace(";", ":")
+                frames.append(label)
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self):
+        self._stacks.clear()
+        self.samples = 0
+        self.sampled_requests = 0
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval * 1000,
+            "sampled_requests": self.sampled_requests,
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+        }
+
+
+# 全域的取樣器
+profiler = StackProfiler()
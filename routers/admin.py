@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+import logging
+
+from profiling import profiler
+from slow_query import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["效能診斷"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/profiler")
+async def get_profiler():
+    """
+    CPU 取樣的設定與目前累積的取樣數
+
+    Returns:
+        - **sample_rate**: 做取樣的請求比例，0 為停用
+        - **interval_ms**: 取樣間隔（CPU 時間）
+        - **sampled_requests** / **samples** / **stacks**: 被抽中的請求數、取樣數、不同的堆疊數
+    """
+    return profiler.stats()
+
+@router.put("/profiler")
+async def configure_profiler(data: dict):
+    """
+    啟用、調整或停用 CPU 取樣（只影響目前的程序）
+
+    - **sample_rate**: 做取樣的請求比例（0 ~ 1），0 為停用
+    - **interval_ms**: 可選，取樣間隔（CPU 時間的毫秒數）
+    """
+    sample_rate = data.get("sample_rate")
+    interval_ms = data.get("interval_ms")
+    if not isinstance(sample_rate, (int, float)) or (
+            interval_ms is not None and not isinstance(interval_ms, (int, float))):
+        raise HTTPException(status_code=400, detail="sample_rate (and optional interval_ms) must be numbers")
+    try:
+        profiler.configure(sample_rate, None if interval_ms is None else interval_ms / 1000)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info("CPU 取樣設定: 比例=%s, 間隔=%sms", profiler.sample_rate, profiler.interval * 1000)
+    return profiler.stats()
+
+@router.get("/profiler/stacks", response_class=PlainTextResponse)
+async def get_profiler_stacks(reset: bool = False):
+    """
+    累積的取樣，collapsed stacks 格式（每行「請求;外層函式;...;內層函式 次數」）
+
+    可直接交給 flamegraph.pl、inferno-flamegraph 或 speedscope 產生火焰圖。
+
+    - **reset**: 可選，取出後清除累積的取樣
+    """
+    stacks = profiler.collapsed()
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(stacks)
+
+@router.delete("/profiler/stacks")
+async def reset_profiler_stacks():
+    """清除累積的取樣"""
+    profiler.reset()
+    return {"message": "Profiler samples cleared"}
+
+@router.get("/slow-queries")
+async def get_slow_queries(limit: int = 50):
+    """
+    最近的慢查詢（由新到舊）
+
+    - **limit**: 可選，回傳筆數（最多為保留的筆數）
+
+    Returns:
+        - **threshold_ms**: 目前的門檻，null 為停用
+        - **count**: 本程序記錄過的慢查詢總數
+        - **queries**: 每筆有 time、duration_ms、sql、binds（參數個數）、plan（EXPLAIN QUERY PLAN），
+          executemany 另有 executions
+    """
+    entries = list(slow_query_log.entries)
+    entries.reverse()
+    return {**slow_query_log.stats(), "queries": entries[:max(0, limit)]}
+
+@router.put("/slow-queries")
+async def configure_slow_queries(data: dict):
+    """
+    設定慢查詢的門檻（只影響目前的程序）
+
+    - **threshold_ms**: 執行超過此毫秒數的語句會被記錄，null 為停用
+    """
+    threshold_ms = data.get("threshold_ms")
+    if threshold_ms is not None and (not isinstance(threshold_ms, (int, float)) or threshold_ms < 0):
+        raise HTTPException(status_code=400, detail="threshold_ms must be a non-negative number or null")
+    slow_query_log.configure(threshold_ms)
+    logger.info("慢查詢門檻: %sms", threshold_ms)
+    return slow_query_log.stats()
+
+@router.delete("/slow-queries")
+async def clear_slow_queries():
+    """清除保留的慢查詢記錄"""
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import hashlib
+import logging
 import os
 from pathlib import Path
 import sys
 from typing import List
 
 # 從common模組導入相關功能
-from common import get_db_connection, Config, logger
+from common import (Database, get_db, Config, acquire_blob, release_blob, blob_storage, encode_cursor,
+                    decode_cursor, file_cache, share_cache, cache_sync)
+from file_serving import get_file_metadata, locate_blob, presigned_redirect, serve_stored_file
+from jobs import enqueue_upload_jobs
+from thumbnails import choose_format, choose_width, ensure_thumbnail, is_thumbnailable, remove_derivatives
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/files",
@@ -15,8 +23,106 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+async def _hash_upload(file: UploadFile) -> tuple:
+    """
+    以固定大小分段讀取上傳檔案並計算內容 hash
+    
+    hash 在執行緒池中計算，不會把整個檔案載入記憶體。
+    超過 `Config.MAX_CONTENT_LENGTH` 時立即中止並回應 413。
+    
+    Returns:
+        (內容 hash, 檔案大小)
+    """
+    hasher = hashlib.new(Config.BLOB_HASH_ALGORITHM)
+    file_size = 0
+    while chunk := await file.read(Config.UPLOAD_CHUNK_SIZE):
+        file_size += len(chunk)
+        if file_size > Config.MAX_CONTENT_LENGTH:
+            raise HTTPException(status_code=413, detail="File too large")
+        await run_in_threadpool(hasher.update, chunk)
+    return hasher.hexdigest(), file_size
+
+async def _store_upload(file: UploadFile, stored_filename: str):
+    """
+    將上傳檔案分段寫入暫存檔，完成後交給儲存後端（本機為原子性地改名，S3 為上傳到物件儲存）
+    
+    磁碟與網路 I/O 都在執行緒池中進行，不會阻塞事件迴圈。
+    """
+    await file.seek(0)
+    fd, temp_path = blob_storage.create_temp()
+    out = os.fdopen(fd, "wb")
+    try:
+        while chunk := await file.read(Config.UPLOAD_CHUNK_SIZE):
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(blob_storage.store, temp_path, stored_filename)
+    except BaseException:
+        out.close()
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+async def register_file(db: Database, stored_filename: str, original_filename: str,
+                        file_size: int, store) -> dict:
+    """
+    將已計算 hash 的檔案登記到 files 資料表
+    
+    blob 已存在時完全略過寫入；否則呼叫 `await store(stored_filename)` 寫入實體檔案，
+    並在同一個交易中加入上傳後處理的背景工作（縮圖等），不等待完成。
+    一般上傳與續傳上傳都經由此函數登記。
+    
+    Returns:
+        上傳 API 的回應內容
+    """
+    # 內容已存在時完全略過寫入
+    deduplicated = await run_in_threadpool(blob_storage.exists, stored_filename)
+    if deduplicated:
+        logger.debug("檔案內容已存在，略過寫入: %s", stored_filename)
+    else:
+        logger.debug("寫入新的 blob: %s", stored_filename)
+        await store(stored_filename)
+    
+    # 確定檔案類型
+    file_extension = Path(original_filename).suffix.lower()[1:]
+    file_type = Config.get_file_type(file_extension)
+    logger.debug("判斷檔案類型: %s", file_type)
+    
+    # 構建檔案 URL
+    file_url = f"http://127.0.0.1:8000/files/download/{stored_filename}"
+    
+    # 儲存檔案資訊到數據庫
+    async with db.writer() as conn:
+        # 刪除檔案時可能已回收同一個 blob，取得寫入鎖後再確認一次實體檔案仍存在；
+        # 寫入交易一開始就持有 SQLite 的寫入鎖，其他工作程序的刪除不會在確認與登記之間回收它
+        if not await run_in_threadpool(blob_storage.exists, stored_filename):
+            logger.info("blob 已被回收，重新寫入: %s", stored_filename)
+            await store(stored_filename)
+            deduplicated = False
+        
+        logger.debug("插入檔案記錄到資料庫")
+        await acquire_blob(conn, stored_filename, file_size)
+        await conn.execute(
+            "INSERT INTO files (url, filename, original_filename, size, type) VALUES (?, ?, ?, ?, ?)",
+            (file_url, stored_filename, original_filename, file_size, file_type)
+        )
+        # 新的內容才需要處理；與檔案記錄一起 commit，重新啟動也不會遺失
+        if not deduplicated:
+            await enqueue_upload_jobs(conn, stored_filename)
+    
+    logger.info("檔案上傳完成: %s", stored_filename, extra={
+        "original_filename": original_filename, "size": file_size, "type": file_type, "deduplicated": deduplicated,
+    })
+    return {
+        "url": file_url,
+        "filename": stored_filename,
+        "originalFilename": original_filename,
+        "fileSize": file_size,
+        "fileType": file_type,
+        "deduplicated": deduplicated
+    }
+
 @router.post("/upload/")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), db: Database = Depends(get_db)):
     """
     上傳檔案（支援圖片、影片、音訊等多種格式）
     
@@ -28,187 +134,207 @@ async def upload_file(file: UploadFile = File(...)):
         - **originalFilename**: 原始檔名
         - **fileSize**: 檔案大小 (bytes)
         - **fileType**: 檔案類型 (image/video/audio/document/archive)
+        - **deduplicated**: 相同內容已存在、未重複寫入時為 true
     """
     try:
-        logger.info(f"開始處理檔案上傳: {file.filename}")
+        logger.debug("開始處理檔案上傳: %s", file.filename)
         
         # 驗證檔案類型
         file_extension = Path(file.filename).suffix.lower()[1:]
-        logger.info(f"檔案副檔名: {file_extension}")
+        logger.debug("檔案副檔名: %s", file_extension)
         
         if not Config.is_allowed_file(file.filename):
-            logger.warning(f"不支援的檔案類型: {file_extension}")
+            logger.warning("不支援的檔案類型: %s", file_extension)
             raise HTTPException(status_code=400, detail=f"不支援的檔案類型: {file_extension}")
             
-        # 計算檔案hash值
-        file_content = await file.read()
-        file_size = len(file_content)
-        file_hash = hashlib.md5(file_content).hexdigest()
-        original_filename = file.filename
+        # 先計算內容 hash，相同內容的檔案只會儲存一份
+        file_hash, file_size = await _hash_upload(file)
         stored_filename = f"{file_hash}{Path(file.filename).suffix}"
+        logger.debug("檔案資訊: 大小=%sbytes, Hash=%s", file_size, file_hash)
         
-        logger.info(f"檔案資訊: 大小={file_size}bytes, Hash={file_hash}")
-        
-        # 儲存檔案
-        file_location = Path(Config.UPLOAD_FOLDER) / stored_filename
-        logger.info(f"儲存檔案位置: {file_location}")
-        
-        with open(file_location, "wb") as f:
-            f.write(file_content)
-        
-        # 確定檔案類型
-        file_type = Config.get_file_type(file_extension)
-        logger.info(f"判斷檔案類型: {file_type}")
-        
-        # 構建檔案 URL
-        file_url = f"http://127.0.0.1:8000/files/download/{stored_filename}"
-        
-        # 儲存檔案資訊到數據庫
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            logger.info("確保資料表存在")
-            # 確保資料表存在
-            cursor.execute('''CREATE TABLE IF NOT EXISTS files
-                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            url TEXT NOT NULL,
-                            filename TEXT NOT NULL,
-                            original_filename TEXT NOT NULL,
-                            size INTEGER NOT NULL,
-                            type TEXT NOT NULL,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-            
-            logger.info("插入檔案記錄到資料庫")
-            cursor.execute(
-                "INSERT INTO files (url, filename, original_filename, size, type) VALUES (?, ?, ?, ?, ?)",
-                (file_url, stored_filename, original_filename, file_size, file_type)
-            )
-            conn.commit()
-        
-        logger.info(f"檔案上傳完成: {stored_filename}")
-        return {
-            "url": file_url,
-            "filename": stored_filename,
-            "originalFilename": original_filename,
-            "fileSize": file_size,
-            "fileType": file_type
-        }
+        return await register_file(db, stored_filename, file.filename, file_size,
+                                   lambda name: _store_upload(file, name))
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"上傳檔案失敗: {str(e)}", exc_info=True)
+        logger.error("上傳檔案失敗: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request, db: Database = Depends(get_db)):
     """
     下載或預覽檔案
     
+    支援 ETag / Last-Modified 條件式請求（304）與 Range 請求（206）。
+    儲存後端為 S3 時重定向（302）到預簽網址，由用戶端直接向物件儲存下載。
+    
     - **filename**: 要下載的檔案名稱 (hash + 副檔名)
     """
-    logger.info(f"請求下載/預覽檔案: {filename}")
+    logger.debug("請求下載/預覽檔案: %s", filename)
     
-    file_location = Path(Config.UPLOAD_FOLDER) / filename
-    if not file_location.exists():
-        logger.warning(f"請求的檔案不存在: {filename}")
+    # 獲取原始檔名（快取未命中時才查詢資料庫）
+    metadata = await get_file_metadata(db, filename)
+    if metadata:
+        original_filename = metadata['original_filename']
+        file_type = metadata['type']
+    else:
+        logger.warning("資料庫中找不到檔案記錄: %s", filename)
+        original_filename = filename
+        file_type = Config.get_file_type(filename.split('.')[-1])
+    
+    # 有檔案記錄時 blob 一定存在，重定向前不必再詢問物件儲存
+    redirect = presigned_redirect(filename, original_filename, file_type)
+    if redirect is not None and (metadata or await run_in_threadpool(blob_storage.exists, filename)):
+        return redirect
+    
+    file_location = await locate_blob(filename)
+    if file_location is None:
+        logger.warning("請求的檔案不存在: %s", filename)
         raise HTTPException(status_code=404, detail="File not found")
     
-    # 從資料庫獲取原始檔名
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT original_filename, type FROM files WHERE filename = ?", (filename,))
-        result = cursor.fetchone()
-        
-        if result:
-            original_filename = result['original_filename']
-            file_type = result['type']
-            logger.info(f"找到檔案記錄: 原始檔名={original_filename}, 類型={file_type}")
-        else:
-            logger.warning(f"資料庫中找不到檔案記錄: {filename}")
-            original_filename = filename
-            file_type = Config.get_file_type(filename.split('.')[-1])
-    
-    # 對於圖片和影片，直接在瀏覽器中預覽
-    if file_type in ['image', 'video']:
-        logger.info(f"提供檔案預覽: {file_type}")
-        return FileResponse(
-            str(file_location),
-            media_type=f"{file_type}/{filename.split('.')[-1].lower()}"
-        )
+    return await serve_stored_file(request, file_location, original_filename, file_type)
+
+@router.get("/thumbnail/{filename}")
+async def get_thumbnail(filename: str, request: Request, w: int = 320, format: str = None):
+    """
+    圖片縮圖
+    
+    依 Accept 標頭選擇 AVIF 或 WebP（回應帶 `Vary: Accept`），寬度對應到不小於 w 的最小預設寬度，
+    不會放大原圖。縮圖尚未產生（或已被逐出）時當場產生。Pillow 不支援這兩種格式時改用 JPEG（或 PNG）。
+    
+    - **filename**: 原圖檔名 (hash + 副檔名)
+    - **w**: 需要的寬度（像素）
+    - **format**: 可選，指定 avif 或 webp，不依 Accept 選擇
+    """
+    if not is_thumbnailable(filename):
+        raise HTTPException(status_code=400, detail="Not an image")
+    try:
+        fmt = choose_format(request.headers.get("accept", ""), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fmt is None:
+        raise HTTPException(status_code=503, detail="No thumbnail format is supported")
     
-    # 其他類型的檔案提供下載
-    logger.info(f"提供檔案下載: {original_filename}")
-    return FileResponse(
-        str(file_location),
-        filename=original_filename,
-        media_type='application/octet-stream'
-    )
+    try:
+        thumbnail = await ensure_thumbnail(filename, choose_width(w), fmt)
+    except Exception as e:
+        logger.error("產生縮圖失敗: %s: %s", filename, e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # 同一個網址依 Accept 可能是不同格式，ETag 需包含格式
+    return await serve_stored_file(request, thumbnail, thumbnail.name, "image",
+                                   etag=f'"{thumbnail.name}"', extra_headers={"vary": "Accept"})
 
 @router.get("/all/")
-async def get_all_files():
+async def get_all_files(limit: int = None, cursor: str = None, db: Database = Depends(get_db)):
     """
-    獲取所有已上傳的檔案列表
+    獲取已上傳的檔案列表
+    
+    - **limit**: 可選，每頁數量；未指定時回傳全部檔案
+    - **cursor**: 可選，上一頁回傳的 next_cursor
     
     Returns:
         - **files**: 檔案列表，包含完整資訊
+        - **next_cursor**: 下一頁游標，沒有下一頁時為 null
     """
     try:
-        logger.info("開始獲取所有檔案列表")
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, url, filename, original_filename, size, type, created_at 
-                FROM files 
-                ORDER BY created_at DESC
-            """)
-            files = [dict(row) for row in cursor.fetchall()]
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    try:
+        logger.debug("開始獲取檔案列表")
+        where = "WHERE (f.created_at, f.id) < (?, ?)" if before else ""
+        params = list(before) if before else []
+        # 多取一筆用來判斷是否還有下一頁；SQLite 的 LIMIT -1 代表不限制
+        params.append(limit + 1 if limit is not None else -1)
+        
+        async with db.reader() as conn:
+            # 圖片的寬高與 blurhash 由縮圖流程寫入 blobs，前端用來預留版面與顯示佔位圖
+            db_cursor = await conn.execute(f"""
+                SELECT f.id, f.url, f.filename, f.original_filename, f.size, f.type, f.created_at,
+                       b.width, b.height, b.blurhash
+                FROM files f
+                LEFT JOIN blobs b ON b.filename = f.filename
+                {where}
+                ORDER BY f.created_at DESC, f.id DESC
+                LIMIT ?
+            """, params)
+            files = [dict(row) for row in await db_cursor.fetchall()]
+        
+        next_cursor = None
+        if limit is not None and len(files) > limit:
+            files = files[:limit]
+            next_cursor = encode_cursor(files[-1]["created_at"], files[-1]["id"])
             
-            logger.info(f"成功獲取檔案列表，數量: {len(files)}")
-            logger.debug(f"檔案列表詳情: {files}")
-            return {"files": files}
+        logger.debug("成功獲取檔案列表，數量: %s", len(files))
+        logger.debug("檔案列表詳情: %s", files)
+        return {"files": files, "next_cursor": next_cursor}
     except Exception as e:
-        logger.error(f"獲取檔案列表失敗: {str(e)}", exc_info=True)
+        logger.error("獲取檔案列表失敗: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{file_id}")
-async def delete_file(file_id: int):
+async def delete_file(file_id: int, db: Database = Depends(get_db)):
     """
     刪除檔案
     
     - **file_id**: 要刪除的檔案ID
     """
     try:
-        logger.info(f"開始刪除檔案 ID: {file_id}")
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        logger.debug("開始刪除檔案 ID: %s", file_id)
+        async with db.writer() as conn:
             # 先獲取檔案資訊
-            cursor.execute("SELECT filename, original_filename FROM files WHERE id = ?", (file_id,))
-            result = cursor.fetchone()
+            cursor = await conn.execute("SELECT filename, original_filename FROM files WHERE id = ?", (file_id,))
+            result = await cursor.fetchone()
             
             if not result:
-                logger.warning(f"找不到要刪除的檔案 ID: {file_id}")
+                logger.warning("找不到要刪除的檔案 ID: %s", file_id)
                 raise HTTPException(status_code=404, detail="File not found")
             
             filename = result['filename']
             original_filename = result['original_filename']
-            logger.info(f"準備刪除檔案: {filename} (原始檔名: {original_filename})")
-            
-            file_path = Path(Config.UPLOAD_FOLDER) / filename
+            logger.debug("準備刪除檔案: %s (原始檔名: %s)", filename, original_filename)
             
-            # 刪除實體檔案
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"已刪除實體檔案: {file_path}")
-            else:
-                logger.warning(f"實體檔案不存在: {file_path}")
+            cursor = await conn.execute("SELECT share_code FROM file_shares WHERE file_id = ?", (file_id,))
+            share_codes = [row['share_code'] for row in await cursor.fetchall()]
             
-            # 從資料庫中刪除記錄
-            cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
-            conn.commit()
-            logger.info(f"已從資料庫中刪除檔案記錄")
+            # 從資料庫中刪除記錄，並減少 blob 的引用數
+            await conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            orphaned = await release_blob(conn, filename)
+            # 其他工作程序的快取
+            await cache_sync.publish(conn, "files", filename)
+            if share_codes:
+                await cache_sync.publish(conn, "shares", *share_codes)
             
-            return {"message": "File deleted successfully"}
+        # 提交後才清除快取，查詢途中讀到的舊結果不會被寫回
+        file_cache.invalidate(filename)
+        share_cache.invalidate(*share_codes)
+        logger.debug("已從資料庫中刪除檔案記錄")
+        
+        if orphaned:
+            # 先提交再刪除實體檔案：另開一個寫入交易（持有 SQLite 的寫入鎖），確認提交後沒有任何程序的上傳
+            # 又引用同一個 blob 才刪除；之後的上傳會在自己的寫入交易中發現檔案不存在而重新寫入
+            async with db.writer() as conn:
+                cursor = await conn.execute("SELECT 1 FROM blobs WHERE filename = ?", (filename,))
+                orphaned = await cursor.fetchone() is None
+                if orphaned:
+                    deleted = await run_in_threadpool(blob_storage.delete, filename)
+        
+        if not orphaned:
+            logger.info("仍有其他檔案記錄引用此 blob，保留實體檔案: %s", filename)
+        elif deleted:
+            logger.info("已刪除實體檔案: %s", filename)
+        else:
+            logger.warning("實體檔案不存在: %s", filename)
+        if orphaned and is_thumbnailable(filename):
+            await remove_derivatives(filename)
+        
+        return {"message": "File deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"刪除檔案失敗: {str(e)}", exc_info=True)
+        logger.error("刪除檔案失敗: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 import hashlib
+import logging
 import os
 from pathlib import Path
 import sys
 
 # 從common模組導入相關功能
-from common import get_db_connection, Config, logger
+from common import Database, get_db, Config, blob_storage
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/images",
@@ -15,7 +19,7 @@ router = APIRouter(
 )
 
 @router.post("/upload/")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(file: UploadFile = File(...), db: Database = Depends(get_db)):
     """
     上傳圖片檔案
     
@@ -42,16 +46,14 @@ async def upload_image(file: UploadFile = File(...)):
         
         # 儲存圖片URL到數據庫
         image_url = f"http://127.0.0.1:8000/images/get/{file_hash}{file_extension}"
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO images (url, filename) VALUES (?, ?)", (image_url, f"{file_hash}{file_extension}"))
-            conn.commit()
+        async with db.writer() as conn:
+            await conn.execute("INSERT INTO images (url, filename) VALUES (?, ?)", (image_url, f"{file_hash}{file_extension}"))
         
         # 回傳圖片 URL
-        logger.info(f"成功上傳圖片: {file_hash}{file_extension}")
+        logger.info("成功上傳圖片: %s%s", file_hash, file_extension)
         return JSONResponse(content={"url": image_url})
     except Exception as e:
-        logger.error(f"上傳圖片失敗: {str(e)}")
+        logger.error("上傳圖片失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/get/{filename}")
@@ -68,7 +70,7 @@ async def get_image(filename: str):
     return FileResponse(str(file_location))
 
 @router.get("/all/")
-async def get_all_images():
+async def get_all_images(db: Database = Depends(get_db)):
     """
     獲取所有已上傳的圖片列表
     
@@ -76,12 +78,11 @@ async def get_all_images():
         - **images**: 圖片列表，包含 URL 和檔名
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT url, filename FROM images ORDER BY created_at DESC")
+        async with db.reader() as conn:
+            cursor = await conn.execute("SELECT url, filename FROM images ORDER BY created_at DESC")
             
             # 將行結果轉換為列表格式，確保前端能正確處理
-            result = cursor.fetchall()
+            result = await cursor.fetchall()
             images = []
             for row in result:
                 # 如果是 Row 對象，轉換為列表
@@ -91,48 +92,44 @@ async def get_all_images():
                     images.append(row)  # 已經是列表或元組格式
             
             # 調試日誌
-            logger.info(f"成功獲取圖片列表，數量: {len(images)}")
+            logger.debug("成功獲取圖片列表，數量: %s", len(images))
             
             # 檢查第一個結果的格式（如果有）
             if images and len(images) > 0:
-                logger.info(f"第一個圖片格式範例: {images[0]}")
+                logger.debug("第一個圖片格式範例: %s", images[0])
                 
         return {"images": images}
     except Exception as e:
-        logger.error(f"獲取圖片列表失敗: {str(e)}")
+        logger.error("獲取圖片列表失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/delete/{filename}")
-async def delete_image(filename: str):
+async def delete_image(filename: str, db: Database = Depends(get_db)):
     """
     刪除指定圖片
     """
-    file_location = Path(Config.UPLOAD_FOLDER) / filename
-    if not file_location.exists():
+    if not await run_in_threadpool(blob_storage.exists, filename):
         return JSONResponse(
             status_code=404,
             content={"message": "Image not found"}
         )
     
     # 從數據庫刪除記錄
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM images WHERE filename = ?", (filename,))
-        conn.commit()
+    async with db.writer() as conn:
+        await conn.execute("DELETE FROM images WHERE filename = ?", (filename,))
     
     # 刪除文件
-    os.remove(file_location)
+    await run_in_threadpool(blob_storage.delete, filename)
     return {"message": "Image deleted successfully"}
 
 @router.get("/info/{filename}")
-async def get_image_info(filename: str):
+async def get_image_info(filename: str, db: Database = Depends(get_db)):
     """
     獲取指定圖片信息
     """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT url, filename, created_at FROM images WHERE filename = ?", (filename,))
-        image = cursor.fetchone()
+    async with db.reader() as conn:
+        cursor = await conn.execute("SELECT url, filename, created_at FROM images WHERE filename = ?", (filename,))
+        image = await cursor.fetchone()
         
         if not image:
             return JSONResponse(
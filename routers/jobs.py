@@ -0,0 +1,84 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+import logging
+
+# 從common模組導入相關功能
+from common import ORJSONResponse
+from jobs import STATUSES, job_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["背景工作"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/")
+async def list_jobs(status: str = None, kind: str = None, limit: int = 50, before_id: int = None):
+    """
+    列出背景工作（由新到舊）
+    
+    - **status**: 可選，queued / running / succeeded / failed
+    - **kind**: 可選，工作種類（例如 image_derivatives）
+    - **limit**: 可選，每頁數量（最多 500）
+    - **before_id**: 可選，上一頁回傳的 next_before_id
+    
+    Returns:
+        - **jobs**: 工作列表
+        - **next_before_id**: 下一頁的 before_id，沒有下一頁時為 null
+    """
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+    limit = max(1, min(limit, 500))
+    try:
+        jobs = await job_queue.list_jobs(status, kind, limit, before_id)
+        next_before_id = jobs[-1]["id"] if len(jobs) == limit else None
+        return ORJSONResponse({"jobs": jobs, "next_before_id": next_before_id})
+    except Exception as e:
+        logger.error("獲取背景工作列表失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats")
+async def get_job_stats():
+    """
+    背景工作佇列的深度與延遲
+    
+    Returns:
+        - **depth**: 等待中、執行中、失敗的工作數（含各種類）
+        - **oldest_queued_s**: 可執行但尚未開始的工作中等待最久的秒數
+        - **processed**: 本程序啟動後完成、失敗與重試的次數
+        - **wait** / **run**: 最近工作的等待時間與執行時間分位數
+    """
+    try:
+        return await job_queue.stats()
+    except Exception as e:
+        logger.error("獲取背景工作統計失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{job_id}")
+async def get_job(job_id: int):
+    """
+    獲取單一背景工作的狀態、執行次數、最後的錯誤與結果
+    """
+    try:
+        job = await job_queue.get(job_id)
+        if not job:
+            return JSONResponse(status_code=404, content={"message": "Job not found"})
+        return ORJSONResponse({"job": job})
+    except Exception as e:
+        logger.error("獲取背景工作失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{job_id}/retry")
+async def retry_job(job_id: int):
+    """
+    重新執行失敗的工作（執行次數歸零）
+    """
+    try:
+        if not await job_queue.retry(job_id):
+            return JSONResponse(status_code=404, content={"message": "Failed job not found"})
+        return {"message": "Job queued"}
+    except Exception as e:
+        logger.error("重試背景工作失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
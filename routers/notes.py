@@ -1,12 +1,22 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import base64
+import orjson
+import tempfile
+import time
+import zipfile
 from pathlib import Path
 import sys
 import json
+import logging
 
 # 從common模組導入相關功能
-from common import get_db_connection, logger
+from common import (Database, get_db, Config, fetch_notes_page, decode_cursor, parse_note_fields, search_note_index,
+                    summarize_note, attach_note_tags, import_notes_batch, set_note_tags, tag_dictionary,
+                    ORJSONResponse)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/notes",
@@ -14,19 +24,26 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+def _validate_tags(data: dict):
+    """tags 須為非空字串的列表（與批次匯入相同），否則回應 400；不是列表時與原本一樣忽略"""
+    tags = data.get("tags")
+    if isinstance(tags, list) and not all(isinstance(t, str) and t for t in tags):
+        raise HTTPException(status_code=400, detail="tags must be a list of non-empty strings")
+
 @router.post("/create/")
-async def save_markdown(data: dict):
+async def save_markdown(data: dict, db: Database = Depends(get_db)):
     """
     建立新文章
     
     - **content**: Base64 編碼的 Markdown 內容
-    - **tags**: 可選，標籤列表
+    - **tags**: 可選，標籤列表（非空字串，否則回應 400）
     
     Returns:
         - **message**: 成功訊息
         - **note_id**: 文章 ID
         - **content_length**: 內容長度
     """
+    _validate_tags(data)
     try:
         if "content" not in data:
             raise HTTPException(status_code=400, detail="Missing content field")
@@ -35,44 +52,35 @@ async def save_markdown(data: dict):
         try:
             content = base64.b64decode(data["content"].encode('utf-8')).decode('utf-8')
         except Exception as e:
-            logger.error(f"Base64解碼失敗: {str(e)}")
+            logger.error("Base64解碼失敗: %s", e)
             raise HTTPException(status_code=400, detail=f"Invalid base64 content: {str(e)}")
             
         if not content:
             raise HTTPException(status_code=400, detail="Empty content after decoding")
             
-        logger.info(f"成功解碼文章內容，長度: {len(content)}")
+        logger.debug("成功解碼文章內容，長度: %s", len(content))
         
-        # 連接SQLite資料庫
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            try:
-                # 插入文章內容
-                cursor.execute("INSERT INTO markdown_notes (content) VALUES (?)", (content,))
+        # 取得寫入連線（區塊結束時自動 commit，失敗時自動 rollback）
+        try:
+            async with db.writer() as conn:
+                # 插入文章內容與摘要
+                summary = summarize_note(content)
+                cursor = await conn.execute("""
+                    INSERT INTO markdown_notes (content, title, excerpt, size, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """, (content, summary["title"], summary["excerpt"], summary["size"]))
                 note_id = cursor.lastrowid
-                logger.info(f"成功插入文章，ID: {note_id}")
+                logger.debug("成功插入文章，ID: %s", note_id)
                 
-                # 處理標籤
+                # 處理標籤（標籤 ID 由記憶體中的對照表解析，關聯一次寫入）
                 if "tags" in data and isinstance(data["tags"], list) and data["tags"]:
-                    for tag_name in data["tags"]:
-                        # 插入標籤(如不存在)
-                        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag_name,))
-                        # 獲取標籤ID
-                        cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
-                        tag_id = cursor.fetchone()[0]
-                        # 建立關聯
-                        cursor.execute("INSERT INTO note_tags (note_id, tag_id) VALUES (?, ?)", 
-                                     (note_id, tag_id))
-                        logger.info(f"添加標籤 '{tag_name}' 到文章 {note_id}")
+                    await set_note_tags(conn, note_id, data["tags"], new_note=True)
+                    logger.debug("添加標籤 %s 到文章 %s", data['tags'], note_id)
                 
-                conn.commit()
-                logger.info(f"文章保存完成，ID: {note_id}")
-                
-            except Exception as e:
-                conn.rollback()
-                logger.error(f"資料庫操作失敗: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+            logger.info("文章保存完成，ID: %s", note_id)
+        except Exception as e:
+            logger.error("資料庫操作失敗: %s", e)
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
         
         return {
             "message": "Markdown saved to database successfully!",
@@ -80,90 +88,308 @@ async def save_markdown(data: dict):
             "content_length": len(content)
         }
     except Exception as e:
-        logger.error(f"保存文章失敗: {str(e)}")
+        logger.error("保存文章失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/all/")
-async def get_all_notes(tag: str = None, limit: int = 50, offset: int = 0):
+async def get_all_notes(tag: str = None, limit: int = 50, offset: int = 0,
+                        cursor: str = None, include_total: bool = True, fields: str = None,
+                        db: Database = Depends(get_db)):
     """
     獲取所有已保存的文章列表
     
     - **tag**: 可選，按標籤過濾
     - **limit**: 可選，每頁數量
     - **offset**: 可選，頁碼
+    - **cursor**: 可選，上一頁回傳的 next_cursor，建議取代 offset 使用；不可與 offset 同時使用（回應 400）
+    - **include_total**: 可選，是否計算總記錄數（需要額外掃描，不需要時請設為 false）
+    - **fields**: 可選，以逗號分隔的欄位（id, title, excerpt, size, created_at, updated_at, tags, content），
+      只顯示列表時請用 `id,title,excerpt,size,updated_at,tags`，不必傳送整篇內容
     
     Returns:
-        - **notes**: 文章列表，包含 ID、內容和建立時間
-        - **total**: 總記錄數
+        - **notes**: 文章列表，預設包含 ID、內容、建立時間和標籤
+        - **total**: 總記錄數，未要求時為 null
+        - **next_cursor**: 下一頁游標，沒有下一頁時為 null
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 如果指定標籤，則進行標籤過濾
-            if tag:
-                query = """
-                SELECT n.id, n.content, n.created_at 
-                FROM markdown_notes n
-                JOIN note_tags nt ON n.id = nt.note_id
-                JOIN tags t ON nt.tag_id = t.id
-                WHERE t.name = ?
-                ORDER BY n.created_at DESC
-                LIMIT ? OFFSET ?
-                """
-                cursor.execute(query, (tag, limit, offset))
-                
-                # 獲取總記錄數
-                cursor.execute("""
-                SELECT COUNT(*) 
-                FROM markdown_notes n
-                JOIN note_tags nt ON n.id = nt.note_id
-                JOIN tags t ON nt.tag_id = t.id
-                WHERE t.name = ?
-                """, (tag,))
-            else:
-                # 不過濾標籤，獲取所有文章
-                query = """
-                SELECT id, content, created_at 
-                FROM markdown_notes 
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-                """
-                cursor.execute(query, (limit, offset))
-                
-                # 獲取總記錄數
-                cursor.execute("SELECT COUNT(*) FROM markdown_notes")
-                
-            total = cursor.fetchone()[0]
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if before is not None and offset:
+        raise HTTPException(status_code=400, detail="cursor and offset cannot be combined")
+    try:
+        fields = parse_note_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        async with db.reader() as conn:
+            # 載入文章與標籤（固定查詢次數）
+            notes, next_cursor = await fetch_notes_page(conn, limit, offset, tag_name=tag, before=before,
+                                                        fields=fields)
             
-            # 執行主查詢
-            notes = []
-            for row in cursor.execute(query, (tag, limit, offset) if tag else (limit, offset)):
-                # 為每篇文章獲取標籤
-                cursor.execute("""
-                SELECT t.name
-                FROM tags t
-                JOIN note_tags nt ON t.id = nt.tag_id
-                WHERE nt.note_id = ?
-                """, (row[0],))
-                tags = [tag[0] for tag in cursor.fetchall()]
-                
-                # 添加文章和標籤到結果
-                notes.append({
-                    "id": row[0],
-                    "content": row[1],
-                    "created_at": row[2],
-                    "tags": tags
-                })
+            # 獲取總記錄數
+            total = None
+            if include_total:
+                if tag:
+                    count_cursor = await conn.execute("""
+                    SELECT COUNT(*) 
+                    FROM markdown_notes n
+                    JOIN note_tags nt ON n.id = nt.note_id
+                    JOIN tags t ON nt.tag_id = t.id
+                    WHERE t.name = ?
+                    """, (tag,))
+                else:
+                    count_cursor = await conn.execute("SELECT COUNT(*) FROM markdown_notes")
+                total = (await count_cursor.fetchone())[0]
+        
+        # 此端點的標籤只回傳名稱
+        if "tags" in fields:
+            for note in notes:
+                note["tags"] = [t["name"] for t in note["tags"]]
             
-        logger.info("成功獲取文章列表")
-        return {"notes": notes, "total": total}
+        logger.debug("成功獲取文章列表")
+        return ORJSONResponse({"notes": notes, "total": total, "next_cursor": next_cursor})
     except Exception as e:
-        logger.error(f"獲取文章列表失敗: {str(e)}")
+        logger.error("獲取文章列表失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/search/")
+async def search_notes(q: str, tag: str = None, limit: int = 20, offset: int = 0,
+                       db: Database = Depends(get_db)):
+    """
+    全文搜尋文章內容
+    
+    - **q**: 搜尋關鍵字，以空白分隔的多個關鍵字須全部符合
+    - **tag**: 可選，按標籤過濾
+    - **limit**: 可選，每頁數量
+    - **offset**: 可選，分頁偏移
+    
+    Returns:
+        - **notes**: 文章列表，包含 ID、建立時間、摘要片段、分數與標籤；符合的文章過多時依新到舊排序且分數為 null
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Missing search query")
+    
+    try:
+        async with db.reader() as conn:
+            notes = await search_note_index(conn, q, limit, offset, tag_name=tag)
+        
+        # 與文章列表一致，標籤只回傳名稱
+        for note in notes:
+            note["tags"] = [t["name"] for t in note["tags"]]
+        
+        return {"notes": notes}
+    except Exception as e:
+        logger.error("搜尋文章失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 批次匯入與匯出
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"}
+ZIP_TYPES = {"application/zip", "application/x-zip-compressed"}
+MAX_REPORTED_ERRORS = 20
+
+def _parse_note_record(line: bytes) -> dict:
+    """
+    解析 NDJSON 的一行
+    
+    Raises:
+        ValueError: 格式錯誤
+    """
+    try:
+        record = orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(record, dict) or not isinstance(record.get("content"), str) or not record["content"]:
+        raise ValueError("content must be a non-empty string")
+    tags = record.get("tags") or []
+    if not isinstance(tags, list) or not all(isinstance(t, str) and t for t in tags):
+        raise ValueError("tags must be a list of non-empty strings")
+    for field in ("created_at", "updated_at"):
+        if not isinstance(record.get(field), (str, type(None))):
+            raise ValueError(f"{field} must be a string or null")
+    if len(record["content"].encode("utf-8")) > Config.BULK_MAX_NOTE_SIZE:
+        raise ValueError("content too large")
+    return {
+        "content": record["content"],
+        "tags": tags,
+        "created_at": record.get("created_at"),
+        "updated_at": record.get("updated_at")
+    }
+
+def _parse_markdown_file(text: str) -> dict:
+    """
+    解析 zip 中的 .md 檔案
+
+    檔案開頭可以有簡單的 front matter 指定標籤：
+
+        ---
+        tags: 旅行, 日本
+        ---
+    """
+    tags = []
+    if text.startswith("---\n"):
+        end = text.find("\n---", 4)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, _, value = line.partition(":")
+                if key.strip() == "tags":
+                    tags = [t.strip() for t in value.strip().strip("[]").split(",") if t.strip()]
+            text = text[end + 4:].lstrip("\n")
+    if not text:
+        raise ValueError("empty note")
+    return {"content": text, "tags": tags, "created_at": None, "updated_at": None}
+
+async def _iter_ndjson_notes(request: Request):
+    """逐行解析串流中的 NDJSON，只在記憶體中保留尚未結束的一行"""
+    buffer = b""
+    line_number = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+        if len(buffer) > Config.BULK_MAX_NOTE_SIZE * 2:
+            raise HTTPException(status_code=400, detail=f"Line {line_number + 1} too long")
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+async def _iter_zip_notes(request: Request):
+    """
+    先把 zip 寫入暫存檔（zip 的目錄在檔案結尾，無法邊收邊解），再逐一讀取 .md 檔案
+    """
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in request.stream():
+            await run_in_threadpool(spool.write, chunk)
+        try:
+            archive = await run_in_threadpool(zipfile.ZipFile, spool)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Invalid zip archive")
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".md"):
+                    continue
+                if info.file_size > Config.BULK_MAX_NOTE_SIZE:
+                    yield info.filename, None
+                    continue
+                yield info.filename, await run_in_threadpool(archive.read, info)
+
+@router.post("/bulk/")
+async def import_notes(request: Request, db: Database = Depends(get_db)):
+    """
+    批次匯入文章
+    
+    請求內容直接串流處理，每 `Config.BULK_BATCH_SIZE` 篇文章寫入一個交易：
+    
+    - `Content-Type: application/x-ndjson`：每行一篇文章
+      `{"content": "Markdown 原文", "tags": ["標籤"], "created_at": "可選"}`
+    - `Content-Type: application/zip`：zip 中的每個 .md 檔案是一篇文章，
+      可用 front matter 的 `tags:` 指定標籤
+    
+    格式錯誤的文章會被略過並列在 errors 中。請求大小上限為 `Config.BULK_MAX_CONTENT_LENGTH`
+    （不受一般上傳的 `MAX_CONTENT_LENGTH` 限制），超過時回應 413，已寫入的批次不會復原。
+    
+    Returns:
+        - **imported**: 匯入的文章數
+        - **skipped**: 略過的文章數
+        - **errors**: 前幾個錯誤（行號或檔名與原因）
+        - **rows_per_second**: 匯入速度
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        source, parse = _iter_ndjson_notes(request), _parse_note_record
+    elif content_type in ZIP_TYPES:
+        source, parse = _iter_zip_notes(request), lambda data: _parse_markdown_file(data.decode("utf-8"))
+    else:
+        raise HTTPException(status_code=415, detail="Content-Type must be application/x-ndjson or application/zip")
+    
+    start = time.perf_counter()
+    imported = 0
+    skipped = 0
+    batches = 0
+    errors = []
+    batch = []
+    
+    async def flush():
+        nonlocal imported, batches
+        async with db.writer() as conn:
+            imported += await import_notes_batch(conn, batch)
+        batches += 1
+        batch.clear()
+    
+    try:
+        async for position, data in source:
+            try:
+                if data is None:
+                    raise ValueError("content too large")
+                batch.append(parse(data))
+            except (ValueError, UnicodeDecodeError) as e:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"at": position, "error": str(e)})
+                continue
+            if len(batch) >= Config.BULK_BATCH_SIZE:
+                await flush()
+        if batch:
+            await flush()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("批次匯入文章失敗（已匯入 %s 篇）: %s", imported, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Import failed after {imported} notes: {str(e)}")
+    
+    elapsed = time.perf_counter() - start
+    logger.info("批次匯入 %s 篇文章（略過 %s 篇），%s 個交易，耗時 %.2fs", imported, skipped, batches, elapsed)
+    return {
+        "imported": imported,
+        "skipped": skipped,
+        "errors": errors,
+        "batches": batches,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_second": round(imported / elapsed, 1) if elapsed else None
+    }
+
+@router.get("/bulk/")
+async def export_notes(db: Database = Depends(get_db)):
+    """
+    串流匯出所有文章（NDJSON，格式與匯入相同，另含 id）
+    
+    依 ID 分批讀取，每批 `Config.BULK_BATCH_SIZE` 篇，記憶體用量與文章總數無關。
+    每批各自借用一次讀取連線，匯出期間不會長時間佔用連線池。
+    """
+    async def generate():
+        start = time.perf_counter()
+        exported = 0
+        last_id = 0
+        while True:
+            async with db.reader() as conn:
+                cursor = await conn.execute("""
+                    SELECT id, content, created_at, updated_at FROM markdown_notes
+                    WHERE id > ? ORDER BY id LIMIT ?
+                """, (last_id, Config.BULK_BATCH_SIZE))
+                notes = [dict(row) for row in await cursor.fetchall()]
+                await attach_note_tags(conn, notes)
+            if not notes:
+                break
+            last_id = notes[-1]["id"]
+            exported += len(notes)
+            for note in notes:
+                note["tags"] = [t["name"] for t in note["tags"]]
+            yield b"".join(orjson.dumps(note) + b"\n" for note in notes)
+        elapsed = time.perf_counter() - start
+        logger.info("匯出 %s 篇文章，耗時 %.2fs（%.0f 篇/秒）", exported, elapsed, exported / elapsed if elapsed else 0)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'}
+    )
+
 @router.get("/{note_id}")
-async def get_note(note_id: int):
+async def get_note(note_id: int, db: Database = Depends(get_db)):
     """
     獲取指定文章
     
@@ -171,12 +397,10 @@ async def get_note(note_id: int):
         - **note**: 文章資訊
         - **tags**: 文章標籤
     """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
+    async with db.reader() as conn:
         # 獲取文章內容
-        cursor.execute("SELECT id, content, created_at FROM markdown_notes WHERE id = ?", (note_id,))
-        note = cursor.fetchone()
+        cursor = await conn.execute("SELECT id, content, created_at FROM markdown_notes WHERE id = ?", (note_id,))
+        note = await cursor.fetchone()
         
         if not note:
             return JSONResponse(
@@ -185,13 +409,13 @@ async def get_note(note_id: int):
             )
             
         # 獲取文章標籤
-        cursor.execute("""
+        cursor = await conn.execute("""
         SELECT t.name
         FROM tags t
         JOIN note_tags nt ON t.id = nt.tag_id
         WHERE nt.note_id = ?
         """, (note_id,))
-        tags = [tag[0] for tag in cursor.fetchall()]
+        tags = [tag[0] for tag in await cursor.fetchall()]
         
         # 轉換為字典以便添加標籤
         note_dict = {
@@ -204,21 +428,25 @@ async def get_note(note_id: int):
     return {"note": note_dict}
 
 @router.put("/{note_id}")
-async def update_note(note_id: int, data: dict):
+async def update_note(note_id: int, data: dict, db: Database = Depends(get_db)):
     """
     更新指定文章
     
     - **content**: Base64 編碼的 Markdown 內容
-    - **tags**: 可選，標籤列表
+    - **tags**: 可選，標籤列表（非空字串，否則回應 400）
     """
+    _validate_tags(data)
     try:
         content = base64.b64decode(data["content"]).decode('utf-8')
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 更新文章內容
-            cursor.execute("UPDATE markdown_notes SET content = ? WHERE id = ?", (content, note_id))
+        async with db.writer() as conn:
+            # 更新文章內容與摘要
+            summary = summarize_note(content)
+            cursor = await conn.execute("""
+                UPDATE markdown_notes
+                SET content = ?, title = ?, excerpt = ?, size = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (content, summary["title"], summary["excerpt"], summary["size"], note_id))
             
             # 如果沒有更新任何行，說明文章不存在
             if cursor.rowcount == 0:
@@ -227,53 +455,36 @@ async def update_note(note_id: int, data: dict):
                     content={"message": "Note not found"}
                 )
                 
-            # 處理標籤更新
+            # 處理標籤更新：只寫入新增與移除的關聯
             if "tags" in data and isinstance(data["tags"], list):
-                # 刪除舊標籤關聯
-                cursor.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
-                
-                # 添加新標籤
-                for tag_name in data["tags"]:
-                    # 插入標籤(如不存在)
-                    cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag_name,))
-                    # 獲取標籤ID
-                    cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
-                    tag_id = cursor.fetchone()[0]
-                    # 建立關聯
-                    cursor.execute("INSERT INTO note_tags (note_id, tag_id) VALUES (?, ?)", 
-                                 (note_id, tag_id))
-            
-            conn.commit()
+                await set_note_tags(conn, note_id, data["tags"])
         
         return {"message": "Note updated successfully"}
     except Exception as e:
-        logger.error(f"更新文章失敗: {str(e)}")
+        logger.error("更新文章失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{note_id}")
-async def delete_note(note_id: int):
+async def delete_note(note_id: int, db: Database = Depends(get_db)):
     """
     刪除指定文章
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        async with db.writer() as conn:
             # 刪除標籤關聯
-            cursor.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
+            cursor = await conn.execute("DELETE FROM note_tags WHERE note_id = ? RETURNING tag_id", (note_id,))
+            tag_dictionary.adjust_counts({row[0]: -1 for row in await cursor.fetchall()})
             
             # 刪除文章
-            cursor.execute("DELETE FROM markdown_notes WHERE id = ?", (note_id,))
+            cursor = await conn.execute("DELETE FROM markdown_notes WHERE id = ?", (note_id,))
             
             if cursor.rowcount == 0:
                 return JSONResponse(
                     status_code=404,
                     content={"message": "Note not found"}
                 )
-                
-            conn.commit()
         
         return {"message": "Note deleted successfully"}
     except Exception as e:
-        logger.error(f"刪除文章失敗: {str(e)}")
+        logger.error("刪除文章失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
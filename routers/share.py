@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import RedirectResponse
+import logging
 import secrets
-from common import get_db_connection, logger
+from common import Database, get_db, Config, share_cache, cache_sync
+from file_serving import download_url, get_shared_file_metadata, locate_blob, presigned_redirect, serve_stored_file
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/share",
@@ -9,7 +14,7 @@ router = APIRouter(
 )
 
 @router.post("/create/{file_id}")
-async def create_share_link(file_id: int):
+async def create_share_link(file_id: int, db: Database = Depends(get_db)):
     """
     為指定檔案創建分享連結
     
@@ -21,63 +26,78 @@ async def create_share_link(file_id: int):
         # 生成隨機分享代碼
         share_code = secrets.token_urlsafe(8)
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        async with db.writer() as conn:
             # 檢查檔案是否存在
-            cursor.execute("SELECT id FROM files WHERE id = ?", (file_id,))
-            if not cursor.fetchone():
+            cursor = await conn.execute("SELECT id FROM files WHERE id = ?", (file_id,))
+            if not await cursor.fetchone():
                 raise HTTPException(status_code=404, detail="File not found")
             
             # 儲存分享記錄
-            cursor.execute("""
+            await conn.execute("""
                 INSERT INTO file_shares (file_id, share_code, created_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
             """, (file_id, share_code))
-            
-            conn.commit()
+            await conn.commit()
+            # 提交後才清除快取，查詢途中讀到的舊結果不會被寫回
+            share_cache.invalidate(share_code)
             
         return {
             "share_code": share_code,
             "url": f"/share/{share_code}"
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"創建分享連結失敗: {str(e)}")
+        logger.error("創建分享連結失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{share_code}")
-async def get_shared_file(share_code: str):
+async def get_shared_file(share_code: str, request: Request, db: Database = Depends(get_db)):
     """
-    獲取分享的檔案，直接提供下載或預覽連結
+    獲取分享的檔案
+    
+    預設重定向到 `/files/download/{filename}`；`Config.SHARE_SERVE_DIRECT` 為 True 時直接傳送檔案
+    （儲存後端為 S3 時直接重定向到預簽網址），省去一次往返。
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT f.id, f.filename, f.original_filename, f.type
-                FROM files f
-                JOIN file_shares fs ON f.id = fs.file_id
-                WHERE fs.share_code = ?
-            """, (share_code,))
-            
-            result = cursor.fetchone()
-            if not result:
+        shared = await get_shared_file_metadata(db, share_code)
+        if not shared:
+            raise HTTPException(status_code=404, detail="Shared file not found")
+        
+        if not Config.SHARE_SERVE_DIRECT:
+            return RedirectResponse(url=download_url(shared["filename"]), status_code=303)
+        
+        redirect = presigned_redirect(shared["filename"], shared["original_filename"], shared["type"])
+        if redirect is not None:
+            return redirect
+        
+        file_location = await locate_blob(shared["filename"])
+        if file_location is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return await serve_stored_file(request, file_location, shared["original_filename"], shared["type"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("獲取分享檔案失敗: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{share_code}")
+async def revoke_share_link(share_code: str, db: Database = Depends(get_db)):
+    """
+    撤銷分享連結
+    """
+    try:
+        async with db.writer() as conn:
+            cursor = await conn.execute("DELETE FROM file_shares WHERE share_code = ?", (share_code,))
+            if cursor.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Shared file not found")
-            
-            file_id, filename, original_filename, file_type = result
-            
-            # 根據檔案類型重定向到相應的處理路由
-            if file_type == 'image':
-                from fastapi.responses import RedirectResponse
-                return RedirectResponse(url=f"/files/download/{filename}", status_code=303)
-            elif file_type == 'video':
-                from fastapi.responses import RedirectResponse
-                return RedirectResponse(url=f"/files/download/{filename}", status_code=303)
-            else:
-                # 其他類型檔案直接下載
-                from fastapi.responses import RedirectResponse
-                return RedirectResponse(url=f"/files/download/{filename}", status_code=303)
+            await cache_sync.publish(conn, "shares", share_code)
+            await conn.commit()
+            share_cache.invalidate(share_code)
+        
+        return {"message": "Share link revoked"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"獲取分享檔案失敗: {str(e)}")
+        logger.error("撤銷分享連結失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
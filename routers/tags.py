@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import JSONResponse
+import logging
 from pathlib import Path
 import sys
 
 # 從common模組導入相關功能
-from common import get_db_connection, logger
+from common import (Database, get_db, fetch_notes_page, decode_cursor, parse_note_fields, tag_dictionary,
+                    cache_sync, ORJSONResponse)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/tags",
@@ -13,7 +17,7 @@ router = APIRouter(
 )
 
 @router.get("/all/")
-async def get_all_tags():
+async def get_all_tags(db: Database = Depends(get_db)):
     """
     獲取所有標籤列表
     
@@ -21,98 +25,85 @@ async def get_all_tags():
         - **tags**: 標籤列表
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT t.id, t.name, COUNT(nt.note_id) as note_count
-                FROM tags t
-                LEFT JOIN note_tags nt ON t.id = nt.tag_id
-                GROUP BY t.id
-                ORDER BY note_count DESC, t.name ASC
+        async with db.reader() as conn:
+            # note_count 由 note_tags 的觸發器維護，不必每次 GROUP BY
+            cursor = await conn.execute("""
+                SELECT id, name, note_count
+                FROM tags
+                ORDER BY note_count DESC, name ASC
             """)
-            
-            tags = []
-            for row in cursor:
-                tags.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "note_count": row[2]
-                })
-            
-        logger.info("成功獲取所有標籤列表")
-        return {"tags": tags}
+            # 一次取回，避免逐列在執行緒間往返
+            rows = await cursor.fetchall()
+
+        tags = [{"id": row[0], "name": row[1], "note_count": row[2]} for row in rows]
+        logger.debug("成功獲取所有標籤列表")
+        return ORJSONResponse({"tags": tags})
     except Exception as e:
-        logger.error(f"獲取標籤列表失敗: {str(e)}")
+        logger.error("獲取標籤列表失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/search/")
-async def search_tags(query: str = ""):
+async def search_tags(query: str = "", limit: int = 20, db: Database = Depends(get_db)):
     """
-    搜尋標籤
+    搜尋標籤（編輯器的自動完成）
+    
+    由記憶體中的索引回應，不查詢資料庫。可輸入名稱、名稱中任一詞、拼音、拼音首字母或注音的前綴，
+    結果依使用次數排序；前綴結果不足時補上包含關鍵字或只差一個字的標籤。
+    
+    索引在背景建立（啟動後或失效時），建立完成前改為在資料庫中比對名稱：
+    名稱以關鍵字開頭的標籤在前，再依使用次數排序，不支援拼音、注音與模糊比對。
     
     - **query**: 搜尋關鍵字
+    - **limit**: 回傳數量（最多 64）
     
     Returns:
         - **tags**: 符合的標籤列表
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT t.id, t.name, COUNT(nt.note_id) as note_count
-                FROM tags t
-                LEFT JOIN note_tags nt ON t.id = nt.tag_id
-                WHERE t.name LIKE ?
-                GROUP BY t.id
-                ORDER BY note_count DESC, t.name ASC
-                LIMIT 20
-            """, (f"%{query}%",))
-            
-            tags = []
-            for row in cursor:
-                tags.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "note_count": row[2]
-                })
-            
-        return {"tags": tags}
+        if not tag_dictionary.loaded:
+            tag_dictionary.start_loading(db)
+            async with db.reader() as conn:
+                return ORJSONResponse({"tags": await tag_dictionary.search_database(conn, query, limit)})
+        index = tag_dictionary.index
+        tags = [
+            {"id": tag_id, "name": index.names[tag_id], "note_count": index.counts[tag_id]}
+            for tag_id in index.search(query, limit)
+        ]
+        return ORJSONResponse({"tags": tags})
     except Exception as e:
-        logger.error(f"搜尋標籤失敗: {str(e)}")
+        logger.error("搜尋標籤失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{tag_id}")
-async def delete_tag(tag_id: int):
+async def delete_tag(tag_id: int, db: Database = Depends(get_db)):
     """
     刪除標籤
     
     - 刪除標籤會自動刪除與文章的關聯，但不會刪除文章本身
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        async with db.writer() as conn:
             # 刪除標籤關聯
-            cursor.execute("DELETE FROM note_tags WHERE tag_id = ?", (tag_id,))
+            await conn.execute("DELETE FROM note_tags WHERE tag_id = ?", (tag_id,))
             
             # 刪除標籤
-            cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+            cursor = await conn.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
             
             if cursor.rowcount == 0:
                 return JSONResponse(
                     status_code=404,
                     content={"message": "Tag not found"}
                 )
-                
-            conn.commit()
+            await cache_sync.publish(conn, "tags", tag_id)
+            tag_dictionary.remove(tag_id)
         
         return {"message": "Tag deleted successfully"}
     except Exception as e:
-        logger.error(f"刪除標籤失敗: {str(e)}")
+        logger.error("刪除標籤失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{tag_id}")
-async def update_tag(tag_id: int, data: dict):
+async def update_tag(tag_id: int, data: dict, db: Database = Depends(get_db)):
     """
     更新標籤名稱
     
@@ -122,42 +113,58 @@ async def update_tag(tag_id: int, data: dict):
         if "name" not in data or not data["name"].strip():
             raise HTTPException(status_code=400, detail="標籤名稱不能為空")
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        async with db.writer() as conn:
             # 更新標籤
-            cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (data["name"], tag_id))
+            cursor = await conn.execute("UPDATE tags SET name = ? WHERE id = ?", (data["name"], tag_id))
             
             if cursor.rowcount == 0:
                 return JSONResponse(
                     status_code=404,
                     content={"message": "Tag not found"}
                 )
-                
-            conn.commit()
+            await cache_sync.publish(conn, "tags", tag_id)
+            tag_dictionary.rename(tag_id, data["name"])
         
         return {"message": "Tag updated successfully"}
     except Exception as e:
-        logger.error(f"更新標籤失敗: {str(e)}")
+        logger.error("更新標籤失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{tag_id}/notes/")
-async def get_tag_notes(tag_id: int, limit: int = 50, offset: int = 0):
+async def get_tag_notes(tag_id: int, limit: int = 50, offset: int = 0,
+                        cursor: str = None, include_total: bool = True, fields: str = None,
+                        db: Database = Depends(get_db)):
     """
     獲取包含特定標籤的文章列表
     
+    - **limit**: 可選，每頁數量
+    - **offset**: 可選，頁碼
+    - **cursor**: 可選，上一頁回傳的 next_cursor；不可與 offset 同時使用（回應 400）
+    - **include_total**: 可選，是否計算總記錄數
+    - **fields**: 可選，以逗號分隔的欄位，同 `GET /notes/all/`
+    
     Returns:
         - **notes**: 文章列表
-        - **total**: 總記錄數
+        - **total**: 總記錄數，未要求時為 null
+        - **next_cursor**: 下一頁游標，沒有下一頁時為 null
         - **tag**: 標籤資訊
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if before is not None and offset:
+        raise HTTPException(status_code=400, detail="cursor and offset cannot be combined")
+    try:
+        fields = parse_note_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        async with db.reader() as conn:
             # 獲取標籤資訊
-            cursor.execute("SELECT id, name FROM tags WHERE id = ?", (tag_id,))
-            tag = cursor.fetchone()
+            cursor = await conn.execute("SELECT id, name FROM tags WHERE id = ?", (tag_id,))
+            tag = await cursor.fetchone()
             
             if not tag:
                 return JSONResponse(
@@ -165,53 +172,30 @@ async def get_tag_notes(tag_id: int, limit: int = 50, offset: int = 0):
                     content={"message": "Tag not found"}
                 )
             
-            # 獲取文章列表
-            query = """
-            SELECT n.id, n.content, n.created_at 
-            FROM markdown_notes n
-            JOIN note_tags nt ON n.id = nt.note_id
-            WHERE nt.tag_id = ?
-            ORDER BY n.created_at DESC
-            LIMIT ? OFFSET ?
-            """
-            cursor.execute(query, (tag_id, limit, offset))
-            
-            notes = []
-            for row in cursor:
-                # 為每篇文章獲取所有標籤
-                cursor.execute("""
-                SELECT t.id, t.name
-                FROM tags t
-                JOIN note_tags nt ON t.id = nt.tag_id
-                WHERE nt.note_id = ?
-                """, (row[0],))
-                tags = [{"id": t[0], "name": t[1]} for t in cursor.fetchall()]
-                
-                # 添加文章和標籤到結果
-                notes.append({
-                    "id": row[0],
-                    "content": row[1],
-                    "created_at": row[2],
-                    "tags": tags
-                })
+            # 獲取文章列表（含每篇文章的所有標籤）
+            notes, next_cursor = await fetch_notes_page(conn, limit, offset, tag_id=tag_id, before=before,
+                                                        fields=fields)
             
             # 獲取總記錄數
-            cursor.execute("""
-            SELECT COUNT(*) 
-            FROM markdown_notes n
-            JOIN note_tags nt ON n.id = nt.note_id
-            WHERE nt.tag_id = ?
-            """, (tag_id,))
-            total = cursor.fetchone()[0]
+            total = None
+            if include_total:
+                count_cursor = await conn.execute("""
+                SELECT COUNT(*) 
+                FROM markdown_notes n
+                JOIN note_tags nt ON n.id = nt.note_id
+                WHERE nt.tag_id = ?
+                """, (tag_id,))
+                total = (await count_cursor.fetchone())[0]
             
-        return {
+        return ORJSONResponse({
             "notes": notes, 
             "total": total,
+            "next_cursor": next_cursor,
             "tag": {
                 "id": tag[0],
                 "name": tag[1]
             }
-        }
+        })
     except Exception as e:
-        logger.error(f"獲取標籤相關文章失敗: {str(e)}")
+        logger.error("獲取標籤相關文章失敗: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
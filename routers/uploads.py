@@ -0,0 +1,255 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+import hashlib
+import logging
+import math
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+
+# 從common模組導入相關功能
+from common import Database, get_db, Config, blob_storage, collect_expired_upload_sessions
+from routers.files import register_file
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["續傳上傳"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 上次清除過期工作階段的時間，建立新工作階段時最多每分鐘清除一次
+_last_sweep = 0.0
+SWEEP_INTERVAL = 60
+
+def _session_dir(upload_id: str) -> Path:
+    return Path(Config.UPLOAD_SESSION_FOLDER) / upload_id
+
+def _chunk_path(upload_id: str, index: int) -> Path:
+    return _session_dir(upload_id) / f"{index:06d}.chunk"
+
+def _received_chunks(upload_id: str) -> list:
+    """列出已完整接收的分段編號（寫入中的分段是暫存檔，不會被列出）"""
+    directory = _session_dir(upload_id)
+    if not directory.exists():
+        return []
+    return sorted(int(entry.name[:-6]) for entry in os.scandir(directory) if entry.name.endswith(".chunk"))
+
+def _expected_chunk_size(session, index: int) -> int:
+    if index < session["total_chunks"] - 1:
+        return session["chunk_size"]
+    return session["size"] - session["chunk_size"] * (session["total_chunks"] - 1)
+
+def _assemble_chunks(upload_id: str, total_chunks: int) -> tuple:
+    """
+    依序合併所有分段到上傳資料夾內的暫存檔，同時計算內容 hash
+    
+    每次只讀取一段固定大小的資料，不會把整個檔案載入記憶體。
+    
+    Returns:
+        (內容 hash, 暫存檔路徑)
+    """
+    hasher = hashlib.new(Config.BLOB_HASH_ALGORITHM)
+    fd, temp_path = blob_storage.create_temp()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for index in range(total_chunks):
+                with open(_chunk_path(upload_id, index), "rb") as chunk_file:
+                    while data := chunk_file.read(Config.UPLOAD_CHUNK_SIZE):
+                        hasher.update(data)
+                        out.write(data)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return hasher.hexdigest(), temp_path
+
+async def _get_session(db: Database, upload_id: str):
+    async with db.reader() as conn:
+        cursor = await conn.execute("""
+            SELECT id, filename, size, chunk_size, total_chunks, expires_at
+            FROM upload_sessions WHERE id = ?
+        """, (upload_id,))
+        session = await cursor.fetchone()
+    if not session or session["expires_at"] < time.time():
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("/")
+async def create_upload_session(data: dict, db: Database = Depends(get_db)):
+    """
+    建立續傳上傳工作階段
+    
+    - **filename**: 原始檔名
+    - **size**: 檔案大小 (bytes)
+    - **chunk_size**: 可選，分段大小 (bytes)
+    
+    Returns:
+        - **upload_id**: 工作階段 ID
+        - **chunk_size**: 分段大小
+        - **total_chunks**: 分段數量
+        - **expires_at**: 閒置到期時間 (Unix 時間)
+    """
+    global _last_sweep
+    
+    filename = data.get("filename")
+    size = data.get("size")
+    chunk_size = data.get("chunk_size", Config.UPLOAD_SESSION_CHUNK_SIZE)
+    
+    if not filename or not isinstance(size, int) or size <= 0:
+        raise HTTPException(status_code=400, detail="filename and a positive size are required")
+    if not Config.is_allowed_file(filename):
+        raise HTTPException(status_code=400, detail=f"不支援的檔案類型: {Path(filename).suffix.lower()[1:]}")
+    if size > Config.MAX_CONTENT_LENGTH:
+        raise HTTPException(status_code=413, detail="File too large")
+    if not isinstance(chunk_size, int) or not (
+            Config.UPLOAD_SESSION_MIN_CHUNK_SIZE <= chunk_size <= Config.UPLOAD_SESSION_MAX_CHUNK_SIZE):
+        raise HTTPException(status_code=400, detail="Invalid chunk_size")
+    
+    try:
+        # 順便清除過期的工作階段
+        if time.time() - _last_sweep > SWEEP_INTERVAL:
+            _last_sweep = time.time()
+            await run_in_threadpool(collect_expired_upload_sessions)
+        
+        upload_id = secrets.token_urlsafe(16)
+        total_chunks = math.ceil(size / chunk_size)
+        expires_at = time.time() + Config.UPLOAD_SESSION_TTL
+        await run_in_threadpool(os.makedirs, _session_dir(upload_id))
+        
+        async with db.writer() as conn:
+            await conn.execute("""
+                INSERT INTO upload_sessions (id, filename, size, chunk_size, total_chunks, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (upload_id, filename, size, chunk_size, total_chunks, expires_at))
+        
+        logger.info("建立上傳工作階段: %s (%s, %s bytes, %s 段)", upload_id, filename, size, total_chunks)
+        return {
+            "upload_id": upload_id,
+            "chunk_size": chunk_size,
+            "total_chunks": total_chunks,
+            "expires_at": expires_at
+        }
+    except Exception as e:
+        logger.error("建立上傳工作階段失敗: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.put("/{upload_id}/chunks/{index}")
+async def upload_chunk(upload_id: str, index: int, request: Request, db: Database = Depends(get_db)):
+    """
+    上傳一個分段（請求內容即為分段資料）
+    
+    分段可以用多條連線平行上傳；重複上傳同一段會覆寫先前的內容。
+    """
+    session = await _get_session(db, upload_id)
+    if not 0 <= index < session["total_chunks"]:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+    expected = _expected_chunk_size(session, index)
+    
+    # 先寫入暫存檔，收到完整分段後才更名，查詢進度時不會看到寫到一半的分段
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=_session_dir(upload_id), prefix=f".{index:06d}-", suffix=".part")
+    except FileNotFoundError:
+        # 工作階段剛被完成或取消
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    out = os.fdopen(fd, "wb")
+    received = 0
+    try:
+        async for data in request.stream():
+            received += len(data)
+            if received > expected:
+                raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes")
+            await run_in_threadpool(out.write, data)
+        await run_in_threadpool(out.close)
+        if received != expected:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes")
+        await run_in_threadpool(os.replace, temp_path, _chunk_path(upload_id, index))
+    except BaseException:
+        out.close()
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    
+    # 延長閒置期限
+    async with db.writer() as conn:
+        await conn.execute("UPDATE upload_sessions SET expires_at = ? WHERE id = ?",
+                           (time.time() + Config.UPLOAD_SESSION_TTL, upload_id))
+    
+    return {"upload_id": upload_id, "index": index, "size": received}
+
+@router.get("/{upload_id}")
+async def get_upload_session(upload_id: str, db: Database = Depends(get_db)):
+    """
+    查詢上傳進度
+    
+    Returns:
+        - **received**: 已接收的分段編號
+        - **missing**: 尚未接收的分段編號
+    """
+    session = await _get_session(db, upload_id)
+    received = await run_in_threadpool(_received_chunks, upload_id)
+    received_set = set(received)
+    return {
+        "upload_id": upload_id,
+        "filename": session["filename"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received": received,
+        "missing": [i for i in range(session["total_chunks"]) if i not in received_set],
+        "expires_at": session["expires_at"]
+    }
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(upload_id: str, db: Database = Depends(get_db)):
+    """
+    完成上傳：合併所有分段並登記到檔案列表
+    
+    Returns:
+        與 `POST /files/upload/` 相同的檔案資訊
+    """
+    session = await _get_session(db, upload_id)
+    received = await run_in_threadpool(_received_chunks, upload_id)
+    if len(received) != session["total_chunks"]:
+        raise HTTPException(status_code=409, detail=f"Missing {session['total_chunks'] - len(received)} chunks")
+    
+    # 刪除工作階段記錄，避免同一個工作階段被重複完成
+    async with db.writer() as conn:
+        cursor = await conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+    
+    temp_path = None
+    try:
+        file_hash, temp_path = await run_in_threadpool(_assemble_chunks, upload_id, session["total_chunks"])
+        stored_filename = f"{file_hash}{Path(session['filename']).suffix}"
+        logger.info("上傳工作階段 %s 合併完成: %s", upload_id, stored_filename)
+        
+        return await register_file(db, stored_filename, session["filename"], session["size"],
+                                   lambda name: run_in_threadpool(blob_storage.store, temp_path, name))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("完成上傳失敗: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # 內容重複時暫存檔不會被使用
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        await run_in_threadpool(shutil.rmtree, _session_dir(upload_id), True)
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str, db: Database = Depends(get_db)):
+    """
+    取消上傳並刪除已接收的分段
+    """
+    async with db.writer() as conn:
+        cursor = await conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+    
+    await run_in_threadpool(shutil.rmtree, _session_dir(upload_id), True)
+    return {"message": "Upload aborted"}
@@ -0,0 +1,452 @@
+"""
+S3 相容物件儲存（AWS S3、MinIO 等）的 blob 儲存後端
+
+多個應用程式節點可以共用同一個 bucket：
+
+- 所有請求共用一個 httpx.Client 連線池（keep-alive），以 AWS Signature Version 4 簽章
+- 大檔案以 multipart upload 切段，多個執行緒同時上傳
+- `presigned_url` 產生限時的下載網址，下載內容由用戶端直接向物件儲存取得，不經過 Python 程序
+- 本機讀取快取（read-through）：需要本機檔案時（產生縮圖、不使用預簽網址的下載）才從物件儲存
+  下載到快取資料夾，超過大小上限時刪除最久未使用的檔案；剛上傳的檔案直接移入快取
+
+blob 以內容 hash 命名、內容永遠不變，快取中的檔案不會過期，刪除 blob 時一併移除即可。
+這個模組只在 `Config.STORAGE_BACKEND = "s3"` 時載入，只有此時才需要安裝 httpx。
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from storage import BlobStorage, LocalStorage, content_disposition
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+XML_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+# S3 規定 multipart upload 除最後一段外每段至少 5MB，最多 10000 段
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# 下載與寫入快取時每次處理的大小
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 預簽下載網址的回應快取標頭：內容永遠不變，瀏覽器可以長期快取
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 讀取快取檔案時，修改時間超過此秒數才更新為現在（作為最近使用時間，減少磁碟寫入）
+TOUCH_INTERVAL = 3600
+# 超過上限時刪除到上限的這個比例，避免每下載一個檔案就掃描一次快取資料夾
+EVICT_TARGET_RATIO = 0.9
+
+
+class S3Error(Exception):
+    """物件儲存回應錯誤"""
+
+    def __init__(self, status_code: int, code: str, message: str):
+        super().__init__(f"S3 {status_code} {code}: {message}")
+        self.status_code = status_code
+        self.code = code
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def canonical_query(params: dict) -> str:
+    """SigV4 的查詢字串：名稱與值都以 RFC 3986 編碼後依名稱排序"""
+    pairs = sorted((quote(str(name), safe="~"), quote(str(value), safe="~")) for name, value in params.items())
+    return "&".join(f"{name}={value}" for name, value in pairs)
+
+
+def sign(secret_key: str, region: str, amz_date: str, method: str, path: str, params: dict,
+         headers: dict, payload_hash: str) -> str:
+    """
+    計算 AWS Signature Version 4 簽章
+
+    - **amz_date**: 簽章時間，格式為 `YYYYMMDDTHHMMSSZ`（UTC）
+    - **path**: 未編碼的請求路徑
+    - **params**: 查詢參數（不含 X-Amz-Signature）
+    - **headers**: 要簽章的標頭，名稱為小寫且必須包含 host
+    - **payload_hash**: 請求內容的 SHA-256，或 `UNSIGNED-PAYLOAD`
+
+    Returns:
+        十六進位的簽章
+    """
+    names = sorted(headers)
+    canonical_request = "\n".join([
+        method,
+        quote(path, safe="/~"),
+        canonical_query(params),
+        "".join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in names),
+        ";".join(names),
+        payload_hash,
+    ])
+    date = amz_date[:8]
+    string_to_sign = "\n".join([
+        ALGORITHM, amz_date, f"{date}/{region}/s3/aws4_request",
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+    key = _hmac(("AWS4" + secret_key).encode(), date)
+    for part in (region, "s3", "aws4_request"):
+        key = _hmac(key, part)
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class S3Storage(BlobStorage):
+    """
+    S3 相容物件儲存上的 blob 儲存
+
+    - **endpoint**: 物件儲存的網址，例如 `http://127.0.0.1:9000`、`https://s3.ap-northeast-1.amazonaws.com`
+    - **bucket**: bucket 名稱（需事先建立）
+    - **prefix**: 物件名稱前綴，例如 `"uploads/"`
+    - **path_style**: True 時網址為 `endpoint/bucket/key`（MinIO），False 時為 `bucket.endpoint/key`
+    - **cache_dir**: 本機讀取快取與上傳暫存檔的資料夾
+    - **cache_max_bytes**: 讀取快取的大小上限
+    - **presign_expires**: 預簽下載網址的有效秒數，0 表示不使用預簽網址（下載經由本機快取傳送）
+    - **multipart_threshold**: 超過此大小的檔案以 multipart upload 上傳
+    - **part_size**: multipart upload 每段的大小
+    - **upload_concurrency**: 同時上傳的分段數（所有上傳共用）
+    - **pool_size**: 連線池的連線數上限
+    """
+
+    remote = True
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", prefix: str = "", path_style: bool = True,
+                 cache_dir: str = "uploads/cache", cache_max_bytes: int = 2 * 1024 * 1024 * 1024,
+                 presign_expires: int = 3600, multipart_threshold: int = 16 * 1024 * 1024,
+                 part_size: int = 8 * 1024 * 1024, upload_concurrency: int = 4, pool_size: int = 16,
+                 timeout: float = 30.0, depth: int = 2, width: int = 2):
+        url = urlsplit(endpoint)
+        host = url.netloc
+        # httpx 不會在 Host 標頭中送出預設連接埠，簽章時也不能包含
+        default_port = {"http": ":80", "https": ":443"}.get(url.scheme)
+        if default_port and host.endswith(default_port):
+            host = host[:-len(default_port)]
+        if not path_style:
+            host = f"{bucket}.{host}"
+        self.host = host
+        self.origin = f"{url.scheme}://{host}"
+        self.bucket_path = f"/{bucket}" if path_style else ""
+        self.prefix = prefix
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.presign_expires = presign_expires
+        # 預簽網址的簽章時間對齊到有效期的一半，同一段時間內同一個檔案的網址相同，瀏覽器快取可以命中；
+        # 回傳的網址至少還有一半的有效期
+        self.presigned_url_ttl = presign_expires // 2
+        self.multipart_threshold = max(multipart_threshold, MIN_PART_SIZE)
+        self.part_size = max(part_size, MIN_PART_SIZE)
+
+        self.cache = LocalStorage(cache_dir, depth, width)
+        self.cache.root.mkdir(parents=True, exist_ok=True)
+        self.temp_dir = self.cache.root
+        self.cache_max_bytes = cache_max_bytes
+
+        # 只重試連線失敗；請求已送出後的錯誤由呼叫端處理
+        self._client = httpx.Client(
+            transport=httpx.HTTPTransport(retries=2),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
+        )
+        self._upload_executor = ThreadPoolExecutor(max_workers=upload_concurrency,
+                                                   thread_name_prefix="s3-upload")
+        self._lock = threading.Lock()
+        self._fetching: dict = {}
+        self._cache_bytes: int | None = None
+        self._evicting = False
+        self._stats = {"cache_hits": 0, "cache_misses": 0, "evicted": 0, "uploaded_bytes": 0,
+                       "downloaded_bytes": 0}
+
+    def is_valid_name(self, filename: str) -> bool:
+        return self.cache.is_valid_name(filename)
+
+    # 請求
+
+    def _object_path(self, filename: str | None) -> str:
+        return f"{self.bucket_path}/{self.prefix}{filename}" if filename is not None else self.bucket_path or "/"
+
+    def _send(self, method: str, filename: str | None = None, params: dict | None = None,
+              content: bytes = b"", headers: dict | None = None, stream: bool = False) -> httpx.Response:
+        """以標頭簽章送出請求；filename 為 None 時是對 bucket 本身的請求"""
+        path = self._object_path(filename)
+        params = params or {}
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        payload_hash = hashlib.sha256(content).hexdigest() if content else EMPTY_SHA256
+        signed = {"host": self.host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date,
+                  **(headers or {})}
+        signature = sign(self.secret_key, self.region, amz_date, method, path, params, signed, payload_hash)
+        signed["authorization"] = (
+            f"{ALGORITHM} Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, "
+            f"SignedHeaders={';'.join(sorted(signed))}, Signature={signature}"
+        )
+        url = self.origin + quote(path, safe="/~")
+        if params:
+            url += "?" + canonical_query(params)
+        request = self._client.build_request(method, url, headers=signed, content=content or None)
+        return self._client.send(request, stream=stream)
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response):
+        if response.status_code < 300:
+            return
+        response.read()
+        # HEAD 的錯誤回應沒有內容
+        code, message = "", response.text[:200] or response.reason_phrase
+        if response.content.startswith(b"<"):
+            try:
+                root = ET.fromstring(response.content)
+                code, message = root.findtext("Code", ""), root.findtext("Message", "")
+            except ET.ParseError:
+                pass
+        raise S3Error(response.status_code, code, message)
+
+    def _request(self, method: str, filename: str | None = None, **kwargs) -> httpx.Response:
+        response = self._send(method, filename, **kwargs)
+        self._raise_for_status(response)
+        return response
+
+    # 上傳
+
+    def _put_multipart(self, path: str, filename: str, size: int):
+        """分段同時上傳；失敗時中止，物件儲存不會留下未完成的分段"""
+        response = self._request("POST", filename, params={"uploads": ""})
+        upload_id = ET.fromstring(response.content).findtext(f"{XML_NAMESPACE}UploadId")
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        fd = os.open(path, os.O_RDONLY)
+
+        def put_part(number: int) -> str:
+            # 每個執行緒只讀取自己的分段，同時在記憶體中的資料最多是 upload_concurrency 段
+            data = os.pread(fd, part_size, (number - 1) * part_size)
+            return self._request("PUT", filename, params={"partNumber": number, "uploadId": upload_id},
+                                 content=data).headers["etag"]
+
+        try:
+            etags = list(self._upload_executor.map(put_part, range(1, -(-size // part_size) + 1)))
+            body = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                           for number, etag in enumerate(etags, 1))
+            response = self._request("POST", filename, params={"uploadId": upload_id},
+                                     content=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode())
+            # 完成請求可能在 200 回應中回傳錯誤
+            root = ET.fromstring(response.content)
+            if root.tag == "Error":
+                raise S3Error(response.status_code, root.findtext("Code", ""), root.findtext("Message", ""))
+        except BaseException:
+            try:
+                self._send("DELETE", filename, params={"uploadId": upload_id})
+            except httpx.HTTPError:
+                pass
+            raise
+        finally:
+            os.close(fd)
+
+    def upload(self, path: str, filename: str):
+        """上傳本機檔案為 blob（不影響本機檔案），超過 multipart_threshold 時分段同時上傳"""
+        size = os.path.getsize(path)
+        if size > self.multipart_threshold:
+            self._put_multipart(path, filename, size)
+        else:
+            with open(path, "rb") as source:
+                self._request("PUT", filename, content=source.read())
+        with self._lock:
+            self._stats["uploaded_bytes"] += size
+
+    def store(self, temp_path: str, filename: str):
+        if not self.is_valid_name(filename):
+            raise ValueError(f"Invalid blob name: {filename}")
+        self.upload(temp_path, filename)
+        # 剛上傳的檔案通常馬上會被讀取（產生縮圖），直接移入快取，不必再下載
+        size = os.path.getsize(temp_path)
+        self.cache.store(temp_path, filename)
+        self._add_to_cache(size)
+
+    # 讀取
+
+    def exists(self, filename: str) -> bool:
+        if not self.is_valid_name(filename):
+            return False
+        response = self._send("HEAD", filename)
+        if response.status_code == 404:
+            return False
+        self._raise_for_status(response)
+        return True
+
+    def _download(self, filename: str, target: Path) -> int | None:
+        """下載到快取，不存在時回傳 None"""
+        fd, temp_path = self.create_temp()
+        try:
+            with os.fdopen(fd, "wb") as out:
+                response = self._send("GET", filename, stream=True)
+                try:
+                    if response.status_code == 404:
+                        os.unlink(temp_path)
+                        return None
+                    self._raise_for_status(response)
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        out.write(chunk)
+                finally:
+                    response.close()
+            size = os.path.getsize(temp_path)
+            self.cache.store(temp_path, filename)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return size
+
+    def locate(self, filename: str) -> Path | None:
+        """
+        blob 在本機快取中的路徑，快取中沒有時先下載
+
+        同一個 blob 同時有多個請求時只下載一次，其他請求等待下載完成。
+        """
+        if not self.is_valid_name(filename):
+            return None
+        target = self.cache.path(filename)
+        if _touch(target):
+            self._count("cache_hits")
+            return target
+        with self._lock:
+            lock = self._fetching.setdefault(filename, threading.Lock())
+        with lock:
+            try:
+                if _touch(target):
+                    self._count("cache_hits")
+                    return target
+                self._count("cache_misses")
+                size = self._download(filename, target)
+            finally:
+                with self._lock:
+                    self._fetching.pop(filename, None)
+        if size is None:
+            return None
+        with self._lock:
+            self._stats["downloaded_bytes"] += size
+        self._add_to_cache(size)
+        return target
+
+    def presigned_url(self, filename: str, download_name: str | None = None,
+                      content_type: str | None = None) -> str | None:
+        if not self.presign_expires or not self.is_valid_name(filename):
+            return None
+        now = int(time.time())
+        signed_at = now - now % max(1, self.presign_expires // 2)
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(signed_at))
+        path = self._object_path(filename)
+        params = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(self.presign_expires),
+            "X-Amz-SignedHeaders": "host",
+            "response-cache-control": IMMUTABLE_CACHE_CONTROL,
+        }
+        if download_name:
+            params["response-content-disposition"] = content_disposition(download_name)
+        if content_type:
+            params["response-content-type"] = content_type
+        signature = sign(self.secret_key, self.region, amz_date, "GET", path, params, {"host": self.host},
+                         UNSIGNED_PAYLOAD)
+        return f"{self.origin}{quote(path, safe='/~')}?{canonical_query(params)}&X-Amz-Signature={signature}"
+
+    # 刪除與列舉
+
+    def delete(self, filename: str) -> bool:
+        if not self.is_valid_name(filename):
+            return False
+        # DELETE 對不存在的物件也回應成功，先確認是否存在
+        existed = self.exists(filename)
+        if existed:
+            self._request("DELETE", filename)
+        target = self.cache.path(filename)
+        try:
+            size = target.stat().st_size
+            target.unlink()
+        except FileNotFoundError:
+            pass
+        else:
+            with self._lock:
+                if self._cache_bytes is not None:
+                    self._cache_bytes = max(0, self._cache_bytes - size)
+        return existed
+
+    def list_blobs(self):
+        params = {"list-type": "2", "prefix": self.prefix}
+        while True:
+            root = ET.fromstring(self._request("GET", params=params).content)
+            for item in root.iter(f"{XML_NAMESPACE}Contents"):
+                name = item.findtext(f"{XML_NAMESPACE}Key")[len(self.prefix):]
+                if not self.is_valid_name(name):
+                    continue
+                modified = datetime.fromisoformat(item.findtext(f"{XML_NAMESPACE}LastModified"))
+                yield name, int(item.findtext(f"{XML_NAMESPACE}Size")), modified.timestamp()
+            token = root.findtext(f"{XML_NAMESPACE}NextContinuationToken")
+            if root.findtext(f"{XML_NAMESPACE}IsTruncated") != "true" or not token:
+                return
+            params["continuation-token"] = token
+
+    # 讀取快取
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _add_to_cache(self, size: int):
+        """記錄新加入快取的檔案大小，超過上限時刪除最久未使用的檔案"""
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self.cache.list_blobs())
+            else:
+                self._cache_bytes += size
+            if self._cache_bytes <= self.cache_max_bytes or self._evicting:
+                return
+            self._evicting = True
+            before = self._cache_bytes
+        total, removed = before, 0
+        try:
+            total, removed = self._evict(before)
+        finally:
+            with self._lock:
+                # 逐出期間新增的大小也要算進去
+                self._cache_bytes = total + (self._cache_bytes - before)
+                self._stats["evicted"] += removed
+                self._evicting = False
+
+    def _evict(self, total: int) -> tuple:
+        entries = sorted((mtime, size, name) for name, size, mtime in self.cache.list_blobs())
+        target = self.cache_max_bytes * EVICT_TARGET_RATIO
+        removed = 0
+        for _, size, name in entries:
+            if total <= target:
+                break
+            if self.cache.delete(name):
+                total -= size
+                removed += 1
+        return total, removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "s3", "cache_bytes": self._cache_bytes, "cache_max_bytes": self.cache_max_bytes,
+                    **self._stats}
+
+    def close(self):
+        self._upload_executor.shutdown(wait=True)
+        self._client.close()
+
+
+def _touch(path: Path) -> bool:
+    """快取檔案存在時更新最近使用時間並回傳 True"""
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return False
+    if time.time() - mtime > TOUCH_INTERVAL:
+        os.utime(path)
+    return True
@@ -0,0 +1,156 @@
+"""
+以 sendfile 系統呼叫傳送檔案的 uvicorn HTTP protocol
+
+FileResponse 預設每次讀取 64KB 再寫入 socket，每個位元組都要在核心與 Python 之間複製兩次，
+大檔案下載時 CPU 主要花在這裡。ASGI 的 `http.response.pathsend` 擴充讓應用程式只交出檔案路徑，
+由伺服器傳送內容；Starlette 的 FileResponse 在 scope 宣告此擴充時會改用它，但 uvicorn 沒有實作。
+
+這裡的 protocol 繼承 uvicorn 的 h11 / httptools 實作，在每個請求開始前：
+
+- 確認連線可以使用 os.sendfile（asyncio 事件迴圈、非 TLS 連線），才在 scope 宣告 pathsend 擴充
+- 攔截 pathsend 訊息：先照常編碼回應標頭，內容以 `loop.sendfile` 從檔案直接送到 socket（零複製）
+
+不符合條件的連線（uvloop、TLS）不宣告擴充，FileResponse 照常分段讀寫。
+Range 請求（206）與 HEAD 不使用 pathsend，仍由 FileResponse 讀取需要的片段。
+
+    uvicorn app:app --http sendfile_protocol:SendfileProtocol --loop asyncio
+"""
+import asyncio
+import os
+
+import h11
+from uvicorn.protocols.http.h11_impl import H11Protocol
+
+try:
+    from uvicorn.protocols.http.httptools_impl import HttpToolsProtocol
+except ImportError:  # 沒有安裝 httptools
+    HttpToolsProtocol = None
+
+PATHSEND = "http.response.pathsend"
+
+_stats = {
+    "sendfile_responses": 0,  # 以 os.sendfile 傳送的回應數
+    "sendfile_bytes": 0,
+    "fallback_responses": 0,  # 宣告了 pathsend，但 os.sendfile 無法使用而改由事件迴圈讀寫的回應數
+    "unsupported_requests": 0,  # 連線不支援 sendfile、沒有宣告 pathsend 的請求數
+}
+
+
+def stats() -> dict:
+    """目前程序以 sendfile 傳送檔案的統計"""
+    return dict(_stats)
+
+
+class _FileBody:
+    """
+    代表檔案內容的佔位物件
+
+    h11 以 len() 檢查 Content-Length 並產生 chunked 編碼的長度，
+    send_with_data_passthrough 會把它原樣放在輸出中，再由呼叫端換成 sendfile。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _supports_sendfile(loop: asyncio.AbstractEventLoop, transport: asyncio.Transport) -> bool:
+    # uvloop 沒有實作 loop.sendfile；TLS 連線的內容必須經過加密，無法直接從檔案送出
+    return (hasattr(os, "sendfile") and isinstance(loop, asyncio.BaseEventLoop)
+            and transport.get_extra_info("sslcontext") is None)
+
+
+async def _sendfile(cycle, file, size: int):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sendfile(cycle.transport, file, 0, size, fallback=False)
+        _stats["sendfile_responses"] += 1
+    except asyncio.SendfileNotAvailableError:
+        # 例如檔案系統不支援；由事件迴圈讀取後寫入，仍不經過應用程式
+        await loop.sendfile(cycle.transport, file, 0, size, fallback=True)
+        _stats["fallback_responses"] += 1
+    _stats["sendfile_bytes"] += size
+
+
+def _enable_pathsend(cycle, loop: asyncio.AbstractEventLoop, encode_body):
+    """
+    在請求的 scope 宣告 pathsend 擴充，並攔截 cycle.send 處理 pathsend 訊息
+
+    - **encode_body**: 以檔案大小編碼回應內容，回傳依序寫入的片段（bytes 或 _FileBody）
+    """
+    if not _supports_sendfile(loop, cycle.transport):
+        _stats["unsupported_requests"] += 1
+        return
+    cycle.scope.setdefault("extensions", {})[PATHSEND] = {}
+    send = cycle.send
+
+    async def send_with_pathsend(message):
+        if message["type"] != PATHSEND:
+            await send(message)
+            return
+        if not cycle.response_started or cycle.response_complete:
+            raise RuntimeError(f"Unexpected ASGI message '{PATHSEND}'.")
+        if cycle.flow.write_paused and not cycle.disconnected:
+            await cycle.flow.drain()
+        if cycle.disconnected:
+            return
+
+        with open(message["path"], "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            try:
+                for part in encode_body(cycle, size):
+                    if isinstance(part, _FileBody):
+                        await _sendfile(cycle, file, size)
+                    else:
+                        cycle.transport.write(part)
+            except ConnectionError:
+                # 傳送途中用戶端斷線；sendfile 期間暫停讀取，uvicorn 還沒有收到連線關閉的通知
+                cycle.disconnected = True
+                cycle.transport.close()
+                return
+            except RuntimeError:
+                # loop.sendfile 在連線已經關閉時拋出 RuntimeError
+                if cycle.disconnected or cycle.transport.is_closing():
+                    return
+                raise
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    cycle.send = send_with_pathsend
+
+
+def _encode_h11(cycle, size: int) -> list:
+    # 由 h11 負責 Content-Length 檢查與 chunked 編碼
+    return cycle.conn.send_with_data_passthrough(h11.Data(data=_FileBody(size)))
+
+
+def _encode_httptools(cycle, size: int) -> list:
+    if cycle.chunked_encoding:
+        return [b"%x\r\n" % size, _FileBody(size), b"\r\n"]
+    cycle.expected_content_length -= size
+    if cycle.expected_content_length < 0:
+        raise RuntimeError("Response content longer than Content-Length")
+    return [_FileBody(size)]
+
+
+class H11SendfileProtocol(H11Protocol):
+    def handle_events(self) -> None:
+        # 新請求的 cycle 在這裡建立，它的 ASGI task 此時還沒有開始執行
+        cycle = self.cycle
+        super().handle_events()
+        if self.cycle is not cycle and self.cycle is not None:
+            _enable_pathsend(self.cycle, self.loop, _encode_h11)
+
+
+if HttpToolsProtocol is not None:
+    class HttpToolsSendfileProtocol(HttpToolsProtocol):
+        def on_headers_complete(self) -> None:
+            cycle = self.cycle
+            super().on_headers_complete()
+            if self.cycle is not cycle and self.cycle is not None:
+                _enable_pathsend(self.cycle, self.loop, _encode_httptools)
+
+    SendfileProtocol = HttpToolsSendfileProtocol
+else:
+    SendfileProtocol = H11SendfileProtocol
@@ -0,0 +1,174 @@
+"""
+正式環境的啟動程式：一個主程序管理多個 uvicorn 工作程序
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+1. 主程序匯入應用程式（preload）並執行 common.initialize()：在檔案鎖內執行資料庫遷移（結構版本已是最新時略過），
+   之後 fork 的工作程序不再執行
+2. 主程序建立 socket 後 fork 出工作程序，由核心把連線分給各個工作程序；工作程序共用主程序已載入的模組與
+   資料（copy-on-write），啟動較快、記憶體較少
+3. 收到 SIGTERM / SIGINT 時轉送給工作程序：停止接受新連線，等待進行中的請求最多 `--graceful-timeout` 秒，
+   執行 lifespan 的關閉流程（執行中的背景工作放回佇列、關閉連線）後結束；仍未結束的工作程序被強制結束
+4. 工作程序意外結束時重新 fork 一個；啟動失敗（lifespan 發生錯誤）時整個服務結束
+
+工作程序數預設為 `Config.SERVER_WORKERS`，未設定時為這個程序可使用的 CPU 數。
+HTTP 以 sendfile_protocol 處理（與單一程序時的 uvicorn 指令相同）。
+程序內快取的一致性見 common.CacheSync；指標、效能診斷與 /cache/stats 在每個工作程序各自計算。
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+# 與 uvicorn 相同：工作程序啟動失敗的結束碼
+STARTUP_FAILURE = 3
+# 啟動後這麼快就結束的工作程序，等待一下再重新啟動，避免不斷重啟
+MIN_WORKER_LIFETIME = 1.0
+
+
+def default_workers() -> int:
+    """這個程序可使用的 CPU 數（容器或 taskset 限制後的數量）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Supervisor:
+    """fork 並監看工作程序（只在主程序中使用）"""
+
+    def __init__(self, config: uvicorn.Config, workers: int, graceful_timeout: float):
+        self.config = config
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.children: dict = {}  # pid → 啟動時間
+        self.stopping = False
+
+    def run(self) -> int:
+        """
+        Returns:
+            主程序的結束碼
+        """
+        sock = self.config.bind_socket()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._request_stop)
+        # 預先載入的物件移出垃圾回收的追蹤範圍，工作程序執行回收時不會碰觸（複製）這些記憶體頁
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn(sock)
+        logger.info("已啟動 %s 個工作程序 (主程序 %s)", self.workers, os.getpid())
+
+        exit_code = 0
+        while not self.stopping:
+            for pid, code, lifetime in self._reap():
+                if code == STARTUP_FAILURE:
+                    logger.error("工作程序 %s 啟動失敗，停止服務", pid)
+                    self.stopping = True
+                    exit_code = code
+                    break
+                logger.warning("工作程序 %s 意外結束 (結束碼 %s)，重新啟動", pid, code)
+                if lifetime < MIN_WORKER_LIFETIME:
+                    time.sleep(MIN_WORKER_LIFETIME)
+                self._spawn(sock)
+            time.sleep(0.2)
+
+        self._shutdown()
+        sock.close()
+        return exit_code
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _spawn(self, sock):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        # 工作程序：由 uvicorn 處理 SIGTERM / SIGINT（graceful shutdown）
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        code = STARTUP_FAILURE
+        try:
+            server = uvicorn.Server(self.config)
+            server.run(sockets=[sock])
+            code = 0 if server.started else STARTUP_FAILURE
+        except BaseException:
+            logger.exception("工作程序 %s 發生錯誤", os.getpid())
+        finally:
+            # os._exit 不執行 atexit，先寫完日誌佇列
+            logging.shutdown()
+            os._exit(code)
+
+    def _reap(self) -> list:
+        """取回已結束的工作程序：[(pid, 結束碼, 執行秒數)]"""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.children.pop(pid, None)
+            if started is not None:
+                exited.append((pid, os.waitstatus_to_exitcode(status), time.monotonic() - started))
+        return exited
+
+    def _shutdown(self):
+        logger.info("停止 %s 個工作程序", len(self.children))
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # 等待進行中的請求之外，再留一些時間給 lifespan 的關閉流程
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning("工作程序 %s 未在時間內結束，強制結束", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            del self.children[pid]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="工作程序數（預設為 Config.SERVER_WORKERS 或可使用的 CPU 數）")
+    parser.add_argument("--graceful-timeout", type=float, default=None,
+                        help="結束時等待進行中請求的秒數（預設為 Config.SERVER_GRACEFUL_TIMEOUT）")
+    parser.add_argument("--log-level", default="info", help="uvicorn 的日誌等級")
+    args = parser.parse_args()
+
+    # uvicorn.Config 以 dictConfig 設定日誌時會關閉既有的 handler，須在設定 JSON 日誌（initialize）之前建立
+    config = uvicorn.Config(
+        "app:app", host=args.host, port=args.port, http="sendfile_protocol:SendfileProtocol", loop="asyncio",
+        log_level=args.log_level,
+    )
+    # 預先載入應用程式並完成初始化（日誌、資料庫遷移），工作程序的 lifespan 不再重複
+    config.load()
+    from common import Config, initialize
+    initialize()
+
+    workers = args.workers or Config.SERVER_WORKERS or default_workers()
+    graceful_timeout = args.graceful_timeout if args.graceful_timeout is not None else Config.SERVER_GRACEFUL_TIMEOUT
+    config.timeout_graceful_shutdown = graceful_timeout
+    sys.exit(Supervisor(config, workers, graceful_timeout).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+慢查詢記錄
+
+資料庫連線以 `sqlite3.connect(..., factory=TimedConnection)` 建立時，每個 SQL 從 execute 到取完結果
+（fetchall、fetchone / fetchmany 取不到更多資料、游標關閉或重新執行）的時間在 aiosqlite 的背景執行緒中量測，
+超過門檻的語句連同參數個數與 `EXPLAIN QUERY PLAN` 一起記錄：
+
+- 寫入 "slow_query" logger（WARNING，JSON 日誌中有 sql、binds、plan、duration_ms 欄位）
+- 保留最近的記錄供 GET /admin/slow-queries 查詢
+
+只取第一筆資料的查詢（fetchone 後不再讀取）在已超過門檻時記錄，否則不記錄。
+門檻為 None（預設）時不量測，每個語句只多一次 Python 函式呼叫。
+
+這個模組只依賴標準函式庫，不讀取 Config；設定由 common.py 傳入。
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from time import perf_counter
+
+logger = logging.getLogger("slow_query")
+
+# 每個 SQL 的查詢計畫只在第一次變慢時查詢，之後沿用
+_PLAN_CACHE_SIZE = 256
+
+
+class SlowQueryLog:
+    """超過門檻的 SQL 記錄（所有連線共用，可在任何執行緒中記錄）"""
+
+    def __init__(self):
+        self.threshold: float | None = None  # 秒
+        self.entries: deque = deque(maxlen=200)
+        self.count = 0
+        self._plans: dict = {}
+        self._lock = threading.Lock()
+
+    def configure(self, threshold_ms: float | None, capacity: int | None = None):
+        """
+        - **threshold_ms**: 記錄超過此毫秒數的語句，None 為停用
+        - **capacity**: 可選，保留的最近記錄數
+        """
+        if capacity is not None and capacity != self.entries.maxlen:
+            self.entries = deque(self.entries, maxlen=capacity)
+        self.threshold = None if threshold_ms is None else threshold_ms / 1000
+
+    def clear(self):
+        self.entries.clear()
+
+    def observe(self, conn: sqlite3.Connection, sql: str, parameters, duration: float, executions: int = 1):
+        """語句執行完畢時呼叫；超過門檻時查詢執行計畫並記錄"""
+        threshold = self.threshold
+        if threshold is None or duration < threshold:
+            return
+        statement = " ".join(sql.split())
+        entry = {
+            "time": time.time(),
+            "duration_ms": round(duration * 1000, 3),
+            "sql": statement,
+            "binds": len(parameters) if parameters else 0,
+            "plan": self._plan(conn, sql, parameters),
+        }
+        if executions != 1:
+            entry["executions"] = executions
+        with self._lock:
+            self.count += 1
+            self.entries.append(entry)
+        logger.warning("慢查詢 %.1fms: %s", duration * 1000, statement,
+                       extra={key: entry[key] for key in ("duration_ms", "sql", "binds", "plan")})
+
+    def _plan(self, conn: sqlite3.Connection, sql: str, parameters) -> list:
+        plan = self._plans.get(sql)
+        if plan is not None:
+            return plan
+        try:
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters or ()).fetchall()
+        except sqlite3.Error:
+            # 交易控制、PRAGMA 等沒有查詢計畫的語句
+            return []
+        # (id, parent, notused, detail)：依 parent 縮排成樹狀，與 sqlite3 命令列的輸出相同
+        depth, plan = {0: -1}, []
+        for row in rows:
+            depth[row[0]] = depth.get(row[1], -1) + 1
+            plan.append("  " * depth[row[0]] + row[3])
+        with self._lock:
+            if len(self._plans) >= _PLAN_CACHE_SIZE:
+                self._plans.clear()
+            self._plans[sql] = plan
+        return plan
+
+    def stats(self) -> dict:
+        threshold = self.threshold
+        return {"threshold_ms": None if threshold is None else threshold * 1000, "count": self.count}
+
+
+# 全域的慢查詢記錄
+slow_query_log = SlowQueryLog()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """量測語句執行時間的游標"""
+
+    # 執行中語句的 [sql, 參數, 累計秒數, 執行次數]，取完結果時交給 slow_query_log
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        if slow_query_log.threshold is None:
+            return super().execute(sql, parameters)
+        self._finish()
+        start = perf_counter()
+        cursor = super().execute(sql, parameters)
+        self._pending = [sql, parameters, perf_counter() - start, 1]
+        if self.description is None:
+            # 不回傳資料的語句（INSERT、UPDATE 等）已經執行完畢
+            self._finish()
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        if slow_query_log.threshold is None:
+            return super().executemany(sql, seq_of_parameters)
+        self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        start = perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        # 執行計畫與參數個數以第一組參數為準
+        self._pending = [sql, seq_of_parameters[0] if seq_of_parameters else (), perf_counter() - start,
+                         len(seq_of_parameters)]
+        self._finish()
+        return cursor
+
+    def fetchone(self):
+        if self._pending is None:
+            return super().fetchone()
+        start = perf_counter()
+        row = super().fetchone()
+        self._fetched(perf_counter() - start, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._pending is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        start = perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(perf_counter() - start, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        if self._pending is None:
+            return super().fetchall()
+        start = perf_counter()
+        rows = super().fetchall()
+        self._fetched(perf_counter() - start, True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _fetched(self, elapsed: float, exhausted: bool):
+        self._pending[2] += elapsed
+        if exhausted or self._pending[2] >= (slow_query_log.threshold or 0):
+            self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            slow_query_log.observe(self.connection, *pending)
+
+
+class TimedConnection(sqlite3.Connection):
+    """所有語句都經由 TimedCursor 執行的連線"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
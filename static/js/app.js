@@ -305,7 +305,8 @@ document.getElementById('getAllImages').addEventListener('click', async () => {
 // 获取所有文章
 document.getElementById('getAllNotes').addEventListener('click', async () => {
     try {
-        const response = await fetch(`${API_BASE_URL}/notes/all/`);
+        // 列表只需要摘要，不下載整篇內容
+        const response = await fetch(`${API_BASE_URL}/notes/all/?fields=id,title,excerpt,size,updated_at,tags&include_total=false`);
         const data = await response.json();
         console.log("API返回文章數據:", data);  // 調試用
         
@@ -324,22 +325,17 @@ document.getElementById('getAllNotes').addEventListener('click', async () => {
                     tagsHtml += '</div>';
                 }
                 
-                // 檢查note.content是否存在
-                const content = note.content || '';
-                
-                // 使用自定義渲染器解析Markdown
-                const parsedContent = marked.parse(content);
-                console.log(`解析文章ID ${note.id} Markdown`);  // 調試用
-                
                 notesHTML += `
                 <div class="mdc-card note-card">
                     <div class="mdc-card__content">
                         <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
                             <span><strong>ID:</strong> ${note.id}</span>
-                            <span><strong>建立時間:</strong> ${note.created_at}</span>
+                            <span><strong>更新時間:</strong> ${note.updated_at || ''}</span>
                         </div>
                         <div style="border-top: 1px solid #eee; padding-top: 10px;">
-                            ${parsedContent}
+                            <h3>${escapeHtml(note.title || '')}</h3>
+                            <p>${escapeHtml(note.excerpt || '')}</p>
+                            <small>${formatFileSize(note.size || 0)}</small>
                         </div>
                         ${tagsHtml}
                     </div>
@@ -558,9 +554,10 @@ function createFileCard(file) {
         ` : '';
 
         fileCard.innerHTML = `
+            ${file.type === 'image' ? createFileThumbnail(file) : `
             <div class="file-icon">
                 <i class="material-icons">${iconName}</i>
-            </div>
+            </div>`}
             <div class="file-info">
                 <div class="file-name" title="${file.original_filename}">${file.original_filename}</div>
                 <div class="file-size">${fileSize}</div>
@@ -588,6 +585,98 @@ function createFileCard(file) {
     }
 }
 
+// 圖片檔案的縮圖：載入縮小後的 WebP/AVIF 而非原圖，載入前先顯示 blurhash 佔位圖
+function createFileThumbnail(file) {
+    const src = `/files/thumbnail/${file.filename}`;
+    const srcset = [160, 320, 640].map(width => `${src}?w=${width} ${width}w`).join(', ');
+    // 有寬高時預留版面，圖片載入後不會跳動
+    const ratio = file.width && file.height ? `aspect-ratio: ${file.width} / ${file.height};` : '';
+    const placeholder = file.blurhash ? blurhashToDataUrl(file.blurhash) : null;
+    const background = placeholder ? `background-image: url(${placeholder});` : '';
+    return `
+        <div class="file-thumbnail" style="${ratio} ${background}">
+            <img src="${src}?w=320" srcset="${srcset}" sizes="240px" loading="lazy" decoding="async"
+                 alt="${escapeHtml(file.original_filename)}" ${file.width ? `width="${file.width}" height="${file.height}"` : ''}
+                 onerror="this.onerror=null;this.src='/files/download/${file.filename}';">
+        </div>
+    `;
+}
+
+// 將 blurhash 解碼成小圖（https://blurha.sh），回傳 data URL
+function blurhashToDataUrl(hash, size = 32) {
+    try {
+        const pixels = decodeBlurhash(hash, size, size);
+        const canvas = document.createElement('canvas');
+        canvas.width = size;
+        canvas.height = size;
+        const context = canvas.getContext('2d');
+        context.putImageData(new ImageData(pixels, size, size), 0, 0);
+        return canvas.toDataURL();
+    } catch (error) {
+        console.warn('blurhash 解碼失敗:', error);
+        return null;
+    }
+}
+
+const BLURHASH_CHARACTERS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+
+function decodeBase83(text) {
+    return [...text].reduce((value, char) => value * 83 + BLURHASH_CHARACTERS.indexOf(char), 0);
+}
+
+function srgbToLinear(value) {
+    const v = value / 255;
+    return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+}
+
+function linearToSrgb(value) {
+    const v = Math.max(0, Math.min(1, value));
+    return Math.round(v <= 0.0031308 ? v * 12.92 * 255 : (1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+}
+
+function decodeBlurhash(hash, width, height) {
+    const sizeFlag = decodeBase83(hash[0]);
+    const componentsX = (sizeFlag % 9) + 1;
+    const componentsY = Math.floor(sizeFlag / 9) + 1;
+    if (hash.length !== 4 + 2 * componentsX * componentsY) {
+        throw new Error('blurhash 長度不正確');
+    }
+    const maximum = (decodeBase83(hash[1]) + 1) / 166;
+
+    const colors = [];
+    const dc = decodeBase83(hash.substring(2, 6));
+    colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+    for (let index = 1; index < componentsX * componentsY; index++) {
+        const value = decodeBase83(hash.substring(4 + index * 2, 6 + index * 2));
+        colors.push([Math.floor(value / 361), Math.floor(value / 19) % 19, value % 19].map(quantised => {
+            const v = (quantised - 9) / 9;
+            return Math.sign(v) * v * v * maximum;
+        }));
+    }
+
+    const pixels = new Uint8ClampedArray(width * height * 4);
+    for (let y = 0; y < height; y++) {
+        for (let x = 0; x < width; x++) {
+            let r = 0, g = 0, b = 0;
+            for (let j = 0; j < componentsY; j++) {
+                for (let i = 0; i < componentsX; i++) {
+                    const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                    const color = colors[i + j * componentsX];
+                    r += color[0] * basis;
+                    g += color[1] * basis;
+                    b += color[2] * basis;
+                }
+            }
+            const offset = 4 * (x + y * width);
+            pixels[offset] = linearToSrgb(r);
+            pixels[offset + 1] = linearToSrgb(g);
+            pixels[offset + 2] = linearToSrgb(b);
+            pixels[offset + 3] = 255;
+        }
+    }
+    return pixels;
+}
+
 // 取得檔案類型對應的 icon
 function getFileIconByType(fileType) {
     console.log('取得檔案圖標，檔案類型:', fileType);
@@ -611,6 +700,13 @@ function getFileIconByType(fileType) {
     return icon;
 }
 
+// 轉義 HTML 特殊字元
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
 // 格式化檔案大小
 function formatFileSize(bytes) {
     if (bytes < 1024) {
@@ -0,0 +1,284 @@
+"""
+上傳檔案（blob）的儲存位置
+
+blob 以「內容 hash + 副檔名」命名，依檔名前綴分層存放，例如
+`uploads/files/ab/cd/abcdef....jpg`：兩層、每層 2 個字元時共有 65536 個資料夾，
+一百萬個檔案平均每個資料夾只有十幾個，查找、新增與備份都不必處理一個巨大的資料夾。
+
+舊版把所有檔案直接放在上傳資料夾（平面配置）。遷移期間兩種配置並存：
+新檔案一律寫入分層位置，讀取時先找分層位置、找不到再找平面位置；
+`migrate` 以 os.replace 逐一搬移，任何時刻檔案都完整存在於其中一個位置，不需要停機，
+中斷後重新執行會從剩下的平面檔案繼續。
+
+`BlobStorage` 定義所有儲存後端共用的介面，`LocalStorage` 是本機檔案系統的實作，
+S3 相容物件儲存的實作在 s3_storage.py。
+
+這個模組只處理檔案系統，不依賴資料庫；方法都是同步的，非同步程式碼以 run_in_threadpool 呼叫。
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+# 上傳中的暫存檔前綴（放在上傳資料夾的最上層，與 blob 位於同一個檔案系統，完成時可以原子性地改名）
+TEMP_PREFIX = ".upload-"
+
+
+def content_disposition(filename: str) -> str:
+    """以附件下載的 Content-Disposition，非 ASCII 檔名以 RFC 5987 編碼"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class BlobStorage:
+    """
+    blob 儲存後端的共用介面
+
+    上傳先寫入本機的暫存檔（`create_temp`），完成後以 `store` 交給後端；
+    讀取時 `locate` 回傳本機可讀取的路徑，後端支援時以 `presigned_url` 讓用戶端直接下載。
+    """
+
+    # 暫存檔所在的本機資料夾
+    temp_dir: Path
+    # locate 等操作是否可能需要網路 I/O（False 時只有本機的檔案系統操作）
+    remote = False
+    # presigned_url 回傳的網址至少還有效的秒數
+    presigned_url_ttl = 0
+
+    def is_valid_name(self, filename: str) -> bool:
+        """只接受一般檔名（不含路徑分隔字元，也不是暫存檔或隱藏檔）"""
+        return bool(filename) and not filename.startswith(".") and "/" not in filename and os.sep not in filename
+
+    def create_temp(self) -> tuple:
+        """
+        建立上傳用的暫存檔
+
+        Returns:
+            (檔案描述符, 暫存檔路徑)
+        """
+        return tempfile.mkstemp(dir=self.temp_dir, prefix=TEMP_PREFIX, suffix=".part")
+
+    def iter_temp_files(self):
+        """
+        列出暫存檔（包含上傳中斷留下的）
+
+        Yields:
+            os.DirEntry
+        """
+        with os.scandir(self.temp_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(TEMP_PREFIX) and entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def store(self, temp_path: str, filename: str):
+        """將寫好的暫存檔存為 blob，暫存檔之後不再存在於原位置"""
+        raise NotImplementedError
+
+    def exists(self, filename: str) -> bool:
+        raise NotImplementedError
+
+    def locate(self, filename: str) -> Path | None:
+        """blob 在本機可讀取的路徑，不存在時回傳 None"""
+        raise NotImplementedError
+
+    def delete(self, filename: str) -> bool:
+        """
+        刪除 blob
+
+        Returns:
+            有檔案被刪除時為 True
+        """
+        raise NotImplementedError
+
+    def list_blobs(self):
+        """
+        列出所有 blob（不含暫存檔）
+
+        Yields:
+            (檔名, 大小, 修改時間)
+        """
+        raise NotImplementedError
+
+    def presigned_url(self, filename: str, download_name: str | None = None,
+                      content_type: str | None = None) -> str | None:
+        """
+        讓用戶端不經過應用程式直接下載 blob 的限時網址，後端不支援時回傳 None
+
+        - **download_name**: 可選，以附件下載時的檔名
+        - **content_type**: 可選，回應的 Content-Type
+        """
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": "local"}
+
+    def close(self):
+        """釋放連線等資源"""
+
+
+class LocalStorage(BlobStorage):
+    """
+    本機檔案系統上的 blob 儲存
+
+    - **root**: 上傳資料夾
+    - **depth**: 分層的資料夾層數
+    - **width**: 每層資料夾名稱取用的檔名字元數
+    """
+
+    def __init__(self, root: str, depth: int = 2, width: int = 2):
+        self.root = Path(root)
+        self.temp_dir = self.root
+        self.depth = depth
+        self.width = width
+        # 是否可能還有平面配置的檔案；第一次需要時檢查，遷移完成後設為 False
+        self._legacy: bool | None = None
+
+    def is_valid_name(self, filename: str) -> bool:
+        return len(filename) > self.depth * self.width and super().is_valid_name(filename)
+
+    def path(self, filename: str) -> Path:
+        """
+        blob 的分層位置（不檢查是否存在）
+
+        Raises:
+            ValueError: 檔名不合法
+        """
+        if not self.is_valid_name(filename):
+            raise ValueError(f"Invalid blob name: {filename}")
+        parts = [filename[level * self.width:(level + 1) * self.width] for level in range(self.depth)]
+        return self.root.joinpath(*parts, filename)
+
+    def _has_legacy(self) -> bool:
+        if self._legacy is None:
+            # 遇到第一個平面配置的檔案就停止，只有分層資料夾時最多讀取數百個項目
+            with os.scandir(self.root) as entries:
+                self._legacy = any(self._is_legacy_entry(entry) for entry in entries)
+        return self._legacy
+
+    @staticmethod
+    def _is_legacy_entry(entry: os.DirEntry) -> bool:
+        return not entry.name.startswith(".") and entry.is_file(follow_symlinks=False)
+
+    def locate(self, filename: str) -> Path | None:
+        """
+        blob 目前的實際位置，不存在時回傳 None
+
+        分層位置找不到時再找平面位置；遷移可能正好在兩次查詢之間搬走檔案，所以最後再確認一次分層位置。
+        """
+        if not self.is_valid_name(filename):
+            return None
+        path = self.path(filename)
+        if path.is_file():
+            return path
+        if not self._has_legacy():
+            return None
+        legacy = self.root / filename
+        if legacy.is_file():
+            return legacy
+        return path if path.is_file() else None
+
+    def exists(self, filename: str) -> bool:
+        return self.locate(filename) is not None
+
+    def store(self, temp_path: str, filename: str) -> Path:
+        """將寫好的暫存檔原子性地放到 blob 的分層位置"""
+        path = self.path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    def delete(self, filename: str) -> bool:
+        """刪除 blob（兩種配置都會嘗試），有檔案被刪除時為 True"""
+        if not self.is_valid_name(filename):
+            return False
+        candidates = [self.path(filename)]
+        if self._has_legacy():
+            # 刪除時遷移可能剛好把檔案從平面位置搬到分層位置
+            candidates += [self.root / filename, self.path(filename)]
+        for path in candidates:
+            try:
+                path.unlink()
+                return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    def iter_files(self):
+        """
+        列出所有 blob 與暫存檔（兩種配置）
+
+        Yields:
+            os.DirEntry
+        """
+        def walk(directory, level):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if level < self.depth and len(entry.name) == self.width:
+                            yield from walk(entry.path, level + 1)
+                    elif level == self.depth or level == 0:
+                        yield entry
+        yield from walk(self.root, 0)
+
+    def list_blobs(self):
+        for entry in self.iter_files():
+            if not entry.name.startswith("."):
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    # 列舉期間被刪除，或被遷移搬到分層位置
+                    continue
+                yield entry.name, stat.st_size, stat.st_mtime
+
+    def migrate(self, batch_size: int = 1000, pause: float = 0.0, limit: int = None, progress=None) -> dict:
+        """
+        將平面配置的檔案搬到分層位置
+
+        可以在應用程式運作時執行；中斷後重新執行會從剩下的檔案繼續。
+
+        - **batch_size**: 每批搬移的檔案數，每批之間暫停 pause 秒以降低對線上服務的 I/O 影響
+        - **limit**: 最多搬移的檔案數（None 表示全部）
+        - **progress**: 可選，每批完成後以累計的結果呼叫
+
+        Returns:
+            - **moved**: 搬移的檔案數
+            - **missing**: 搬移前已被刪除的檔案數
+            - **complete**: 是否已沒有平面配置的檔案（達到 limit 時為 False）
+        """
+        result = {"moved": 0, "missing": 0, "complete": False}
+        created = set()
+        batch = 0
+        # 邊列舉邊搬移時，檔案系統可能略過部分項目，重複掃描到沒有檔案可搬為止
+        while True:
+            found = 0
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if not self._is_legacy_entry(entry):
+                        continue
+                    if limit is not None and result["moved"] + result["missing"] >= limit:
+                        return result
+                    found += 1
+                    target = self.path(entry.name)
+                    if target.parent not in created:
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        created.add(target.parent)
+                    try:
+                        os.replace(entry.path, target)
+                        result["moved"] += 1
+                    except FileNotFoundError:
+                        result["missing"] += 1
+                    batch += 1
+                    if batch >= batch_size:
+                        batch = 0
+                        if progress is not None:
+                            progress(dict(result))
+                        if pause:
+                            time.sleep(pause)
+            if not found:
+                break
+        self._legacy = False
+        result["complete"] = True
+        return result
@@ -0,0 +1,298 @@
+"""
+標籤自動完成索引
+
+編輯器每按一個鍵就查詢一次標籤，因此查詢完全在記憶體中完成，不碰資料庫：
+
+- 前綴比對：每個標籤產生數個比對鍵（正規化後的名稱、名稱中每個詞的開頭、
+  拼音全拼、拼音首字母、注音），放在排序好的陣列中以 bisect 找出前綴範圍
+- 模糊比對：前綴結果不足時，以二元字組（bigram）的倒排索引找出包含查詢字串
+  或只差一個字的標籤
+- 排序：依使用次數（note_count）由多到少，再依名稱長度與名稱
+
+前綴範圍很大時（例如只輸入一個字母），每次重新排序整個範圍太慢，
+所以把排名最前的標籤快取起來，使用次數變動時就地更新。
+
+拼音與注音需要安裝 pypinyin，未安裝時只提供名稱比對。
+"""
+import bisect
+import heapq
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+# 前綴範圍超過此數量時使用排名快取
+SCAN_LIMIT = 256
+# 每個前綴快取的標籤數，也是單次查詢的上限
+TOP_CACHE_SIZE = 64
+# 模糊比對每個倒排清單最多讀取的數量與最多驗證的候選標籤數，確保最差情況的延遲有上限
+FUZZY_SCAN_LIMIT = 2000
+FUZZY_CANDIDATE_LIMIT = 200
+# 查詢至少有這麼多字組才容許打錯字
+FUZZY_MIN_GRAMS = 4
+
+_WORD_SEPARATORS = " -_/.#:"
+_ZHUYIN_TONES = str.maketrans("", "", "ˊˇˋ˙")
+_KEY_END = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    """全形轉半形、不分大小寫"""
+    return unicodedata.normalize("NFKC", text).casefold().strip()
+
+
+def _is_han(char: str) -> bool:
+    return "㐀" <= char <= "鿿" or "豈" <= char <= "﫿"
+
+
+@lru_cache(maxsize=None)
+def _pypinyin():
+    """
+    延遲載入 pypinyin：它的字典約佔 50 MB，沒有中文標籤時不必載入
+
+    Returns:
+        pypinyin 模組，未安裝時為 None（只提供名稱比對）
+    """
+    try:
+        import pypinyin
+    except ImportError:
+        return None
+    return pypinyin
+
+
+@lru_cache(maxsize=None)
+def _char_readings(char: str) -> tuple:
+    """
+    單一漢字的（全拼, 首字母, 注音），不含聲調
+
+    以字為單位快取，十萬個標籤也只需轉換幾千個不同的字；
+    代價是破音字一律取最常見的讀音，不依詞組判斷。
+    """
+    pypinyin = _pypinyin()
+    full = pypinyin.lazy_pinyin(char)[0]
+    zhuyin = pypinyin.lazy_pinyin(char, style=pypinyin.Style.BOPOMOFO)[0].translate(_ZHUYIN_TONES)
+    return full, full[:1], zhuyin
+
+
+def search_keys(name: str) -> set:
+    """
+    標籤名稱的所有前綴比對鍵
+
+    例如 "工作 日記" 會產生 "工作 日記"、"日記"、"gongzuoriji"、"gzrj"、"ㄍㄨㄥㄗㄨㄛㄖㄐㄧ"，
+    輸入任何一個鍵的前綴都能找到這個標籤。
+    """
+    text = normalize(name)
+    keys = {text}
+    for index, char in enumerate(text):
+        if char in _WORD_SEPARATORS and text[index + 1:]:
+            keys.add(text[index + 1:].lstrip(_WORD_SEPARATORS))
+    if any(_is_han(char) for char in text) and _pypinyin() is not None:
+        compact = "".join(char for char in text if char not in _WORD_SEPARATORS)
+        readings = [_char_readings(char) if _is_han(char) else (char, char, char) for char in compact]
+        for position in range(3):
+            keys.add("".join(reading[position] for reading in readings))
+    keys.discard("")
+    return keys
+
+
+def query_variants(query: str) -> list:
+    """查詢字串的比對形式：原樣，以及去掉空白與注音聲調後的形式（對應拼音／注音鍵）"""
+    text = normalize(query)
+    compact = "".join(char for char in text if char not in _WORD_SEPARATORS).translate(_ZHUYIN_TONES)
+    return [text] if compact == text else [text, compact]
+
+
+def grams(text: str) -> set:
+    """模糊比對用的字組：二元字組，漢字另外以單字索引（中文常只輸入一個字）"""
+    result = {text[index:index + 2] for index in range(len(text) - 1)}
+    result.update(char for char in text if _is_han(char))
+    if len(text) == 1:
+        result.add(text)
+    return result
+
+
+class TagSearchIndex:
+    """
+    標籤的前綴／模糊搜尋索引
+
+    只在事件迴圈中使用，不需要加鎖。所有變動都透過 `add`、`remove`、`rename`、
+    `adjust_counts`，由標籤與文章的寫入路徑呼叫。
+    """
+
+    def __init__(self):
+        self.names: dict = {}
+        self.counts: dict = {}
+        self._normalized: dict = {}
+        self._tag_keys: dict = {}
+        # 排序的比對鍵與對應的標籤 ID（平行陣列）
+        self._keys: list = []
+        self._ids: list = []
+        self._grams: dict = {}
+        # 前綴 → 依排名排序的標籤 ID（只保存範圍超過 SCAN_LIMIT 的前綴）
+        self._top: dict = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _rank(self, tag_id: int) -> tuple:
+        name = self.names[tag_id]
+        return -self.counts[tag_id], len(name), name
+
+    def build(self, rows):
+        """以 (id, name, note_count) 重建整個索引"""
+        self.__init__()
+        pairs = []
+        for tag_id, name, count in rows:
+            self._register(tag_id, name, count)
+            pairs.extend((key, tag_id) for key in self._tag_keys[tag_id])
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._ids = [tag_id for _, tag_id in pairs]
+
+    def _register(self, tag_id: int, name: str, count: int):
+        self.names[tag_id] = name
+        self.counts[tag_id] = count
+        normalized = normalize(name)
+        # 多數名稱正規化後不變，共用同一個字串
+        self._normalized[tag_id] = name if normalized == name else normalized
+        self._tag_keys[tag_id] = tuple(search_keys(name))
+        for gram in grams(self._normalized[tag_id]):
+            self._grams.setdefault(gram, []).append(tag_id)
+
+    def add(self, tag_id: int, name: str, count: int = 0):
+        if tag_id in self.names:
+            return
+        self._register(tag_id, name, count)
+        for key in self._tag_keys[tag_id]:
+            index = bisect.bisect_right(self._keys, key)
+            self._keys.insert(index, key)
+            self._ids.insert(index, tag_id)
+        self._update_top(tag_id, increased=True)
+
+    def remove(self, tag_id: int):
+        if tag_id not in self.names:
+            return
+        self._discard_from_top(tag_id)
+        for key in self._tag_keys.pop(tag_id):
+            start = bisect.bisect_left(self._keys, key)
+            end = bisect.bisect_right(self._keys, key, start)
+            index = self._ids.index(tag_id, start, end)
+            del self._keys[index]
+            del self._ids[index]
+        for gram in grams(self._normalized.pop(tag_id)):
+            posting = self._grams[gram]
+            posting.remove(tag_id)
+            if not posting:
+                del self._grams[gram]
+        del self.names[tag_id]
+        del self.counts[tag_id]
+
+    def rename(self, tag_id: int, name: str):
+        count = self.counts.get(tag_id, 0)
+        self.remove(tag_id)
+        self.add(tag_id, name, count)
+
+    def adjust_counts(self, deltas: dict):
+        """依 {標籤 ID: 增減數} 更新使用次數"""
+        for tag_id, delta in deltas.items():
+            if delta == 0 or tag_id not in self.counts:
+                continue
+            self.counts[tag_id] += delta
+            if delta > 0:
+                self._update_top(tag_id, increased=True)
+            else:
+                self._discard_from_top(tag_id)
+                self._update_top(tag_id, increased=False)
+
+    def _cached_prefixes(self, tag_id: int) -> set:
+        return {key[:length] for key in self._tag_keys[tag_id] for length in range(len(key) + 1)
+                if key[:length] in self._top}
+
+    def _update_top(self, tag_id: int, increased: bool):
+        """
+        排名上升的標籤放進前綴快取
+
+        快取的清單永遠是該前綴真正的前 N 名：清單外的標籤排名都在最後一名之後，
+        所以只要新的排名勝過最後一名，就能確定它屬於清單。
+        """
+        rank = self._rank(tag_id)
+        for prefix in self._cached_prefixes(tag_id):
+            top = self._top[prefix]
+            if tag_id in top:
+                if increased:
+                    top.sort(key=self._rank)
+                continue
+            if top and rank < self._rank(top[-1]):
+                bisect.insort(top, tag_id, key=self._rank)
+                del top[TOP_CACHE_SIZE:]
+
+    def _discard_from_top(self, tag_id: int):
+        """排名下降或刪除的標籤移出前綴快取，清單變短時下次查詢重新計算"""
+        for prefix in self._cached_prefixes(tag_id):
+            top = self._top[prefix]
+            if tag_id in top:
+                top.remove(tag_id)
+
+    def _prefix_matches(self, prefix: str, limit: int) -> list:
+        start = bisect.bisect_left(self._keys, prefix)
+        end = bisect.bisect_left(self._keys, prefix + _KEY_END, start)
+        if end - start <= SCAN_LIMIT:
+            return heapq.nsmallest(limit, set(self._ids[start:end]), key=self._rank)
+        top = self._top.get(prefix)
+        if top is None or len(top) < limit:
+            top = heapq.nsmallest(TOP_CACHE_SIZE, set(self._ids[start:end]), key=self._rank)
+            self._top[prefix] = top
+        return top[:limit]
+
+    def _fuzzy_matches(self, text: str, exclude: set, limit: int) -> list:
+        """
+        包含查詢字串，或與查詢字串的字組大多相同（容許一個字元打錯）的標籤
+
+        查詢有 n 個字組、最多容許缺少 misses 個時，符合的標籤在最短的 misses + 2 個倒排清單中
+        至少出現兩次（只有一個清單時出現一次），先以 Counter 在 C 層計數篩選，再逐一驗證。
+        """
+        query_grams = grams(text)
+        if not query_grams or (len(text) == 1 and not _is_han(text)):
+            return []
+        # 一個字打錯最多影響兩個字組；太短的查詢只比對子字串，否則幾乎什麼都符合
+        misses = 2 if len(query_grams) >= FUZZY_MIN_GRAMS else 0
+        need = len(query_grams) - misses
+        postings = sorted((self._grams.get(gram, ()) for gram in query_grams), key=len)
+        selected = postings[:misses + 2]
+        hits = Counter()
+        for posting in selected:
+            hits.update(posting[:FUZZY_SCAN_LIMIT])
+        required = len(selected) - misses
+        candidates = [tag_id for tag_id, count in hits.items() if count >= required and tag_id not in exclude]
+
+        scored = []
+        for tag_id in candidates[:FUZZY_CANDIDATE_LIMIT]:
+            normalized = self._normalized[tag_id]
+            if text in normalized:
+                scored.append(((0, 0) + self._rank(tag_id), tag_id))
+                continue
+            if not misses:
+                continue
+            shared = sum(gram in normalized for gram in query_grams)
+            if shared >= need:
+                scored.append(((1, -shared) + self._rank(tag_id), tag_id))
+        return [tag_id for _, tag_id in heapq.nsmallest(limit, scored)]
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """
+        自動完成查詢
+
+        - **query**: 使用者輸入的字串，可以是名稱、拼音、拼音首字母或注音的前綴
+        - **limit**: 回傳數量，最多 TOP_CACHE_SIZE
+
+        Returns:
+            標籤 ID 列表：先是前綴符合的標籤（依使用次數），不足時補上模糊比對的結果
+        """
+        limit = max(1, min(limit, TOP_CACHE_SIZE))
+        variants = query_variants(query)
+        results = self._prefix_matches(variants[0], limit)
+        if len(variants) > 1:
+            results = heapq.nsmallest(limit, set(results) | set(self._prefix_matches(variants[1], limit)),
+                                      key=self._rank)
+        if len(results) < limit and variants[0]:
+            results = results + self._fuzzy_matches(variants[0], set(results), limit - len(results))
+        return results
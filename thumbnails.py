@@ -0,0 +1,344 @@
+"""
+圖片縮圖（衍生檔）
+
+上傳圖片後在背景的行程池中產生每個 `THUMBNAIL_WIDTHS` × `THUMBNAIL_FORMATS` 的縮圖，
+並把原圖寬高與 blurhash 佔位圖記錄在 blobs 資料表；上傳請求不必等待，編碼也不佔用事件迴圈。
+
+上傳後的處理是 jobs 佇列中的 image_derivatives 工作，重新啟動後也會完成。
+
+縮圖以原圖的內容 hash 命名（`<hash>_<寬度>.<格式>`），和原圖一樣內容永遠不變。
+縮圖資料夾是可以隨時重建的快取：`GET /files/thumbnail/{filename}?w=` 找不到縮圖時當場產生，
+資料夾超過 `DERIVATIVE_CACHE_MAX_BYTES` 時刪除最久未使用的縮圖。
+
+imaging（Pillow）在第一次需要時才匯入，不拖慢應用程式的啟動；編碼在行程池的子行程中進行。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from common import Config, Database, blob_storage, get_db_connection
+from jobs import PermanentJobError, job_handler
+
+logger = logging.getLogger(__name__)
+
+# 讀取縮圖時，修改時間超過此秒數才更新為現在（作為最近使用時間，減少磁碟寫入）
+TOUCH_INTERVAL = 3600
+# 超過上限時刪除到上限的這個比例，避免每產生一張縮圖就掃描一次資料夾
+EVICT_TARGET_RATIO = 0.9
+
+_executor: ProcessPoolExecutor | None = None
+_in_flight: dict = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """
+    延遲建立行程池
+
+    使用 spawn：子行程是全新的直譯器，不會以 fork 複製事件迴圈與資料庫連線的執行緒。
+    子行程以較低的優先權執行，編碼不會拖慢同一台機器上的請求處理。
+    """
+    global _executor
+    if _executor is None:
+        import imaging
+        _executor = ProcessPoolExecutor(max_workers=Config.THUMBNAIL_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=imaging.lower_priority)
+    return _executor
+
+
+async def _run(func, *args):
+    global _executor
+    executor = _get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # 子行程異常結束（例如解碼時當掉）後行程池無法再使用，下次呼叫時重新建立
+        if _executor is executor:
+            _executor = None
+        raise
+
+
+def shutdown():
+    """關閉行程池（應用程式關閉時呼叫），尚未開始的工作直接取消"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def is_thumbnailable(filename: str) -> bool:
+    return Path(filename).suffix.lower()[1:] in Config.ALLOWED_EXTENSIONS["image"]
+
+
+def derivative_path(filename: str, width: int, fmt: str) -> Path:
+    return Path(Config.DERIVATIVE_FOLDER) / f"{Path(filename).stem}_{width}.{fmt}"
+
+
+def choose_width(requested: int) -> int:
+    """
+    對應到不小於 requested 的最小預設寬度
+
+    只產生固定幾種寬度，任意的 ?w= 不會讓快取無限增長。
+    """
+    widths = sorted(Config.THUMBNAIL_WIDTHS)
+    return next((width for width in widths if width >= requested), widths[-1])
+
+
+def thumbnail_formats() -> list:
+    """
+    可產生的縮圖格式（偏好順序）
+
+    安裝的 Pillow 不支援 THUMBNAIL_FORMATS 中的任何格式時，改用 THUMBNAIL_FALLBACK_FORMATS 中第一個支援的格式；
+    都不支援時為空列表
+    """
+    import imaging
+    supported = imaging.supported_formats()
+    formats = [fmt for fmt in Config.THUMBNAIL_FORMATS if fmt in supported]
+    if not formats:
+        formats = [fmt for fmt in Config.THUMBNAIL_FALLBACK_FORMATS if fmt in supported][:1]
+    return formats
+
+
+def choose_format(accept: str, requested: str | None = None) -> str | None:
+    """
+    依 Accept 標頭選擇縮圖格式（THUMBNAIL_FORMATS 為偏好順序）
+
+    Returns:
+        格式名稱；沒有任何可產生的格式時為 None
+
+    Raises:
+        ValueError: 指定的格式不支援
+    """
+    available = thumbnail_formats()
+    if requested is not None:
+        if requested not in available:
+            raise ValueError(f"Unsupported thumbnail format: {requested}")
+        return requested
+    if not available:
+        return None
+    # 只接受 */* 的客戶端沒有宣告支援 AVIF，使用最普遍的 WebP
+    default = "webp" if "webp" in available else available[-1]
+    return next((fmt for fmt in available if f"image/{fmt}" in accept), default)
+
+
+class DerivativeCache:
+    """
+    縮圖資料夾的大小統計與逐出
+
+    第一次需要時掃描資料夾取得總大小，之後依新產生的檔案累加；
+    超過上限時依修改時間（最近使用時間）由舊到新刪除。只在事件迴圈中更新統計。
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        self.evicted = 0
+        self._evicting = False
+
+    def _scan(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.is_file())
+
+    def _evict(self, total: int) -> tuple:
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        return total, removed
+
+    async def add(self, size: int):
+        """記錄新產生的縮圖大小，超過上限時在執行緒池中逐出"""
+        if self.total_bytes is None:
+            self.total_bytes = await run_in_threadpool(self._scan)
+        else:
+            self.total_bytes += size
+        if self.total_bytes > self.max_bytes and not self._evicting:
+            self._evicting = True
+            try:
+                before = self.total_bytes
+                total, removed = await run_in_threadpool(self._evict, before)
+                # 逐出期間新增的大小也要算進去
+                self.total_bytes = total + (self.total_bytes - before)
+                self.evicted += removed
+                logger.info("縮圖快取超過上限，已刪除 %s 個最久未使用的縮圖", removed)
+            finally:
+                self._evicting = False
+
+    def discard(self, size: int):
+        if self.total_bytes is not None:
+            self.total_bytes = max(0, self.total_bytes - size)
+
+    def stats(self) -> dict:
+        return {
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evicted": self.evicted,
+            "in_flight": len(_in_flight),
+        }
+
+
+derivative_cache = DerivativeCache(Config.DERIVATIVE_FOLDER, Config.DERIVATIVE_CACHE_MAX_BYTES)
+
+
+def _touch(path: Path) -> bool:
+    """縮圖存在時更新最近使用時間並回傳 True"""
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return False
+    if time.time() - mtime > TOUCH_INTERVAL:
+        os.utime(path)
+    return True
+
+
+async def _render(filename: str, variants: list) -> dict | None:
+    """從原圖產生縮圖，原圖不存在時回傳 None"""
+    source = await run_in_threadpool(blob_storage.locate, filename)
+    if source is None:
+        return None
+    import imaging
+    sizes = await _run(imaging.render_variants, str(source), variants)
+    await derivative_cache.add(sum(sizes.values()))
+    return sizes
+
+
+async def ensure_thumbnail(filename: str, width: int, fmt: str) -> Path | None:
+    """
+    取得縮圖路徑，不存在時在行程池中產生；原圖不存在時回傳 None
+
+    縮圖已存在時不必取得原圖（S3 後端不需要下載原圖）。
+    同一張縮圖同時有多個請求時只產生一次，其他請求等待同一個結果。
+    """
+    target = derivative_path(filename, width, fmt)
+    if await run_in_threadpool(_touch, target):
+        return target
+
+    future = _in_flight.get(target)
+    if future is None:
+        future = asyncio.ensure_future(_render(filename, [(width, fmt, str(target))]))
+        _in_flight[target] = future
+        future.add_done_callback(lambda _: _in_flight.pop(target, None))
+    # 某個請求中斷時不取消其他請求也在等待的工作
+    if await asyncio.shield(future) is None:
+        return None
+    return target
+
+
+def _default_variants(filename: str) -> list:
+    return [(width, fmt, str(derivative_path(filename, width, fmt)))
+            for width in Config.THUMBNAIL_WIDTHS for fmt in thumbnail_formats()]
+
+
+@job_handler("image_derivatives", on_upload=is_thumbnailable)
+async def generate_derivatives(db: Database, payload: dict) -> dict | None:
+    """
+    背景工作：產生新上傳圖片的所有預設縮圖，並記錄原圖寬高與 blurhash
+
+    - **payload**: {"filename": 原圖檔名}
+    """
+    filename = payload["filename"]
+    source = await run_in_threadpool(blob_storage.locate, filename)
+    # 工作執行前原圖可能已被刪除回收
+    if source is None:
+        return None
+    variants = _default_variants(filename)
+    if not variants:
+        logger.warning("安裝的 Pillow 不支援任何縮圖格式，略過產生縮圖: %s", filename)
+        return None
+    import imaging
+    start = time.perf_counter()
+    try:
+        result = await _run(imaging.generate_derivatives, str(source), variants)
+    except imaging.UNREADABLE_ERRORS as e:
+        raise PermanentJobError(f"無法解碼圖片: {str(e)}")
+    await derivative_cache.add(sum(result["sizes"].values()))
+    # 產生期間原圖可能已被刪除回收
+    if not await run_in_threadpool(blob_storage.exists, filename):
+        await remove_derivatives(filename)
+        return None
+
+    async with db.writer() as conn:
+        await conn.execute("UPDATE blobs SET width = ?, height = ?, blurhash = ? WHERE filename = ?",
+                           (result["width"], result["height"], result["blurhash"], filename))
+    elapsed = time.perf_counter() - start
+    logger.info("已產生 %s 個縮圖: %s (%.2fs)", len(result['sizes']), filename, elapsed)
+    return {"width": result["width"], "height": result["height"], "derivatives": len(result["sizes"])}
+
+
+def _remove_derivatives(filename: str) -> int:
+    removed = 0
+    for path in Path(Config.DERIVATIVE_FOLDER).glob(f"{Path(filename).stem}_*"):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += size
+    return removed
+
+
+async def remove_derivatives(filename: str):
+    """原圖被回收時一併刪除它的縮圖"""
+    derivative_cache.discard(await run_in_threadpool(_remove_derivatives, filename))
+
+
+def backfill_image_metadata(batch_size: int = 50) -> int:
+    """
+    為尚未計算寬高與 blurhash 的圖片產生縮圖與中繼資料（供維護指令使用）
+
+    Returns:
+        處理的圖片數量
+    """
+    import imaging
+    if not thumbnail_formats():
+        logger.warning("安裝的 Pillow 不支援任何縮圖格式，略過產生縮圖")
+        return 0
+    conn = get_db_connection()
+    processed = 0
+    try:
+        rows = [row[0] for row in conn.execute("SELECT filename FROM blobs WHERE blurhash IS NULL")
+                if is_thumbnailable(row[0])]
+        with ProcessPoolExecutor(max_workers=Config.THUMBNAIL_WORKERS,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                jobs = {}
+                for filename in batch:
+                    source = blob_storage.locate(filename)
+                    if source is None:
+                        continue
+                    jobs[filename] = executor.submit(imaging.generate_derivatives, str(source),
+                                                     _default_variants(filename))
+                for filename, job in jobs.items():
+                    try:
+                        result = job.result()
+                    except Exception as e:
+                        logger.warning("產生縮圖失敗: %s: %s", filename, e)
+                        continue
+                    conn.execute("UPDATE blobs SET width = ?, height = ?, blurhash = ? WHERE filename = ?",
+                                 (result["width"], result["height"], result["blurhash"], filename))
+                    processed += 1
+                conn.commit()
+    finally:
+        conn.close()
+    return processed